@@ -1,29 +1,97 @@
-import json
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
 
-from openai import OpenAI
-from typing import List, Dict, Any
+from openai import OpenAI, RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+
+from embedding_cache import EmbeddingCache, default_embedding_cache
+from rate_limiter import TokenBucket
+
+# 限流或服务端暂时不可用时重试的错误
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
 
 # Qwen 嵌入自定义包装器
 class QwenEmbeddings:
-    def __init__(self, apiKey, baseUrl):
+    def __init__(self, apiKey, baseUrl, model: str = "text-embedding-v1", cache: EmbeddingCache = None,
+                 batch_size: int = 25, max_concurrency: int = 4, requests_per_second: float = 10,
+                 max_retries: int = 5):
         self.client = OpenAI(
             api_key=apiKey,  # 如果您没有配置环境变量，请在此处用您的API Key进行替换
             base_url=baseUrl,  # 阿里云百炼服务的base_url
         )
+        self.model = model
+        # 模型 + 规范化文本 -> 向量；重复的问题不再请求远端
+        self.cache = cache if cache is not None else default_embedding_cache()
+        # 批量嵌入：每个请求最多 batch_size 条（text-embedding-v1 上限25），并发请求共用一个令牌桶
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.last_batch_stats: Optional[Dict[str, Any]] = None
+        self._retries = 0
 
     def _get_embedding(self, text: str) -> List[float]:
+        embedding = self.cache.get(self.model, text)
+        if embedding is not None:
+            return embedding
         completion = self.client.embeddings.create(
-            model="text-embedding-v1",
+            model=self.model,
             input=text,
             encoding_format="float"
         )
-        jsonstr = completion.model_dump_json()
-        # 将c_vectors字符串转为json对象
-        embedding_data = json.loads(jsonstr)
-        return embedding_data["data"][0]["embedding"]
+        # 直接读取类型化的响应对象，不再序列化成JSON再解析
+        embedding = completion.data[0].embedding
+        self.cache.put(self.model, text, embedding)
+        return embedding
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """一次请求嵌入多条文本，限流类错误按指数退避重试"""
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                completion = self.client.embeddings.create(
+                    model=self.model,
+                    input=texts,
+                    encoding_format="float"
+                )
+                # 按 index 还原输入顺序
+                return [item.embedding for item in sorted(completion.data, key=lambda item: item.index)]
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                delay = min(30.0, 0.5 * 2 ** (attempt - 1)) * (0.5 + random.random())
+                print(f"[嵌入] 批次请求被限流或失败（{type(e).__name__}），{delay:.1f}秒后第{attempt}次重试",
+                      file=sys.stderr)
+                self._retries += 1
+                time.sleep(delay)
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        return [self._get_embedding(text) for text in texts]
+        """
+        批量并发嵌入文档，返回顺序与 texts 一致
+        文档块很少重复，且会挤掉查询缓存，因此这里不经过嵌入缓存
+        """
+        start = time.time()
+        self._retries = 0
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            results = list(pool.map(self._embed_batch, batches))
+        embeddings = [embedding for batch in results for embedding in batch]
+
+        elapsed = time.time() - start
+        self.last_batch_stats = {
+            "chunks": len(texts),
+            "batches": len(batches),
+            "retries": self._retries,
+            "seconds": round(elapsed, 3),
+            "chunks_per_second": round(len(texts) / elapsed, 2) if elapsed > 0 else None,
+        }
+        print(f"[嵌入] {len(texts)} 个文本块，{len(batches)} 个批次，耗时 {elapsed:.2f}秒，"
+              f"{self.last_batch_stats['chunks_per_second']} 块/秒", file=sys.stderr)
+        return embeddings
 
     def embed_query(self, text: str) -> List[float]:
-        return self._get_embedding(text)
\ No newline at end of file
+        return self._get_embedding(text)
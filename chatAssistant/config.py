@@ -2,4 +2,21 @@ config = {
     "model": "qwen-omni-turbo",  # 模型名称
     "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1",  # 模型url地址
     "port": 8000,  # 服务启动端口
+    # 检索文档注入提示词的token预算（按意图），不含对话历史
+    "context_token_budget": {
+        "default": 1500,
+        "knowledge_base": 2000,
+    },
+    # MCP结果缓存：只有在这里声明的幂等工具/资源才会被缓存，ttl单位为秒
+    "mcp_cache": {
+        "max_bytes": 16 * 1024 * 1024,
+        "tools": {
+            "weather.query_weather": {"ttl": 600},
+            "financial.get_resource_summary": {"ttl": 60},
+        },
+        "resources": {
+            "financial://database/schema": {"ttl": 300},
+            "financial://reports/summary": {"ttl": 60},
+        },
+    },
 }
@@ -0,0 +1,108 @@
+"""
+文档分块（不依赖 langchain）
+
+按 段落 -> 行 -> 句（。！？；）-> 分句（，、：）-> 空白 -> 硬切 的优先级递归切分，
+只在字符偏移上操作，不为每个片段创建对象；相邻块保留不超过 chunk_overlap 的整句重叠。
+split_source_file 只依赖标准库，可直接提交到进程池按文件并行分块。
+"""
+import hashlib
+import re
+from typing import Any, Dict, List, Tuple
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# 切点位于分隔符之后，标点和后面紧跟的右引号/右括号留在前一段
+_SEPARATORS = [
+    re.compile(r"\n[ \t]*\n+"),
+    re.compile(r"\n"),
+    re.compile(r"[。！？；!?;]+[”’」』）)\"']*"),
+    re.compile(r"[，、：,:]"),
+    re.compile(r"\s+"),
+]
+
+
+def _pieces(text: str, start: int, end: int, level: int, limit: int, out: List[Tuple[int, int]]):
+    """把 [start, end) 切成首尾相接、长度都不超过 limit 的片段，优先在高层级分隔符处切"""
+    if end - start <= limit:
+        out.append((start, end))
+        return
+    if level == len(_SEPARATORS):
+        for cut in range(start, end, limit):
+            out.append((cut, min(cut + limit, end)))
+        return
+    cuts = [m.end() for m in _SEPARATORS[level].finditer(text, start, end) if start < m.end() < end]
+    previous = start
+    for cut in cuts + [end]:
+        _pieces(text, previous, cut, level + 1, limit, out)
+        previous = cut
+
+
+def split_spans(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[Tuple[int, int]]:
+    """返回各块在 text 中的 (start, end) 偏移，已去掉首尾空白"""
+    pieces: List[Tuple[int, int]] = []
+    _pieces(text, 0, len(text), 0, chunk_size, pieces)
+    spans = []
+    first = 0
+    for j, (_, end) in enumerate(pieces):
+        if j > first and end - pieces[first][0] > chunk_size:
+            spans.append((pieces[first][0], pieces[j - 1][1]))
+            # 从上一块末尾往回保留若干完整片段作为重叠，且保证窗口向前推进
+            start, first = first, j
+            while (first - 1 > start and pieces[j - 1][1] - pieces[first - 1][0] <= chunk_overlap
+                   and end - pieces[first - 1][0] <= chunk_size):
+                first -= 1
+    if pieces:
+        spans.append((pieces[first][0], pieces[-1][1]))
+
+    stripped = []
+    for start, end in spans:
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start >= end or (stripped and end <= stripped[-1][1]):
+            # 去掉空白后只剩与上一块重叠的部分，不单独输出
+            continue
+        if stripped and start <= stripped[-1][0]:
+            # 上一块的开头只是空白片段，去掉后被本块完全包含
+            stripped.pop()
+        stripped.append((start, end))
+    return stripped
+
+
+def split_text(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[str]:
+    return [text[start:end] for start, end in split_spans(text, chunk_size, chunk_overlap)]
+
+
+def split_source_file(file_path: str, chunk_size: int = CHUNK_SIZE,
+                      chunk_overlap: int = CHUNK_OVERLAP) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    读取 UTF-8 文本文件并分块，返回 (文件内容sha256, 块列表)
+    chunk_id 由来源、块内容哈希和同内容出现次序决定，与块的位置无关：
+    文件前部插入内容后，未改动的块 id 不变，不需要重新嵌入
+    """
+    with open(file_path, "rb") as f:
+        raw = f.read()
+    sha256 = hashlib.sha256(raw).hexdigest()
+    text = raw.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+    chunks = []
+    occurrences: Dict[str, int] = {}
+    for i, (start, end) in enumerate(split_spans(text, chunk_size, chunk_overlap)):
+        content = text[start:end]
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        occurrence = occurrences.get(content_hash, 0)
+        occurrences[content_hash] = occurrence + 1
+        chunks.append({
+            "chunk_id": hashlib.sha1(f"{file_path}\0{content_hash}\0{occurrence}".encode("utf-8")).hexdigest(),
+            "content": content,
+            "metadata": {
+                "source": file_path,
+                "page": 0,
+                "chunk": i,
+                "start": start,
+                "end": end
+            }
+        })
+    return sha256, chunks
@@ -0,0 +1,115 @@
+"""
+查询嵌入的两级缓存
+
+- 一级: 进程内LRU
+- 二级: SQLite（float32向量BLOB），跨进程、跨重启共享
+键为 sha256(模型名 + 规范化文本)；规范化只做 NFKC、合并空白和去除首尾空白，不改变语义。
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import unicodedata
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".embedding_cache", "embeddings.db")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """内存LRU在前、SQLite在后；path 为 None 时只使用内存"""
+
+    def __init__(self, path: Optional[str] = DEFAULT_CACHE_PATH, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self.conn = None
+        if path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self.conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+                self.conn.execute("PRAGMA journal_mode=WAL")
+                self.conn.execute(
+                    "create table if not exists embeddings (key text primary key, model text, dim integer, vector blob)"
+                )
+                self.conn.commit()
+            except sqlite3.Error as e:
+                print(f"[嵌入缓存] 磁盘缓存不可用，仅使用内存缓存: {e}", file=sys.stderr)
+                self.conn = None
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = cache_key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return vector
+            row = None
+            if self.conn is not None:
+                try:
+                    row = self.conn.execute("select vector from embeddings where key = ?", (key,)).fetchone()
+                except sqlite3.Error as e:
+                    print(f"[嵌入缓存] 读取失败: {e}", file=sys.stderr)
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            vector = np.frombuffer(row[0], dtype="<f4").tolist()
+            self.stats["disk_hits"] += 1
+            self._remember(key, vector)
+            return vector
+
+    def put(self, model: str, text: str, vector: List[float]):
+        key = cache_key(model, text)
+        with self._lock:
+            self._remember(key, vector)
+            if self.conn is not None:
+                try:
+                    self.conn.execute(
+                        "insert or replace into embeddings values (?, ?, ?, ?)",
+                        (key, model, len(vector), np.asarray(vector, dtype="<f4").tobytes())
+                    )
+                    self.conn.commit()
+                except sqlite3.Error as e:
+                    print(f"[嵌入缓存] 写入失败: {e}", file=sys.stderr)
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats, memory_entries=len(self._memory))
+
+
+_default_cache: Optional[EmbeddingCache] = None
+_default_lock = Lock()
+
+
+def default_embedding_cache() -> EmbeddingCache:
+    """进程内共享的缓存实例，路径和容量可通过 EMBEDDING_CACHE_PATH / EMBEDDING_CACHE_SIZE 配置"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache(
+                path=os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH) or None,
+                max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+            )
+        return _default_cache
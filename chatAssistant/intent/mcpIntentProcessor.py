@@ -28,21 +28,10 @@ class MCPIntentProcessor:
     def _preconnect_servers(self):
         """预连接MCP服务器，提高响应速度"""
         try:
-            import threading
-            
-            def connect_weather():
-                try:
-                    print("[MCP预连接] 正在连接天气服务器...")
-                    if mcp_manager.connect_server("weather"):
-                        print("[MCP预连接] 天气服务器连接成功")
-                    else:
-                        print("[MCP预连接] 天气服务器连接失败")
-                except Exception as e:
-                    print(f"[MCP预连接] 天气服务器连接出错: {str(e)}")
-            
-            # 在后台线程中连接，避免阻塞初始化
-            threading.Thread(target=connect_weather, daemon=True).start()
-            
+            # 连接在管理器的事件循环中进行，不阻塞初始化；
+            # 首个请求会等待这次连接就绪，而不是与之竞争另起连接
+            print("[MCP预连接] 正在连接天气服务器...")
+            mcp_manager.preconnect("weather")
         except Exception as e:
             print(f"[MCP预连接] 预连接服务器时出错: {str(e)}")
     
@@ -152,15 +141,17 @@ class MCPIntentProcessor:
                                      top_k: int) -> Any:
         """处理知识库查询意图 - 使用传统RAG方法"""
         try:
-            from qwenRagQuery import retrieve_documents, build_context
+            from qwenRagQuery import retrieve_scored_documents, build_context
             from intent.processIntent import HandleAnswer
             
             # 检索文档
-            docs = retrieve_documents(question, top_k)
+            docs = retrieve_scored_documents(question, top_k)
             logger.info(f"检索到 {len(docs)} 个相关文档")
             
-            # 构建上下文
-            prompt = build_context(docs, conversation_history)
+            # 构建上下文，按知识库意图的token预算装填
+            trace = {}
+            prompt = build_context(docs, conversation_history, "knowledge_base", trace)
+            logger.info(f"上下文预算: {trace['context_budget']}")
             
             # 生成答案
             handle_answer = HandleAnswer()
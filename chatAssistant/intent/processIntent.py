@@ -1,4 +1,4 @@
-from qwenRagQuery import retrieve_documents,build_context
+from qwenRagQuery import retrieve_scored_documents,build_context
 from API.weatherService import WeatherService
 import time
 from typing import Dict
@@ -64,9 +64,11 @@ class ProcessIntent:
             """
             if intent_result["intent"] == "knowledge_base":
                 # 查询知识库
-                docs = retrieve_documents(question, top_k)
-                print("检索到的文档:", docs)
-                prompt = build_context(docs, his)
+                docs = retrieve_scored_documents(question, top_k)
+                print("检索到的文档:", [doc["content"] for doc in docs])
+                trace = {}
+                prompt = build_context(docs, his, intent_result["intent"], trace)
+                print("上下文预算:", trace["context_budget"])
                 handleAnswer = HandleAnswer()
                 return handleAnswer.generate_answer(prompt, intent_result["intent"])
             elif intent_result["intent"] == "weather":
@@ -109,8 +111,10 @@ class ProcessIntent:
                 return handleAnswer.generate_answer(prompt, intent_result["intent"])
             else:
                 # 其他类型的问题，默认查询知识库
-                docs = retrieve_documents(question, top_k)
-                prompt = build_context(docs, his)
+                docs = retrieve_scored_documents(question, top_k)
+                trace = {}
+                prompt = build_context(docs, his, intent_result["intent"], trace)
+                print("上下文预算:", trace["context_budget"])
                 handleAnswer = HandleAnswer()
                 return handleAnswer.generate_answer(prompt, intent_result["intent"])
             
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from config import config as app_config
+from mcpclient.mcp_connection import MCPServerPool
+from mcpclient.mcp_result_cache import MCPResultCache
+from mcpclient.mcp_supervisor import MCPSupervisor
+
+logger = logging.getLogger(__name__)
+
+# 预定义的MCP服务器配置
+# pool_size: 每个服务器启动的进程数; max_in_flight: 单个进程允许的并发调用数
+# standby_size: 热备进程数; ready_timeout: 首次请求等待服务器就绪的最长时间
+# call_timeout: 单次工具调用（含排队）的默认期限
+# transport: stdio(独立子进程) 或 inprocess(加载 app 指定的应用到本进程，省去进程启动和管道序列化)
+DEFAULT_SERVER_CONFIGS = {
+    "weather": {
+        "script_path": "chatAssistant/mcpserver/weatherMcpServer_stdio.py",
+        "description": "真实天气查询服务",
+        "transport": "inprocess",
+        "app": "mcp",
+        # 进程内会话共享同一个服务器实例，无需多进程和热备
+        "pool_size": 1,
+        "max_in_flight": 8,
+        "standby_size": 0,
+        "call_timeout": 2,
+        "ready_timeout": 5
+    },
+    "financial": {
+        "script_path": "chatAssistant/mcpserver/FinancialMCPServer.py",
+        "description": "财务数据分析服务",
+        "transport": "stdio",
+        "app": "FinancialMCPServer",
+        "pool_size": 2,
+        "max_in_flight": 2,
+        "standby_size": 1,
+        "call_timeout": 3,
+        "ready_timeout": 8
+    }
+}
+
+
+class AsyncMCPClient:
+    """
+    原生异步的MCP客户端，必须在同一个事件循环中使用
+    - 会话长期保持，由连接池和监督器负责重连
+    - call_tool / call_tools 均可 await，call_tools 并发执行多次调用，每次调用有独立期限
+    """
+
+    def __init__(self, server_configs: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.server_configs = server_configs or {name: dict(cfg) for name, cfg in DEFAULT_SERVER_CONFIGS.items()}
+        self.connections: Dict[str, MCPServerPool] = {}
+        # 每个服务器正在进行/已完成的连接任务，所有请求共享同一次连接而不是各自竞争
+        self._connect_tasks: Dict[str, asyncio.Task] = {}
+        # 健康检查与自动重启
+        self.supervisor = MCPSupervisor(self, interval=15, ping_timeout=2)
+        self._supervisor_task: Optional[asyncio.Task] = None
+        # 幂等工具和资源的结果缓存，可缓存的工具/资源及其TTL在 config["mcp_cache"] 中声明
+        cache_config = app_config.get("mcp_cache", {})
+        self.cache_policies: Dict[str, Dict[str, Any]] = cache_config.get("tools", {})
+        self.resource_cache_policies: Dict[str, Dict[str, Any]] = cache_config.get("resources", {})
+        self.result_cache = MCPResultCache(cache_config.get("max_bytes", 16 * 1024 * 1024))
+
+    async def start(self):
+        """启动连接监督器"""
+        if self._supervisor_task is None or self._supervisor_task.done():
+            self._supervisor_task = asyncio.create_task(self.supervisor.run())
+
+    async def close(self):
+        """停止监督器并断开所有服务器"""
+        self.supervisor.stop()
+        for task in self._connect_tasks.values():
+            if not task.done():
+                task.cancel()
+        self._connect_tasks.clear()
+        for server_name, pool in list(self.connections.items()):
+            try:
+                await pool.disconnect()
+            except Exception as e:
+                logger.error(f"断开服务器 {server_name} 时出错: {str(e)}")
+        self.connections.clear()
+
+    def _ensure_connecting(self, server_name: str) -> asyncio.Task:
+        """返回该服务器的连接任务，没有进行中或成功的连接任务时才发起新连接"""
+        task = self._connect_tasks.get(server_name)
+        if task is not None and (not task.done() or (not task.cancelled() and task.exception() is None)):
+            return task
+
+        config = self.server_configs[server_name]
+        pool = MCPServerPool(
+            name=server_name,
+            script_path=config["script_path"],
+            description=config["description"],
+            pool_size=config.get("pool_size", 1),
+            max_in_flight=config.get("max_in_flight", 4),
+            standby_size=config.get("standby_size", 0),
+            transport=config.get("transport", "stdio"),
+            app_attr=config.get("app")
+        )
+        logger.info(f"开始连接MCP服务器: {server_name}")
+        task = asyncio.create_task(self._connect_pool(server_name, pool))
+        # 失败由等待者处理，这里只标记异常已读取
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._connect_tasks[server_name] = task
+        return task
+
+    async def _connect_pool(self, server_name: str, pool: MCPServerPool) -> MCPServerPool:
+        connect_start = time.time()
+        await pool.connect()
+        self.connections[server_name] = pool
+        logger.info(f"连接服务器 {server_name} 成功，耗时: {time.time() - connect_start:.2f}秒")
+        return pool
+
+    def preconnect(self, server_name: str):
+        """在后台预连接服务器；之后的请求会等待同一次连接就绪"""
+        if server_name in self.server_configs:
+            self._ensure_connecting(server_name)
+
+    async def _wait_ready(self, server_name: str) -> MCPServerPool:
+        pool = self.connections.get(server_name)
+        if pool is not None:
+            if not pool.connected and not pool.replenishing:
+                # 所有进程都已失效且上次补齐失败：立即重新补齐，不等下一次健康检查
+                # （连接任务已完成，再等它只会拿回同一个没有进程的池）
+                logger.warning(f"服务器 {server_name} 没有可用进程，正在重启")
+                pool._schedule_replenish()
+            return pool
+        # shield: 等待方超时或取消不会中断共享的连接任务
+        return await asyncio.shield(self._ensure_connecting(server_name))
+
+    async def connect_server(self, server_name: str, timeout: Optional[float] = None) -> MCPServerPool:
+        """等待服务器就绪并返回其连接池；超时不会取消后台的连接任务"""
+        if server_name not in self.server_configs:
+            raise ValueError(f"未知的服务器: {server_name}")
+        if timeout is None:
+            timeout = self.server_configs[server_name].get("ready_timeout", 5)
+        return await asyncio.wait_for(self._wait_ready(server_name), timeout)
+
+    async def disconnect_server(self, server_name: str):
+        """断开指定的MCP服务器"""
+        task = self._connect_tasks.pop(server_name, None)
+        if task is not None and not task.done():
+            task.cancel()
+        pool = self.connections.pop(server_name, None)
+        if pool is not None:
+            await pool.disconnect()
+
+    async def call_tool(self, server_name: str, tool_name: str, arguments: Dict[str, Any],
+                        timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        调用指定服务器上的工具
+
+        Args:
+            timeout: 本次调用的期限（含等待服务器就绪和排队），默认取服务器配置中的 call_timeout
+        """
+        if server_name not in self.server_configs:
+            return [{"error": f"未知的服务器: {server_name}"}]
+        timeout = self.effective_timeout(server_name, timeout)
+        call_start = time.time()
+        try:
+            return await asyncio.wait_for(self._call_tool(server_name, tool_name, arguments), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"工具调用超时: {server_name}.{tool_name}，总耗时: {time.time() - call_start:.2f}秒")
+            return [{"error": f"工具调用超时: {tool_name}"}]
+        except Exception as e:
+            logger.error(f"调用工具失败: {str(e)}，总耗时: {time.time() - call_start:.2f}秒")
+            return [{"error": str(e)}]
+
+    def effective_timeout(self, server_name: str, timeout: Optional[float] = None) -> float:
+        """本次调用的期限：未指定时取 call_timeout，服务器尚未连接时再加上 ready_timeout"""
+        if timeout is not None:
+            return timeout
+        config = self.server_configs.get(server_name, {})
+        return config.get("call_timeout", 2) + (0 if server_name in self.connections
+                                                else config.get("ready_timeout", 5))
+
+    async def _call_tool(self, server_name: str, tool_name: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+        pool = await self._wait_ready(server_name)
+        cache_name = f"{server_name}.{tool_name}"
+        policy = self.cache_policies.get(cache_name)
+        if not policy:
+            return await pool.call_tool(tool_name, arguments)
+        return await self.result_cache.get_or_call(
+            cache_name, arguments, policy.get("ttl", 60),
+            lambda: pool.call_tool(tool_name, arguments)
+        )
+
+    async def call_tools(self, calls: List[Dict[str, Any]], timeout: Optional[float] = None) -> List[List[Dict[str, Any]]]:
+        """
+        并发执行多次工具调用，结果顺序与 calls 一致
+
+        Args:
+            calls: 每项形如 {"server": ..., "tool": ..., "arguments": {...}, "timeout": 可选}
+            timeout: 没有单独指定 timeout 的调用使用的期限
+        """
+        return await asyncio.gather(*(
+            self.call_tool(call["server"], call["tool"], call.get("arguments", {}),
+                           call.get("timeout", timeout))
+            for call in calls
+        ))
+
+    async def read_resource(self, server_name: str, uri: str, timeout: Optional[float] = None) -> Any:
+        """读取指定服务器上的资源，config["mcp_cache"]["resources"] 中声明的资源（按去掉查询参数的URI匹配）会被缓存"""
+        if server_name not in self.server_configs:
+            return {"error": f"未知的服务器: {server_name}"}
+        try:
+            return await asyncio.wait_for(self._read_resource(server_name, uri),
+                                          self.effective_timeout(server_name, timeout))
+        except asyncio.TimeoutError:
+            return {"error": f"读取资源超时: {uri}"}
+        except Exception as e:
+            return {"error": str(e)}
+
+    async def _read_resource(self, server_name: str, uri: str) -> Any:
+        pool = await self._wait_ready(server_name)
+        # 分页参数作为缓存参数，统计和失效按不带查询参数的资源名汇总
+        base_uri = uri.split("?", 1)[0]
+        policy = self.resource_cache_policies.get(base_uri)
+        if not policy:
+            return await pool.read_resource(uri)
+        return await self.result_cache.get_or_call(
+            base_uri, {"server": server_name, "uri": uri}, policy.get("ttl", 60),
+            lambda: pool.read_resource(uri)
+        )
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取工具结果缓存的命中率和占用"""
+        return self.result_cache.get_stats()
+
+    def get_pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各服务器连接池的规模与负载指标"""
+        return {server_name: pool.get_stats() for server_name, pool in self.connections.items()}
+
+    def get_available_tools(self) -> Dict[str, List[str]]:
+        """获取所有可用的工具列表"""
+        available_tools = {}
+        for server_name, connection in self.connections.items():
+            if connection.connected:
+                available_tools[server_name] = [tool.name for tool in connection.tools]
+        return available_tools
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import logging
+import os
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from mcp import types
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".mcp_cache", "capabilities.json"
+)
+
+
+class CapabilityCache:
+    """
+    MCP服务器能力（工具和资源列表）的磁盘缓存
+    以服务器脚本的内容哈希为键，脚本未变化时连接可以跳过 list_tools / list_resources
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        self.path = path
+        self._lock = Lock()
+        self._entries: Optional[Dict[str, Any]] = None
+        # (mtime, size) -> 哈希，避免每次重连都重新读取脚本
+        self._hashes: Dict[str, Tuple[float, int, str]] = {}
+
+    def script_hash(self, script_path: str) -> str:
+        """计算服务器脚本的sha256，按mtime和大小缓存计算结果"""
+        stat = os.stat(script_path)
+        cached = self._hashes.get(script_path)
+        if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[2]
+        with open(script_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self._hashes[script_path] = (stat.st_mtime, stat.st_size, digest)
+        return digest
+
+    def _load_entries(self) -> Dict[str, Any]:
+        if self._entries is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def load(self, script_path: str) -> Optional[Tuple[List[types.Tool], List[types.Resource]]]:
+        """脚本哈希匹配时返回缓存的工具和资源列表，否则返回None"""
+        key = os.path.abspath(script_path)
+        try:
+            digest = self.script_hash(key)
+            with self._lock:
+                entry = self._load_entries().get(key)
+            if not entry or entry.get("hash") != digest:
+                return None
+            tools = [types.Tool.model_validate(tool) for tool in entry["tools"]]
+            resources = [types.Resource.model_validate(resource) for resource in entry["resources"]]
+            return tools, resources
+        except Exception as e:
+            logger.warning(f"读取能力缓存失败: {str(e)}")
+            return None
+
+    def store(self, script_path: str, tools: List[types.Tool], resources: List[types.Resource]):
+        """保存服务器能力，写临时文件后原子替换"""
+        key = os.path.abspath(script_path)
+        try:
+            entry = {
+                "hash": self.script_hash(key),
+                "tools": [tool.model_dump(mode="json", exclude_none=True) for tool in tools],
+                "resources": [resource.model_dump(mode="json", exclude_none=True) for resource in resources],
+            }
+            with self._lock:
+                entries = self._load_entries()
+                if entries.get(key) == entry:
+                    return
+                entries[key] = entry
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(entries, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"写入能力缓存失败: {str(e)}")
+
+
+# 全局能力缓存实例
+capability_cache = CapabilityCache()
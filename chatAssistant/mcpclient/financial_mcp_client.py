@@ -1,12 +1,27 @@
 import asyncio
 import json
 import os
-from typing import List, Dict, Any, Optional
+import sys
+from typing import AsyncIterator, List, Dict, Any, Optional
+from urllib.parse import urlencode
 
 from mcp import ClientSession, StdioServerParameters
 from mcp import types
 from mcp.client.stdio import stdio_client
 
+# 以脚本方式运行时，把 chatAssistant 目录加入路径以导入 config 和 mcpclient 包
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import config
+from mcpclient.mcp_connection import MCPServerConnection
+from mcpclient.mcp_result_cache import MCPResultCache
+
+DEFAULT_RESOURCE_PAGE_SIZE = 500
+
+DEFAULT_SERVER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcpserver", "FinancialMCPServer.py"
+)
+
 
 class FinancialMCPClient:
     def __init__(self):
@@ -14,31 +29,39 @@ class FinancialMCPClient:
         self.resources = []
         self.tools = []
         self.server_params = None
-
-    async def connect(self, server_script_path: str = "mcpserver/financial_mcp_server.py"):
-        """连接到MCP服务器"""
-        # 设置服务器参数
-        self.server_params = StdioServerParameters(
-            command="python",
-            args=[server_script_path]
+        self.connection: Optional[MCPServerConnection] = None
+        # 幂等资源/工具的结果缓存，策略在 config["mcp_cache"] 中声明
+        cache_config = config.get("mcp_cache", {})
+        self.resource_cache_policies = cache_config.get("resources", {})
+        self.tool_cache_policies = cache_config.get("tools", {})
+        self.result_cache = MCPResultCache(cache_config.get("max_bytes", 16 * 1024 * 1024))
+
+    async def connect(self, server_script_path: str = DEFAULT_SERVER_SCRIPT, transport: str = "stdio"):
+        """连接到MCP服务器，会话保持到 close 为止"""
+        self.connection = MCPServerConnection(
+            name="financial",
+            script_path=server_script_path,
+            transport=transport,
+            app_attr="FinancialMCPServer"
         )
-
-        # 连接到服务器
-        async with stdio_client(self.server_params) as (read_stream, write_stream):
-            async with ClientSession(read_stream, write_stream) as session:
-                self.session = session
-                await session.initialize()
-                print("成功连接到Financial MCP服务器")
-
-                # 初始化时获取可用资源和工具
-                await self.refresh_resources()
-                await self.refresh_tools()
+        await self.connection.connect()
+        self.session = self.connection.session
+        self.resources = self.connection.resources
+        self.tools = self.connection.tools
+        print("成功连接到Financial MCP服务器")
+
+    async def close(self):
+        """断开与MCP服务器的连接"""
+        if self.connection:
+            await self.connection.disconnect()
+            self.connection = None
+        self.session = None
 
     async def refresh_resources(self):
         """获取服务器上可用的资源列表"""
         if self.session:
             try:
-                self.resources = await self.session.list_resources()
+                self.resources = (await self.session.list_resources()).resources
                 print(f"发现 {len(self.resources)} 个可用资源:")
                 for resource in self.resources:
                     print(f"  - {resource.name}: {resource.uri} ({resource.description})")
@@ -49,35 +72,79 @@ class FinancialMCPClient:
         """获取服务器上可用的工具列表"""
         if self.session:
             try:
-                self.tools = await self.session.list_tools()
+                self.tools = (await self.session.list_tools()).tools
                 print(f"发现 {len(self.tools)} 个可用工具:")
                 for tool in self.tools:
                     print(f"  - {tool.name}: {tool.description}")
             except Exception as e:
                 print(f"获取工具列表失败: {str(e)}")
 
-    async def read_resource(self, uri: str) -> Dict[str, Any]:
-        """读取指定URI的资源内容"""
+    async def read_resource(self, uri: str) -> Any:
+        """
+        读取指定URI的资源内容
+        报表资源不带分页参数时为完整的记录数组；需要分页时使用 read_resource_pages
+        """
         if not self.session:
             return {"error": "未连接到服务器"}
 
         try:
-            content = await self.session.read_resource(uri)
-            return json.loads(content)
+            # 分页参数作为缓存参数，统计和失效按不带查询参数的资源名汇总
+            base_uri = str(uri).split("?", 1)[0]
+            policy = self.resource_cache_policies.get(base_uri)
+            if not policy:
+                return await self._read_resource(uri)
+            return await self.result_cache.get_or_call(
+                base_uri, {"uri": str(uri)}, policy.get("ttl", 60), lambda: self._read_resource(uri)
+            )
         except Exception as e:
             print(f"读取资源 {uri} 时出错: {str(e)}")
             return {"error": str(e)}
 
+    async def _read_resource(self, uri: str) -> Any:
+        result = await self.session.read_resource(uri)
+        return json.loads(result.contents[0].text)
+
+    async def read_resource_pages(self, uri: str, limit: int = None,
+                                  columns: List[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        按游标逐页读取分页资源（报表、Supabase文档/财务数据），每次只持有一页
+        总是带上 limit，服务器据此返回分页结构 {..., next_cursor, rows/documents/financial_data}
+        """
+        cursor = None
+        while True:
+            params = {"limit": limit or DEFAULT_RESOURCE_PAGE_SIZE}
+            if columns:
+                params["columns"] = ",".join(columns)
+            if cursor:
+                params["cursor"] = cursor
+            page = await self.read_resource(f"{uri}?{urlencode(params)}" if params else uri)
+            yield page
+            cursor = page.get("next_cursor")
+            if "error" in page or not cursor:
+                break
+
     async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
         """调用指定的工具"""
         if not self.session:
             return [{"error": "未连接到服务器"}]
 
+        policy = self.tool_cache_policies.get(f"financial.{tool_name}")
+        if not policy:
+            return await self._call_tool(tool_name, arguments)
+        return await self.result_cache.get_or_call(
+            f"financial.{tool_name}", arguments, policy.get("ttl", 60),
+            lambda: self._call_tool(tool_name, arguments)
+        )
+
+    async def _call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
         try:
             result = await self.session.call_tool(tool_name, arguments)
+            if getattr(result, "isError", False):
+                # 工具执行失败时显式标记为错误，避免被当作正常结果缓存
+                message = "；".join(item.text for item in result.content if item.type == "text")
+                return [{"error": message or f"工具执行失败: {tool_name}"}]
             parsed_results = []
-            print("result:", result)
-            for content in result:
+            for content in result.content:
                 if hasattr(content, 'type') and content.type == "text":
                     try:
                         parsed_results.append(json.loads(content.text))
@@ -147,25 +214,28 @@ class FinancialMCPClient:
         results = await self.call_tool("compare_periods", arguments)
         return results[0] if results else {"error": "期间比较失败"}
 
-    async def run_with_connection(self, server_script_path: str = "mcpserver/financial_mcp_server.py"):
-        """运行客户端并保持连接"""
-        self.server_params = StdioServerParameters(
-            command="python",
-            args=[server_script_path]
-        )
-
-        async with stdio_client(self.server_params) as (read_stream, write_stream):
-            async with ClientSession(read_stream, write_stream) as session:
-                self.session = session
-                await session.initialize()
-                print("成功连接到Financial MCP服务器")
-
-                # 初始化时获取可用资源和工具
-                await self.refresh_resources()
-                await self.refresh_tools()
+    async def run_with_connection(self, server_script_path: str = DEFAULT_SERVER_SCRIPT):
+        """运行客户端并保持连接，返回可继续使用的会话"""
+        if not self.session:
+            await self.connect(server_script_path)
+        return self.session
+
+    async def call_tools(self, calls: List[Dict[str, Any]], timeout: Optional[float] = None) -> List[List[Dict[str, Any]]]:
+        """
+        在同一会话上并发调用多个工具，结果顺序与 calls 一致
+
+        Args:
+            calls: 每项形如 {"tool": ..., "arguments": {...}, "timeout": 可选}
+            timeout: 没有单独指定 timeout 的调用使用的期限
+        """
+        async def run_one(call: Dict[str, Any]) -> List[Dict[str, Any]]:
+            deadline = call.get("timeout", timeout)
+            try:
+                return await asyncio.wait_for(self.call_tool(call["tool"], call.get("arguments", {})), deadline)
+            except asyncio.TimeoutError:
+                return [{"error": f"工具调用超时: {call['tool']}"}]
 
-                # 在这里可以执行其他操作
-                return self.session
+        return await asyncio.gather(*(run_one(call) for call in calls))
 
 
 async def interactive_demo():
@@ -0,0 +1,59 @@
+import importlib.util
+import logging
+import os
+import sys
+from threading import Lock
+from typing import Dict
+
+from mcp.server import Server as McpServer
+from mcp.server.fastmcp import FastMCP
+from mcp.shared.memory import create_connected_server_and_client_session
+
+logger = logging.getLogger(__name__)
+
+# 已加载的进程内服务器实例，同一脚本的多个会话共享一个实例（及其数据缓存）
+_servers: Dict[str, McpServer] = {}
+_servers_lock = Lock()
+
+
+def load_inprocess_server(script_path: str, app_attr: str) -> McpServer:
+    """
+    把本地MCP服务器脚本作为模块加载到当前进程，返回其底层 Server 实例
+
+    Args:
+        script_path: 服务器脚本路径
+        app_attr: 模块中的应用属性名，可以是 FastMCP 实例、McpServer 实例，
+                  或者一个无参构造、带 app 属性的类（如 FinancialMCPServer）
+    """
+    script_path = os.path.abspath(script_path)
+    cache_key = f"{script_path}:{app_attr}"
+    with _servers_lock:
+        if cache_key in _servers:
+            return _servers[cache_key]
+
+        module_name = f"mcp_inprocess_{os.path.splitext(os.path.basename(script_path))[0]}"
+        module = sys.modules.get(module_name)
+        if module is None:
+            spec = importlib.util.spec_from_file_location(module_name, script_path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+
+        target = getattr(module, app_attr)
+        if isinstance(target, type):
+            target = target()
+        if isinstance(target, FastMCP):
+            server = target._mcp_server
+        elif isinstance(target, McpServer):
+            server = target
+        else:
+            server = target.app
+
+        _servers[cache_key] = server
+        logger.info(f"已在进程内加载MCP服务器: {script_path} ({app_attr})")
+        return server
+
+
+def inprocess_client_session(server: McpServer):
+    """通过内存流把客户端会话直接连到进程内服务器，返回异步上下文管理器，产出已初始化的 ClientSession"""
+    return create_connected_server_and_client_session(server)
@@ -1,167 +1,38 @@
 import asyncio
-import json
+import concurrent.futures
 import logging
-import os
-import subprocess
 from typing import Dict, List, Any, Optional
 from threading import Thread, Event
-import queue
 import time
 
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from mcpclient.async_mcp_client import AsyncMCPClient
+# MCPServerConnection 保留在此导出，兼容旧的导入路径
+from mcpclient.mcp_connection import MCPServerConnection, MCPServerPool
 
 logger = logging.getLogger(__name__)
 
 
-class MCPServerConnection:
-    """单个MCP服务器连接的管理类"""
-    
-    def __init__(self, name: str, script_path: str, description: str = ""):
-        self.name = name
-        self.script_path = script_path
-        self.description = description
-        self.session: Optional[ClientSession] = None
-        self.tools = []
-        self.resources = []
-        self.connected = False
-        self.server_process = None
-        # 异步上下文管理器
-        self.stdio_context = None
-        self.session_context = None
-        self.read_stream = None
-        self.write_stream = None
-        
-    async def connect(self):
-        """连接到MCP服务器"""
-        try:
-            # 设置服务器参数
-            server_params = StdioServerParameters(
-                command="python",
-                args=[self.script_path]
-            )
-            
-            # 使用正确的异步上下文管理器方式
-            self.stdio_context = stdio_client(server_params)
-            self.read_stream, self.write_stream = await self.stdio_context.__aenter__()
-            
-            self.session_context = ClientSession(self.read_stream, self.write_stream)
-            self.session = await self.session_context.__aenter__()
-            await self.session.initialize()
-            
-            # 获取工具和资源列表
-            await self.refresh_capabilities()
-            self.connected = True
-            logger.info(f"成功连接到MCP服务器: {self.name}")
-            
-        except Exception as e:
-            logger.error(f"连接MCP服务器 {self.name} 失败: {str(e)}")
-            self.connected = False
-            # 清理连接
-            await self._cleanup_connection()
-            raise
-    
-    async def disconnect(self):
-        """断开MCP服务器连接"""
-        try:
-            await self._cleanup_connection()
-            self.connected = False
-            logger.info(f"断开MCP服务器连接: {self.name}")
-        except Exception as e:
-            logger.error(f"断开MCP服务器 {self.name} 连接时出错: {str(e)}")
-    
-    async def _cleanup_connection(self):
-        """清理连接资源"""
-        try:
-            if hasattr(self, 'session_context') and self.session_context:
-                await self.session_context.__aexit__(None, None, None)
-                self.session_context = None
-                self.session = None
-            
-            if hasattr(self, 'stdio_context') and self.stdio_context:
-                await self.stdio_context.__aexit__(None, None, None)
-                self.stdio_context = None
-                
-        except Exception as e:
-            logger.error(f"清理连接资源时出错: {str(e)}")
-    
-    async def refresh_capabilities(self):
-        """刷新服务器的工具和资源列表"""
-        if not self.session:
-            return
-            
-        try:
-            # 获取工具列表
-            self.tools = await self.session.list_tools()
-            print("self.tools", self.tools)
-            logger.info(f"服务器 {self.name} 有 {len(self.tools)} 个工具")
-            
-            # 获取资源列表
-            self.resources = await self.session.list_resources()
-            logger.info(f"服务器 {self.name} 有 {len(self.resources)} 个资源")
-            
-        except Exception as e:
-            logger.error(f"刷新服务器 {self.name} 能力时出错: {str(e)}")
-    
-    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """调用服务器上的工具"""
-        if not self.session or not self.connected:
-            return [{"error": f"服务器 {self.name} 未连接"}]
-        
-        try:
-            import time
-            tool_start = time.time()
-            logger.info(f"调用服务器工具: {self.name}.{tool_name}")
-            result = await self.session.call_tool(tool_name, arguments)
-            parsed_results = []
-            for content in result:
-                if content[1] is not None and isinstance(content[1], list):
-                    result_content = content[1]
-                    for item in result_content:
-                        if item.type == "text":
-                            parsed_results.append(item.text)
-                # if hasattr(content, 'text'):
-                #     print("content.text", content.get("text",""))
-                # if hasattr(content, 'type') and content.type == "text":
-                #     try:
-                #         print("content.text", content.text)
-                #         # 尝试解析JSON
-                #         parsed_results.append(json.loads(content.text))
-                #     except:
-                #         # 如果不是JSON，直接返回文本
-                #         parsed_results.append({"text": content.text})
-                
-            
-            return parsed_results
-            
-        except Exception as e:
-            logger.error(f"调用工具 {tool_name} 在服务器 {self.name} 时出错: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return [{"error": str(e)}]
-
-
 class MCPClientManager:
-    """MCP客户端管理器，管理多个MCP服务器连接"""
+    """
+    MCP客户端管理器：AsyncMCPClient 的同步外观，供Flask处理函数使用
+    在单独线程中运行事件循环，同步方法把调用提交到该循环并等待结果；
+    异步代码可直接在 self.loop 中使用 self.client
+    """
     
     def __init__(self):
-        self.connections: Dict[str, MCPServerConnection] = {}
+        self.client = AsyncMCPClient()
         self.loop = None
         self.loop_thread = None
         self.running = False
         self.loop_ready = Event()  # 用于同步事件循环启动
-        
-        # 预定义的MCP服务器配置
-        self.server_configs = {
-            "weather": {
-                "script_path": "chatAssistant/mcpserver/weatherMcpServer_stdio.py",
-                "description": "真实天气查询服务"
-            },
-            "financial": {
-                "script_path": "chatAssistant/mcpserver/FinancialMCPServer.py", 
-                "description": "财务数据分析服务"
-            }
-        }
+
+    @property
+    def connections(self) -> Dict[str, MCPServerPool]:
+        return self.client.connections
+
+    @property
+    def server_configs(self) -> Dict[str, Dict[str, Any]]:
+        return self.client.server_configs
         
     def start(self):
         """启动MCP客户端管理器"""
@@ -175,8 +46,9 @@ class MCPClientManager:
         self.loop_thread = Thread(target=self._run_event_loop, daemon=True)
         self.loop_thread.start()
         
-        # 等待事件循环启动完成，最多等待3秒
+        # 等待事件循环启动完成，最多等待1秒
         if self.loop_ready.wait(timeout=1):
+            asyncio.run_coroutine_threadsafe(self.client.start(), self.loop)
             logger.info("MCP客户端管理器已启动")
         else:
             logger.error("MCP客户端管理器启动超时")
@@ -190,9 +62,12 @@ class MCPClientManager:
             
         self.running = False
         if self.loop and not self.loop.is_closed():
-            # 异步关闭所有连接
-            asyncio.run_coroutine_threadsafe(self._disconnect_all(), self.loop)
-            # 停止事件循环
+            # 关闭所有连接后停止事件循环
+            future = asyncio.run_coroutine_threadsafe(self.client.close(), self.loop)
+            try:
+                future.result(timeout=5)
+            except Exception as e:
+                logger.error(f"断开连接时出错: {str(e)}")
             self.loop.call_soon_threadsafe(self.loop.stop)
         
         if self.loop_thread:
@@ -215,17 +90,27 @@ class MCPClientManager:
             if self.loop and not self.loop.is_closed():
                 self.loop.close()
             print("事件循环清理完成")
-    
-    async def _disconnect_all(self):
-        """断开所有MCP服务器连接"""
-        for connection in self.connections.values():
-            try:
-                await connection.disconnect()
-            except Exception as e:
-                logger.error(f"断开连接时出错: {str(e)}")
-    
+
+    # 异步侧自带期限，同步侧在其基础上多等这么久，防止事件循环卡住时永久阻塞调用线程
+    SYNC_MARGIN = 1
+
+    def _run(self, coro, timeout: Optional[float]):
+        """把协程提交到事件循环并同步等待；超时时取消协程以释放资源"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def preconnect(self, server_name: str):
+        """在后台预连接服务器，不阻塞调用方；之后的请求会等待同一次连接就绪"""
+        if not self.running or server_name not in self.server_configs:
+            return
+        self.loop.call_soon_threadsafe(self.client.preconnect, server_name)
+
     def connect_server(self, server_name: str) -> bool:
-        """连接到指定的MCP服务器"""
+        """连接到指定的MCP服务器，已有连接任务时等待其就绪"""
         if not self.running:
             logger.error("MCP客户端管理器未运行")
             return False
@@ -234,35 +119,16 @@ class MCPClientManager:
             logger.error(f"未知的服务器: {server_name}")
             return False
         
-        # 检查是否已经连接
-        if server_name in self.connections and self.connections[server_name].connected:
-            logger.info(f"服务器 {server_name} 已经连接，跳过连接")
-            return True
-        
-        config = self.server_configs[server_name]
-        connection = MCPServerConnection(
-            name=server_name,
-            script_path=config["script_path"],
-            description=config["description"]
-        )
-        
+        ready_timeout = self.server_configs[server_name].get("ready_timeout", 5)
         try:
-            import time
-            connect_start = time.time()
-            logger.info(f"开始连接MCP服务器: {server_name}")
-            
-            # 在事件循环中执行连接，使用更短的超时时间
-            future = asyncio.run_coroutine_threadsafe(connection.connect(), self.loop)
-            future.result(timeout=3)  # 3秒超时，更快失败
-            
-            connect_end = time.time()
-            logger.info(f"连接服务器 {server_name} 成功，耗时: {connect_end - connect_start:.2f}秒")
-            
-            self.connections[server_name] = connection
+            wait_start = time.time()
+            # 异步侧自带期限，这里多留余量
+            self._run(self.client.connect_server(server_name, ready_timeout), ready_timeout + self.SYNC_MARGIN)
+            logger.info(f"服务器 {server_name} 已就绪，等待耗时: {time.time() - wait_start:.2f}秒")
             return True
-            
-        except asyncio.TimeoutError:
-            logger.error(f"连接服务器 {server_name} 超时")
+        except (asyncio.TimeoutError, concurrent.futures.TimeoutError):
+            # 连接任务继续在后台进行，后续请求复用
+            logger.error(f"等待服务器 {server_name} 就绪超时")
             return False
         except Exception as e:
             logger.error(f"连接服务器 {server_name} 失败: {str(e)}")
@@ -273,79 +139,70 @@ class MCPClientManager:
         if server_name not in self.connections:
             return True
         
-        connection = self.connections[server_name]
         try:
-            future = asyncio.run_coroutine_threadsafe(connection.disconnect(), self.loop)
-            future.result(timeout=5)
-            del self.connections[server_name]
+            self._run(self.client.disconnect_server(server_name), 5)
             return True
         except Exception as e:
             logger.error(f"断开服务器 {server_name} 失败: {str(e)}")
             return False
     
-    def call_tool(self, server_name: str, tool_name: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """调用指定服务器上的工具"""
-        import time
+    def call_tool(self, server_name: str, tool_name: str, arguments: Dict[str, Any],
+                  timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """调用指定服务器上的工具（同步），期限由异步客户端控制"""
         call_start_time = time.time()
         
         if not self.running:
             return [{"error": "MCP客户端管理器未运行"}]
         
         logger.info(f"开始调用工具: {server_name}.{tool_name}")
-        
-        # 检查连接状态
-        if server_name not in self.connections:
-            logger.info(f"服务器 {server_name} 未连接，尝试自动连接")
-            connect_start = time.time()
-            if not self.connect_server(server_name):
-                logger.error(f"连接服务器 {server_name} 失败")
-                return [{"error": f"无法连接到服务器: {server_name}"}]
-            connect_end = time.time()
-            logger.info(f"连接服务器耗时: {connect_end - connect_start:.2f}秒")
-        
-        connection = self.connections[server_name]
-        if not connection.connected:
-            logger.error(f"服务器 {server_name} 连接状态异常")
-            return [{"error": f"服务器 {server_name} 连接已断开"}]
-        
+        bound = self.client.effective_timeout(server_name, timeout) + self.SYNC_MARGIN
         try:
-            logger.info(f"提交异步工具调用: {server_name}.{tool_name}")
-            async_start = time.time()
-            
-            future = asyncio.run_coroutine_threadsafe(
-                connection.call_tool(tool_name, arguments), 
-                self.loop
-            )
-            
-            # 使用更短的超时时间，避免长时间等待
-            result = future.result(timeout=2)  # 3秒超时
-            
-            async_end = time.time()
-            call_end_time = time.time()
-            
-            logger.info(f"异步调用耗时: {async_end - async_start:.2f}秒")
-            logger.info(f"工具调用总耗时: {call_end_time - call_start_time:.2f}秒")
-            logger.info(f"工具调用成功: {server_name}.{tool_name}")
-            
-            return result
-            
-        except asyncio.TimeoutError:
-            call_end_time = time.time()
-            logger.error(f"工具调用超时: {server_name}.{tool_name}，总耗时: {call_end_time - call_start_time:.2f}秒")
+            result = self._run(self.client.call_tool(server_name, tool_name, arguments, timeout), bound)
+        except concurrent.futures.TimeoutError:
+            logger.error(f"工具调用超时（事件循环无响应）: {server_name}.{tool_name}")
             return [{"error": f"工具调用超时: {tool_name}"}]
-        except Exception as e:
-            call_end_time = time.time()
-            logger.error(f"调用工具失败: {str(e)}，总耗时: {call_end_time - call_start_time:.2f}秒")
-            return [{"error": str(e)}]
-    
+        logger.info(f"工具调用总耗时: {time.time() - call_start_time:.2f}秒")
+        return result
+
+    def call_tools(self, calls: List[Dict[str, Any]], timeout: Optional[float] = None) -> List[List[Dict[str, Any]]]:
+        """并发执行多次工具调用（同步），总耗时约等于最慢的一次调用"""
+        if not self.running:
+            return [[{"error": "MCP客户端管理器未运行"}] for _ in calls]
+
+        call_start_time = time.time()
+        # 各调用并发执行，总期限取最长的单次期限
+        bound = max((self.client.effective_timeout(call["server"], call.get("timeout", timeout)) for call in calls),
+                    default=0) + self.SYNC_MARGIN
+        try:
+            results = self._run(self.client.call_tools(calls, timeout), bound)
+        except concurrent.futures.TimeoutError:
+            logger.error(f"并发调用 {len(calls)} 个工具超时（事件循环无响应）")
+            return [[{"error": f"工具调用超时: {call['tool']}"}] for call in calls]
+        logger.info(f"并发调用 {len(calls)} 个工具总耗时: {time.time() - call_start_time:.2f}秒")
+        return results
+
+    def read_resource(self, server_name: str, uri: str, timeout: Optional[float] = None) -> Any:
+        """读取指定服务器上的资源（同步）"""
+        if not self.running:
+            return {"error": "MCP客户端管理器未运行"}
+        bound = self.client.effective_timeout(server_name, timeout) + self.SYNC_MARGIN
+        try:
+            return self._run(self.client.read_resource(server_name, uri, timeout), bound)
+        except concurrent.futures.TimeoutError:
+            logger.error(f"读取资源超时（事件循环无响应）: {server_name} {uri}")
+            return {"error": f"读取资源超时: {uri}"}
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取工具结果缓存的命中率和占用"""
+        return self.client.get_cache_stats()
+
+    def get_pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各服务器连接池的规模与负载指标"""
+        return self.client.get_pool_stats()
+
     def get_available_tools(self) -> Dict[str, List[str]]:
         """获取所有可用的工具列表"""
-        available_tools = {}
-        for server_name, connection in self.connections.items():
-            if connection.connected:
-                tool_names = [tool.name for tool in connection.tools]
-                available_tools[server_name] = tool_names
-        return available_tools
+        return self.client.get_available_tools()
     
     def query_weather(self, city: str) -> Dict[str, Any]:
         """查询天气的便捷方法"""
@@ -362,4 +219,4 @@ class MCPClientManager:
 
 
 # 全局MCP客户端管理器实例
-mcp_manager = MCPClientManager() 
\ No newline at end of file
+mcp_manager = MCPClientManager()
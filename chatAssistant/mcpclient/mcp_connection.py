@@ -0,0 +1,456 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+import anyio
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+from mcpclient.capability_cache import capability_cache
+from mcpclient.inprocess_transport import load_inprocess_server, inprocess_client_session
+
+logger = logging.getLogger(__name__)
+
+# 表示服务器进程或管道已失效的异常
+TRANSPORT_ERRORS = (
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    anyio.EndOfStream,
+    BrokenPipeError,
+    ConnectionError,
+)
+
+
+class MCPServerConnection:
+    """单个MCP服务器连接的管理类"""
+    
+    def __init__(self, name: str, script_path: str, description: str = "",
+                 transport: str = "stdio", app_attr: Optional[str] = None):
+        self.name = name
+        self.script_path = script_path
+        self.description = description
+        # stdio: 独立子进程，隔离性好; inprocess: 在当前事件循环中通过内存流直连服务器
+        self.transport = transport
+        self.app_attr = app_attr
+        self.session: Optional[ClientSession] = None
+        self.tools = []
+        self.resources = []
+        self.connected = False
+        self.in_flight = 0  # 当前在途的工具调用数
+        self.server_process = None
+        # 会话由独立任务持有，保证上下文管理器在同一任务中进入和退出
+        self._runner: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Future] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._connect_start = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        
+    async def connect(self):
+        """连接到MCP服务器，会话保持到 disconnect 为止"""
+        self._connect_start = time.time()
+        self._ready = asyncio.get_running_loop().create_future()
+        self._closing = asyncio.Event()
+        self._runner = asyncio.create_task(self._run_session())
+        try:
+            await self._ready
+            logger.info(f"成功连接到MCP服务器: {self.name}")
+        except Exception as e:
+            logger.error(f"连接MCP服务器 {self.name} 失败: {str(e)}")
+            self.connected = False
+            raise
+
+    async def _run_session(self):
+        """持有会话（stdio时还有服务器进程），直到收到关闭信号或会话异常退出"""
+        try:
+            if self.transport == "inprocess":
+                server = load_inprocess_server(self.script_path, self.app_attr)
+                async with inprocess_client_session(server) as session:
+                    await self._hold_session(session)
+            else:
+                server_params = StdioServerParameters(
+                    command="python",
+                    args=[self.script_path]
+                )
+                async with stdio_client(server_params) as (read_stream, write_stream):
+                    async with ClientSession(read_stream, write_stream) as session:
+                        await session.initialize()
+                        await self._hold_session(session)
+        except Exception as e:
+            if not self._ready.done():
+                self._ready.set_exception(e)
+            else:
+                logger.error(f"MCP服务器 {self.name} 会话异常结束: {str(e)}")
+        finally:
+            self.connected = False
+            self.session = None
+            if not self._ready.done():
+                self._ready.set_exception(ConnectionError(f"服务器 {self.name} 连接被中断"))
+    
+    async def _hold_session(self, session: ClientSession):
+        """会话初始化完成后获取能力列表，并保持会话直到关闭"""
+        self.session = session
+        init_time = time.time() - self._connect_start
+
+        # 服务器脚本未变化时直接使用缓存的能力列表，后台再刷新
+        discovery_start = time.time()
+        cached = capability_cache.load(self.script_path)
+        if cached:
+            self.tools, self.resources = cached
+            self._refresh_task = asyncio.create_task(self._refresh_and_store())
+        else:
+            await self._refresh_and_store()
+        discovery_time = time.time() - discovery_start
+
+        self.connected = True
+        logger.info(f"服务器 {self.name} 连接耗时: 会话初始化 {init_time:.3f}秒, "
+                    f"能力发现 {discovery_time:.3f}秒 ({'缓存命中' if cached else '远程查询'})")
+        self._ready.set_result(True)
+        await self._closing.wait()
+
+    async def _refresh_and_store(self):
+        """向服务器查询能力列表并写入磁盘缓存"""
+        if await self.refresh_capabilities():
+            capability_cache.store(self.script_path, self.tools, self.resources)
+
+    async def disconnect(self):
+        """断开MCP服务器连接"""
+        try:
+            if self._closing:
+                self._closing.set()
+            if self._runner and not self._runner.done():
+                await asyncio.wait_for(self._runner, timeout=5)
+            self.connected = False
+            logger.info(f"断开MCP服务器连接: {self.name}")
+        except Exception as e:
+            logger.error(f"断开MCP服务器 {self.name} 连接时出错: {str(e)}")
+
+    async def ping(self, timeout: float = 2) -> bool:
+        """健康检查：向服务器发送ping，失败则标记为断开"""
+        if not self.session or not self.connected:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout=timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"服务器 {self.name} 健康检查失败: {str(e) or type(e).__name__}")
+            self.connected = False
+            return False
+    
+    async def refresh_capabilities(self) -> bool:
+        """刷新服务器的工具和资源列表，成功时返回True"""
+        if not self.session:
+            return False
+            
+        try:
+            # 获取工具列表
+            tools_result = await self.session.list_tools()
+            self.tools = tools_result.tools
+            logger.info(f"服务器 {self.name} 有 {len(self.tools)} 个工具")
+            
+            # 获取资源列表
+            resources_result = await self.session.list_resources()
+            self.resources = resources_result.resources
+            logger.info(f"服务器 {self.name} 有 {len(self.resources)} 个资源")
+            return True
+            
+        except Exception as e:
+            logger.error(f"刷新服务器 {self.name} 能力时出错: {str(e)}")
+            return False
+    
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """调用服务器上的工具"""
+        if not self.session or not self.connected:
+            return [{"error": f"服务器 {self.name} 未连接"}]
+        
+        try:
+            import time
+            tool_start = time.time()
+            logger.info(f"调用服务器工具: {self.name}.{tool_name}")
+            result = await self.session.call_tool(tool_name, arguments)
+            if getattr(result, "isError", False):
+                # 工具执行失败时显式标记为错误，避免被当作正常结果缓存
+                message = "；".join(item.text for item in result.content if item.type == "text")
+                return [{"error": message or f"工具执行失败: {tool_name}"}]
+            parsed_results = []
+            for content in result:
+                if content[1] is not None and isinstance(content[1], list):
+                    result_content = content[1]
+                    for item in result_content:
+                        if item.type == "text":
+                            parsed_results.append(item.text)
+                # if hasattr(content, 'text'):
+                #     print("content.text", content.get("text",""))
+                # if hasattr(content, 'type') and content.type == "text":
+                #     try:
+                #         print("content.text", content.text)
+                #         # 尝试解析JSON
+                #         parsed_results.append(json.loads(content.text))
+                #     except:
+                #         # 如果不是JSON，直接返回文本
+                #         parsed_results.append({"text": content.text})
+                
+            
+            return parsed_results
+            
+        except Exception as e:
+            logger.error(f"调用工具 {tool_name} 在服务器 {self.name} 时出错: {str(e)}")
+            if isinstance(e, TRANSPORT_ERRORS):
+                # 传输层错误说明进程已不可用，交给连接池淘汰
+                self.connected = False
+            import traceback
+            traceback.print_exc()
+            return [{"error": str(e)}]
+
+    async def read_resource(self, uri: str) -> Any:
+        """读取服务器上的资源，JSON文本会被解析为对象"""
+        if not self.session or not self.connected:
+            return {"error": f"服务器 {self.name} 未连接"}
+
+        try:
+            result = await self.session.read_resource(uri)
+            text = result.contents[0].text if result.contents else ""
+            try:
+                return json.loads(text)
+            except ValueError:
+                return {"text": text}
+        except Exception as e:
+            logger.error(f"读取资源 {uri} 在服务器 {self.name} 时出错: {str(e)}")
+            if isinstance(e, TRANSPORT_ERRORS):
+                self.connected = False
+            return {"error": str(e)}
+
+
+class MCPServerPool:
+    """同一MCP服务器的多进程连接池，按最少在途请求分发工具调用，并维护热备进程"""
+
+    def __init__(self, name: str, script_path: str, description: str = "",
+                 pool_size: int = 1, max_in_flight: int = 4, standby_size: int = 0,
+                 transport: str = "stdio", app_attr: Optional[str] = None):
+        self.name = name
+        self.script_path = script_path
+        self.description = description
+        self.transport = transport
+        self.app_attr = app_attr
+        self.pool_size = max(1, pool_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.standby_size = max(0, standby_size)
+        self.connections: List[MCPServerConnection] = []  # 参与分发的活动进程
+        self.standby: List[MCPServerConnection] = []  # 已完成初始化、随时顶替的热备进程
+        # 在事件循环内创建，用于等待空闲槽位
+        self._capacity: Optional[asyncio.Condition] = None
+        self._replenish_task: Optional[asyncio.Task] = None
+        # 后台断开旧进程的任务，保留引用以免执行中被回收
+        self._disconnect_tasks: Set[asyncio.Task] = set()
+        self._spawned = 0
+        # 池统计指标
+        self.total_calls = 0
+        self.queued_calls = 0
+        self.total_queue_time = 0.0
+        self.max_queue_time = 0.0
+        self.peak_in_flight = 0
+        self.restarts = 0
+        self.failovers = 0
+
+    @property
+    def connected(self) -> bool:
+        return any(connection.connected for connection in self.connections)
+
+    @property
+    def tools(self) -> list:
+        for connection in self.connections:
+            if connection.connected:
+                return connection.tools
+        return []
+
+    @property
+    def resources(self) -> list:
+        for connection in self.connections:
+            if connection.connected:
+                return connection.resources
+        return []
+
+    @property
+    def in_flight(self) -> int:
+        return sum(connection.in_flight for connection in self.connections)
+
+    @property
+    def replenishing(self) -> bool:
+        return self._replenish_task is not None and not self._replenish_task.done()
+
+    def _new_connection(self) -> MCPServerConnection:
+        self._spawned += 1
+        return MCPServerConnection(
+            name=f"{self.name}#{self._spawned}",
+            script_path=self.script_path,
+            description=self.description,
+            transport=self.transport,
+            app_attr=self.app_attr
+        )
+
+    async def connect(self):
+        """并发启动活动进程和热备进程，至少一个成功即视为连接成功"""
+        self._capacity = asyncio.Condition()
+        candidates = [self._new_connection() for _ in range(self.pool_size + self.standby_size)]
+        results = await asyncio.gather(
+            *(connection.connect() for connection in candidates),
+            return_exceptions=True
+        )
+        failures = [r for r in results if isinstance(r, Exception)]
+        live = [c for c in candidates if c.connected]
+        if not live:
+            raise RuntimeError(f"服务器 {self.name} 的所有进程均连接失败: {failures[0] if failures else ''}")
+        self.connections = live[:self.pool_size]
+        self.standby = live[self.pool_size:]
+        if failures:
+            logger.warning(f"服务器 {self.name} 连接池部分启动: {len(live)}/{len(candidates)}")
+            self._schedule_replenish()
+        logger.info(f"服务器 {self.name} 连接池已就绪，活动进程: {len(self.connections)}，"
+                    f"热备进程: {len(self.standby)}，单进程并发上限: {self.max_in_flight}")
+
+    async def disconnect(self):
+        """断开池中所有服务器进程"""
+        if self.replenishing:
+            self._replenish_task.cancel()
+        for connection in self.connections + self.standby:
+            await connection.disconnect()
+        self.connections = []
+        self.standby = []
+
+    async def _notify_capacity(self):
+        async with self._capacity:
+            self._capacity.notify_all()
+
+    async def retire(self, connection: MCPServerConnection):
+        """淘汰失效进程：热备进程立即顶替，并在后台补齐进程数"""
+        if connection in self.connections:
+            self.connections.remove(connection)
+            if self.standby:
+                self.connections.append(self.standby.pop(0))
+                self.failovers += 1
+                logger.info(f"服务器 {self.name} 热备进程已顶替失效进程 {connection.name}")
+        elif connection in self.standby:
+            self.standby.remove(connection)
+        task = asyncio.create_task(connection.disconnect())
+        self._disconnect_tasks.add(task)
+        task.add_done_callback(self._disconnect_done)
+        await self._notify_capacity()
+        self._schedule_replenish()
+
+    def _disconnect_done(self, task: asyncio.Task):
+        self._disconnect_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"服务器 {self.name} 断开失效进程时出错: {task.exception()}")
+
+    def _schedule_replenish(self):
+        if not self.replenishing:
+            self._replenish_task = asyncio.create_task(self._replenish())
+
+    async def _replenish(self):
+        """补齐活动进程与热备进程，启动失败时留待下一次健康检查重试"""
+        try:
+            while True:
+                missing_active = self.pool_size - len(self.connections)
+                missing_standby = self.standby_size - len(self.standby)
+                if missing_active <= 0 and missing_standby <= 0:
+                    return
+                connection = self._new_connection()
+                try:
+                    await connection.connect()
+                except Exception as e:
+                    logger.error(f"服务器 {self.name} 重启进程失败: {str(e)}")
+                    return
+                self.restarts += 1
+                if len(self.connections) < self.pool_size:
+                    self.connections.append(connection)
+                    await self._notify_capacity()
+                else:
+                    self.standby.append(connection)
+        finally:
+            # 先标记补齐结束再唤醒等待者，让它们重新检查：仍无可用连接时立即报错而不是一直等待
+            if self._replenish_task is asyncio.current_task():
+                self._replenish_task = None
+            await self._notify_capacity()
+
+    async def health_check(self, ping_timeout: float = 2):
+        """ping所有活动和热备进程，淘汰无响应的进程"""
+        members = self.connections + self.standby
+        results = await asyncio.gather(*(c.ping(ping_timeout) for c in members))
+        for connection, healthy in zip(members, results):
+            if not healthy:
+                await self.retire(connection)
+        if len(self.connections) < self.pool_size or len(self.standby) < self.standby_size:
+            self._schedule_replenish()
+
+    async def _acquire(self) -> "MCPServerConnection":
+        """选择在途请求最少的进程，全部满载时排队等待"""
+        wait_start = time.time()
+        queued = False
+        async with self._capacity:
+            while True:
+                live = [c for c in self.connections if c.connected]
+                if not live and not self.replenishing:
+                    raise RuntimeError(f"服务器 {self.name} 没有可用的连接")
+                candidates = [c for c in live if c.in_flight < self.max_in_flight]
+                if candidates:
+                    connection = min(candidates, key=lambda c: c.in_flight)
+                    connection.in_flight += 1
+                    break
+                queued = True
+                await self._capacity.wait()
+
+        queue_time = time.time() - wait_start
+        self.total_calls += 1
+        if queued:
+            self.queued_calls += 1
+        self.total_queue_time += queue_time
+        self.max_queue_time = max(self.max_queue_time, queue_time)
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return connection
+
+    async def _release(self, connection: "MCPServerConnection"):
+        async with self._capacity:
+            connection.in_flight -= 1
+            self._capacity.notify()
+
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """在池中最空闲的进程上调用工具"""
+        return await self._dispatch(lambda connection: connection.call_tool(tool_name, arguments))
+
+    async def read_resource(self, uri: str) -> Any:
+        """在池中最空闲的进程上读取资源"""
+        return await self._dispatch(lambda connection: connection.read_resource(uri))
+
+    async def _dispatch(self, operation: Callable[[MCPServerConnection], Awaitable[Any]]) -> Any:
+        """分发一次请求，进程在请求中失效时换一个进程重试一次"""
+        result = None
+        for _ in range(2):
+            connection = await self._acquire()
+            try:
+                result = await operation(connection)
+            finally:
+                await self._release(connection)
+            if connection.connected:
+                return result
+            await self.retire(connection)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池的规模与负载指标"""
+        return {
+            "pool_size": self.pool_size,
+            "live_processes": sum(1 for c in self.connections if c.connected),
+            "standby_size": self.standby_size,
+            "live_standby": sum(1 for c in self.standby if c.connected),
+            "restarts": self.restarts,
+            "failovers": self.failovers,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "in_flight_per_process": {c.name: c.in_flight for c in self.connections},
+            "peak_in_flight": self.peak_in_flight,
+            "total_calls": self.total_calls,
+            "queued_calls": self.queued_calls,
+            "avg_queue_time": self.total_queue_time / self.total_calls if self.total_calls else 0.0,
+            "max_queue_time": self.max_queue_time,
+        }
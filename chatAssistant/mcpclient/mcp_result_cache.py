@@ -0,0 +1,153 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _LeaderCancelled(Exception):
+    """发起调用的请求被取消，等待同一结果的请求改由其中一个重新发起"""
+
+
+class _CacheEntry:
+    __slots__ = ("name", "value", "size", "expires_at")
+
+    def __init__(self, name: str, value: Any, size: int, expires_at: float):
+        self.name = name
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+
+
+class MCPResultCache:
+    """
+    MCP工具和资源的结果缓存
+    - 以规范化后的参数作为键，参数顺序和首尾空白不影响命中
+    - 每个条目按各自的TTL过期
+    - 超过字节上限时按LRU淘汰
+    - 相同的并发请求只发出一次，其余请求等待同一个结果
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+        )
+
+    @staticmethod
+    def _canonicalize(value: Any) -> Any:
+        if isinstance(value, str):
+            return value.strip()
+        if isinstance(value, dict):
+            return {str(k): MCPResultCache._canonicalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [MCPResultCache._canonicalize(v) for v in value]
+        return value
+
+    @classmethod
+    def make_key(cls, name: str, arguments: Optional[Dict[str, Any]]) -> str:
+        """生成缓存键：名称 + 排序后的紧凑JSON参数"""
+        canonical = json.dumps(cls._canonicalize(arguments or {}), sort_keys=True,
+                               ensure_ascii=False, separators=(",", ":"), default=str)
+        return f"{name}|{canonical}"
+
+    @staticmethod
+    def _is_cacheable(value: Any) -> bool:
+        """错误结果不缓存；工具执行失败（isError）的结果由连接层转换为带 "error" 的字典"""
+        if isinstance(value, dict):
+            return "error" not in value
+        if isinstance(value, list):
+            return not any(isinstance(item, dict) and "error" in item for item in value)
+        return value is not None
+
+    async def get_or_call(self, name: str, arguments: Optional[Dict[str, Any]], ttl: float,
+                          call: Callable[[], Awaitable[Any]]) -> Any:
+        """命中则直接返回缓存结果，否则执行 call 并缓存；同键的并发请求共享一次调用"""
+        key = self.make_key(name, arguments)
+        stats = self._stats[name]
+
+        while True:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    stats["hits"] += 1
+                    return entry.value
+                self._remove(key)
+
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(pending)
+            except _LeaderCancelled:
+                # 第一个醒来的等待者成为新的发起者，其余继续等待它
+                continue
+
+        stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        # 没有等待者时也标记异常已读取，避免事件循环告警
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            value = await call()
+        except asyncio.CancelledError:
+            # 不取消共享的 future：取消会以 CancelledError 传给所有等待者
+            future.set_exception(_LeaderCancelled())
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        future.set_result(value)
+        if self._is_cacheable(value):
+            self._store(key, name, value, ttl)
+        return value
+
+    def _store(self, key: str, name: str, value: Any, ttl: float):
+        try:
+            size = len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+        except (TypeError, ValueError):
+            return
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _CacheEntry(name, value, size, time.monotonic() + ttl)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes and self._entries:
+            evicted_key, evicted = next(iter(self._entries.items()))
+            self._remove(evicted_key)
+            self._stats[evicted.name]["evictions"] += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry.size
+
+    def invalidate(self, name: Optional[str] = None):
+        """清除指定工具/资源的缓存，name 为空时清除全部"""
+        for key in [k for k, e in self._entries.items() if name is None or e.name == name]:
+            self._remove(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取按工具/资源统计的命中情况和缓存占用"""
+        per_name = {}
+        for name, stats in self._stats.items():
+            lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+            per_name[name] = dict(stats, hit_rate=(stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0)
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "per_name": per_name,
+        }
@@ -0,0 +1,49 @@
+import asyncio
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MCPSupervisor:
+    """MCP连接监督器：定期健康检查，淘汰崩溃或无响应的进程，由热备进程顶替并后台重启"""
+
+    def __init__(self, client, interval: float = 15, ping_timeout: float = 2):
+        self.client = client
+        self.interval = interval
+        self.ping_timeout = ping_timeout
+        self.running = False
+        self._stop_event: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def run(self):
+        """在管理器的事件循环中运行，直到 stop 被调用"""
+        self.running = True
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        logger.info(f"MCP连接监督器已启动，检查间隔: {self.interval}秒")
+        while self.running:
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self.interval)
+                break
+            except asyncio.TimeoutError:
+                pass
+            await self.check_all()
+        logger.info("MCP连接监督器已停止")
+
+    async def check_all(self):
+        """对所有已建立的连接池执行一次健康检查"""
+        for server_name, pool in list(self.client.connections.items()):
+            try:
+                await pool.health_check(self.ping_timeout)
+                if not pool.connected:
+                    logger.warning(f"服务器 {server_name} 暂无可用进程，正在重启")
+            except Exception as e:
+                logger.error(f"检查服务器 {server_name} 健康状态时出错: {str(e)}")
+
+    def stop(self):
+        """通知监督器退出（线程安全）"""
+        self.running = False
+        loop = self._loop
+        if self._stop_event is not None and loop and not loop.is_closed():
+            loop.call_soon_threadsafe(self._stop_event.set)
@@ -2,9 +2,9 @@ import asyncio
 import io
 import json
 import sqlite3
+import time
 from typing import List
 
-import pandas as pd
 from dotenv import load_dotenv
 from mcp import types
 from mcp.server import Server as McpServer
@@ -21,17 +21,69 @@ load_dotenv()
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from QwenEmbeddings import QwenEmbeddings
+from mcpserver.dataframe_cache import DataFrameCache
+from mcpserver.report_manifest import ReportManifest
+from mcpserver.sales_aggregation import (
+    SalesAggregator, classify_sales_question, parse_date_range, TOP_CUSTOMERS, MONTHLY_TREND, TOTALS
+)
+from mcpserver.sales_mirror import LocalSalesMirror
+from mcpserver.periods import parse_period, compare_values, MONTH
+from mcpserver.period_rollup import PeriodRollup, build_rollup_tables
+from mcpserver.tool_executor import ToolExecutor
+from mcpserver.hybrid_search import HybridSearcher, SEARCH_MODES
+from mcpserver.resource_paging import PageRequest, parse_resource_uri, paginate_frame, fetch_table_page, \
+    encode_page, encode_rows
+
+INCOME_STATEMENT_PATH = "./financial_reports/income_statement.xlsx"
 
 class FinancialMCPServer:
     def __init__(self):
         self.app = McpServer("financial-data-server")
-        self.excel_files = {}  # Cache for Excel data
+        # 阻塞I/O走线程池、pandas计算走进程池，并按工具限制并发（FINANCIAL_TOOL_CONCURRENCY）
+        self.executors = ToolExecutor.from_env()
+        # Excel数据缓存，内存上限可通过 FINANCIAL_DF_CACHE_MB 配置
+        self.excel_files = DataFrameCache(
+            max_bytes=int(os.getenv("FINANCIAL_DF_CACHE_MB", "256")) * 1024 * 1024,
+            watch_interval=float(os.getenv("FINANCIAL_DF_WATCH_INTERVAL", "30")),
+            executor=self.executors.io_pool
+        )
+        # 报表清单索引，摘要资源只需stat比对，不再逐个打开工作簿
+        self.report_manifest = ReportManifest("./financial_reports")
+
+        # 数据库结构缓存: (过期时间, JSON字符串)
+        self.schema_ttl = float(os.getenv("FINANCIAL_SCHEMA_TTL", "300"))
+        self._schema_cache = None
+        self._schema_lock = asyncio.Lock()
 
         # 初始化Supabase客户端
         self.supabase_url = os.getenv("SUPABASE_URL")
         self.supabase_key = os.getenv("SUPABASE_KEY")
         self.supabase = create_client(self.supabase_url,
                                       self.supabase_key) if self.supabase_url and self.supabase_key else None
+        self.sales_aggregator = SalesAggregator(self.supabase)
+        # 本地分析镜像，SALES_MIRROR_ENABLED=0 时关闭，直接查询Supabase
+        self.sales_mirror = None
+        if self.supabase and os.getenv("SALES_MIRROR_ENABLED", "1") != "0":
+            try:
+                self.sales_mirror = LocalSalesMirror(
+                    self.supabase,
+                    db_path=os.getenv("SALES_MIRROR_PATH", "./.mirror/sales_mirror.db"),
+                    max_staleness=float(os.getenv("SALES_MIRROR_MAX_STALENESS", "300"))
+                )
+            except Exception as e:
+                print(f"本地镜像初始化失败，使用远端查询: {e}", file=sys.stderr)
+        if self.sales_mirror is not None:
+            # 首次全量同步在后台进行，期间由远端聚合器应答
+            self.sales_mirror.start_background_sync()
+
+        # 文档混合检索：向量与关键词并发，共用一个期限
+        # 默认比客户端的 call_timeout（3秒，含排队和传输）少1秒，某一路检索卡住时已就绪的结果仍能及时送达
+        self.search_deadline = float(os.getenv("FINANCIAL_SEARCH_DEADLINE", "2"))
+        self.hybrid_searcher = HybridSearcher(self.supabase, self.executors.run_io, real_question_embedding)
+
+        # 月/季/年汇总立方体，镜像或利润表变化后重算
+        self.period_rollup = PeriodRollup()
+        self._rollup_lock = asyncio.Lock()
 
         self.setup_handlers()
 
@@ -52,13 +104,13 @@ class FinancialMCPServer:
                 types.Resource(
                     uri="supabase://documents",
                     name="Supabase Documents",
-                    description="Document embeddings stored in Supabase",
+                    description="Document embeddings stored in Supabase (paged: ?limit=&columns=&cursor=)",
                     mimeType="application/json"
                 ),
                 types.Resource(
                     uri="supabase://financial-data",
                     name="Financial Data in Supabase",
-                    description="Financial records stored in Supabase database",
+                    description="Financial records stored in Supabase database (paged: ?limit=&columns=&cursor=)",
                     mimeType="application/json"
                 ),
                 types.Resource(
@@ -70,13 +122,19 @@ class FinancialMCPServer:
                 types.Resource(
                     uri="financial://reports/balance-sheet",
                     name="Balance Sheet Data",
-                    description="Latest balance sheet information",
+                    description="Latest balance sheet information (paged: ?limit=&columns=&cursor=)",
                     mimeType="application/json"
                 ),
                 types.Resource(
                     uri="financial://reports/income-statement",
                     name="Income Statement Data",
-                    description="Profit and loss information",
+                    description="Profit and loss information (paged: ?limit=&columns=&cursor=)",
+                    mimeType="application/json"
+                ),
+                types.Resource(
+                    uri="financial://server/metrics",
+                    name="Server Execution Metrics",
+                    description="Per-tool concurrency, queue time and run time",
                     mimeType="application/json"
                 )
             ]
@@ -85,19 +143,23 @@ class FinancialMCPServer:
         async def read_resource(uri: str) -> str:
             """Read financial data resources"""
             try:
+                # 查询参数（cursor/limit/columns）用于分页资源
+                uri, page = parse_resource_uri(uri)
                 if uri == "financial://reports/summary":
                     return await self.get_reports_summary()
                 elif uri == "financial://database/schema":
                     return await self.get_database_schema()
                 elif uri == "financial://reports/balance-sheet":
-                    return await self.get_balance_sheet_data()
+                    return await self.get_balance_sheet_data(page)
                 elif uri == "financial://reports/income-statement":
-                    return await self.get_income_statement_data()
+                    return await self.get_income_statement_data(page)
                 # 处理Supabase资源
                 elif uri == "supabase://documents":
-                    return await self.get_supabase_documents()
+                    return await self.get_supabase_documents(page)
                 elif uri == "supabase://financial-data":
-                    return await self.get_supabase_financial_data()
+                    return await self.get_supabase_financial_data(page)
+                elif uri == "financial://server/metrics":
+                    return json.dumps(self.executors.get_stats())
                 else:
                     return json.dumps({"error": "Resource not found"})
             except Exception as e:
@@ -148,6 +210,11 @@ class FinancialMCPServer:
                             "filters": {
                                 "type": "object",
                                 "description": "Additional filters (customer, product, region, etc.)"
+                            },
+                            "force_refresh": {
+                                "type": "boolean",
+                                "default": False,
+                                "description": "Sync the local mirror before querying, ignoring the staleness budget"
                             }
                         },
                         "required": ["question"]
@@ -191,6 +258,11 @@ class FinancialMCPServer:
                                 "type": "string",
                                 "enum": ["absolute", "percentage", "trend"],
                                 "default": "percentage"
+                            },
+                            "force_refresh": {
+                                "type": "boolean",
+                                "default": False,
+                                "description": "Sync the local mirror before comparing, ignoring the staleness budget"
                             }
                         },
                         "required": ["metric", "periods"]
@@ -210,6 +282,16 @@ class FinancialMCPServer:
                             "table": {
                                 "type": "string",
                                 "description": "Specific table to query in Supabase"
+                            },
+                            "search_mode": {
+                                "type": "string",
+                                "enum": list(SEARCH_MODES),
+                                "default": "hybrid",
+                                "description": "Document search: vector + keyword fused by rank (hybrid), or a single method"
+                            },
+                            "deadline": {
+                                "type": "number",
+                                "description": "Seconds to wait for searches; results ready by then are returned"
                             }
                         },
                         "required": ["question"]
@@ -259,38 +341,40 @@ class FinancialMCPServer:
             sys.stderr.flush()
             
             try:
-                if name == "query_financial_data":
-                    print("执行: query_financial_data", file=sys.stderr)
-                    result = await self.query_financial_data(arguments)
-                elif name == "query_sales_data":
-                    print("执行: query_sales_data", file=sys.stderr)
-                    result = await self.query_sales_data(arguments)
-                elif name == "generate_financial_report":
-                    print("执行: generate_financial_report", file=sys.stderr)
-                    result = await self.generate_financial_report(arguments)
-                elif name == "compare_periods":
-                    print("执行: compare_periods", file=sys.stderr)
-                    result = await self.compare_periods(arguments)
-                elif name == "query_supabase_data":
-                    result = await self.query_supabase_data(arguments)
-                elif name == "test_tool":
-                    result = await self.test_tool(arguments)
-                # 添加一个演示工具和资源联系的工具
-                elif name == "get_resource_summary":
-                    # 演示：工具内部调用 read_resource 方法
-                    print("执行: get_resource_summary - 演示工具调用资源", file=sys.stderr)
-                    # 直接调用 read_resource 处理器中使用的方法
-                    reports_summary = await self.get_reports_summary()
-                    schema_info = await self.get_database_schema()
-                    result = {
-                        "message": "工具成功调用了资源数据",
-                        "reports_summary": json.loads(reports_summary),
-                        "database_schema": json.loads(schema_info),
-                        "note": "这展示了工具如何访问和资源相同的底层数据"
-                    }
-                else:
-                    print(f"未知工具: {name}", file=sys.stderr)
-                    result = {"error": "Unknown tool"}
+                # 每个工具独立限流，慢工具排队不会占满其他工具的名额
+                async with self.executors.limit(name):
+                    if name == "query_financial_data":
+                        print("执行: query_financial_data", file=sys.stderr)
+                        result = await self.query_financial_data(arguments)
+                    elif name == "query_sales_data":
+                        print("执行: query_sales_data", file=sys.stderr)
+                        result = await self.query_sales_data(arguments)
+                    elif name == "generate_financial_report":
+                        print("执行: generate_financial_report", file=sys.stderr)
+                        result = await self.generate_financial_report(arguments)
+                    elif name == "compare_periods":
+                        print("执行: compare_periods", file=sys.stderr)
+                        result = await self.compare_periods(arguments)
+                    elif name == "query_supabase_data":
+                        result = await self.query_supabase_data(arguments)
+                    elif name == "test_tool":
+                        result = await self.test_tool(arguments)
+                    # 添加一个演示工具和资源联系的工具
+                    elif name == "get_resource_summary":
+                        # 演示：工具内部调用 read_resource 方法
+                        print("执行: get_resource_summary - 演示工具调用资源", file=sys.stderr)
+                        # 直接调用 read_resource 处理器中使用的方法
+                        reports_summary = await self.get_reports_summary()
+                        schema_info = await self.get_database_schema()
+                        result = {
+                            "message": "工具成功调用了资源数据",
+                            "reports_summary": json.loads(reports_summary),
+                            "database_schema": json.loads(schema_info),
+                            "note": "这展示了工具如何访问和资源相同的底层数据"
+                        }
+                    else:
+                        print(f"未知工具: {name}", file=sys.stderr)
+                        result = {"error": "Unknown tool"}
 
                 print(f"工具执行结果: {result}", file=sys.stderr)
                 sys.stderr.flush()
@@ -302,43 +386,32 @@ class FinancialMCPServer:
                 return [types.TextContent(type="text", text=f"Error: {str(e)}")]
 
     # 添加Supabase相关方法
-    async def get_supabase_documents(self) -> str:
-        """获取Supabase中存储的文档"""
+    async def get_supabase_documents(self, page: PageRequest = None) -> str:
+        """获取Supabase中存储的文档（按id分页）"""
+        return await self._read_table_page("testdoc", "documents", page, "id, content, metadata", unpaged_limit=10)
+
+    async def get_supabase_financial_data(self, page: PageRequest = None) -> str:
+        """获取Supabase中存储的财务数据（按id分页）"""
+        # 假设财务数据存储在financial_data表中
+        return await self._read_table_page("financial_data", "financial_data", page, "*", unpaged_limit=20)
+
+    async def _read_table_page(self, table: str, rows_key: str, page: PageRequest, default_columns: str,
+                               unpaged_limit: int) -> str:
+        """带分页参数时返回一页及 next_cursor；不带时保持原有结构 {rows_key: 前 unpaged_limit 行, count}"""
         try:
             if not self.supabase:
                 return json.dumps({"error": "Supabase client not initialized. Check your environment variables."})
 
-            # 从testdoc表获取数据，限制返回前10条记录
-            response = self.supabase.table("testdoc").select("id, content, metadata").limit(10).execute()
-
-            if hasattr(response, 'data'):
-                return json.dumps({
-                    "documents": response.data,
-                    "count": len(response.data)
-                })
-            else:
-                return json.dumps({"error": "Failed to fetch documents from Supabase"})
-        except Exception as e:
-            return json.dumps({"error": f"Error fetching Supabase documents: {str(e)}"})
-
-    async def get_supabase_financial_data(self) -> str:
-        """获取Supabase中存储的财务数据"""
-        try:
-            if not self.supabase:
-                return json.dumps({"error": "Supabase client not initialized. Check your environment variables."})
-
-            # 假设财务数据存储在financial_data表中
-            response = self.supabase.table("financial_data").select("*").limit(20).execute()
-
-            if hasattr(response, 'data'):
-                return json.dumps({
-                    "financial_data": response.data,
-                    "count": len(response.data)
-                })
-            else:
-                return json.dumps({"error": "Failed to fetch financial data from Supabase"})
+            paged = page is not None and page.paged
+            request = page if paged else PageRequest(limit=unpaged_limit)
+            rows, next_cursor = await self.executors.run_io(
+                fetch_table_page, self.supabase, table, request, default_columns
+            )
+            meta = {"count": len(rows), "limit": request.limit, "next_cursor": next_cursor} if paged \
+                else {"count": len(rows)}
+            return await self.executors.run_io(encode_page, rows_key, rows, meta)
         except Exception as e:
-            return json.dumps({"error": f"Error fetching financial data: {str(e)}"})
+            return json.dumps({"error": f"Error fetching {table} from Supabase: {str(e)}"})
 
     async def query_supabase_data(self, arguments: dict) -> dict:
         """处理对Supabase数据的自然语言查询"""
@@ -350,97 +423,56 @@ class FinancialMCPServer:
                 print("Supabase client not initialized!", file=sys.stderr)
                 return {"error": "Supabase client not initialized. Check your environment variables."}
 
-            # 这里可以根据问题内容构建更复杂的查询
-            # 简单示例：根据问题中的关键词过滤内容
-            keywords = question.lower().split()
-
             # 如果是文档表，可以搜索内容
             if table == "testdoc":
-                print("Processing testdoc table query", file=sys.stderr)
-                # 首先尝试向量搜索
-                try:
-                    print("Getting question embedding...", file=sys.stderr)
-                    input_embedding = get_qestion_embedding(",".join(keywords))
-                    print(f"Embedding result: {input_embedding is not None}", file=sys.stderr)
-                    sys.stderr.flush()
-                    
-                    # 检查是否是假的嵌入向量
-                    is_dummy_embedding = (input_embedding and 
-                                         len(input_embedding) == 1536 and 
-                                         all(x == 0.1 for x in input_embedding))
-                    
-                    if input_embedding and not is_dummy_embedding:
-                        # 调用Supabase的match_documents函数
-                        print("Calling Supabase RPC function...", file=sys.stderr)
-                        response = self.supabase.rpc(
-                            "match_documents",
-                            {
-                                "query_embedding": input_embedding,
-                                "match_threshold": 0.3,  # 可调整的相似度阈值
-                                "match_count": 3,
-                                "table_name": "testdoc"
-                            }
-                        ).execute()
-                        print(f"Supabase response: {response}", file=sys.stderr)
-                        sys.stderr.flush()
-                        
-                        result = [doc['content'] for doc in response.data]
-                        print(f"Extracted content from vector search: {result}", file=sys.stderr)
-                        
-                        if result:  # 如果向量搜索有结果
-                            return {
-                                "question1": question,
-                                "results": result,
-                                "total_matches": len(result),
-                                "search_method": "vector_search"
-                            }
-                    
-                except Exception as vector_error:
-                    print(f"Vector search failed: {vector_error}", file=sys.stderr)
-                
-                # 如果向量搜索失败或没有结果，使用简单文本搜索
-                print("Falling back to simple text search...", file=sys.stderr)
+                mode = arguments.get("search_mode", "hybrid")
+                if mode not in SEARCH_MODES:
+                    return {"error": f"Unknown search_mode: {mode}"}
+                deadline = float(arguments.get("deadline") or self.search_deadline)
+                print(f"Running {mode} search on testdoc (deadline {deadline}s)", file=sys.stderr)
+                search = await self.hybrid_searcher.search(question, table, SEARCH_MODES[mode], deadline)
+                print(f"Search sources: {search['sources']}", file=sys.stderr)
+
+                matches = search["matches"]
+                if matches:
+                    return {
+                        "question1": question,
+                        "results": [match["content"] for match in matches],
+                        "matches": matches,
+                        "total_matches": len(matches),
+                        "search_method": mode,
+                        "sources": search["sources"],
+                        "elapsed_ms": search["elapsed_ms"]
+                    }
+
+                # 如果没有找到匹配的内容，返回一些示例数据
+                print("No matches found, fetching sample data...", file=sys.stderr)
                 try:
-                    # 使用 ilike 进行模糊文本搜索
-                    search_term = f"%{question}%"
-                    response = self.supabase.table(table).select("*").ilike("content", search_term).limit(5).execute()
-                    
+                    response = await self.executors.run_io(self.supabase.table(table).select("*").limit(3).execute)
                     if response.data:
-                        result = [doc['content'] for doc in response.data]
-                        print(f"Extracted content from text search: {result}", file=sys.stderr)
+                        result = [doc.get('content', str(doc)) for doc in response.data]
                         return {
                             "question1": question,
                             "results": result,
                             "total_matches": len(result),
-                            "search_method": "text_search"
+                            "search_method": "sample_data",
+                            "sources": search["sources"],
+                            "note": "No specific matches found, showing sample data"
                         }
-                    else:
-                        # 如果没有找到匹配的内容，返回一些示例数据
-                        print("No matches found, fetching sample data...", file=sys.stderr)
-                        response = self.supabase.table(table).select("*").limit(3).execute()
-                        if response.data:
-                            result = [doc.get('content', str(doc)) for doc in response.data]
-                            return {
-                                "question1": question,
-                                "results": result,
-                                "total_matches": len(result),
-                                "search_method": "sample_data",
-                                "note": "No specific matches found, showing sample data"
-                            }
-                            
-                except Exception as text_search_error:
-                    print(f"Text search also failed: {text_search_error}", file=sys.stderr)
-                    
+                except Exception as sample_error:
+                    print(f"Sample query failed: {sample_error}", file=sys.stderr)
+
                 return {
                     "question1": question,
                     "results": [],
                     "total_matches": 0,
+                    "sources": search["sources"],
                     "error": "Both vector and text search failed"
                 }
             else:
                 print(f"Processing other table: {table}", file=sys.stderr)
                 # 对于其他表，返回前几条记录
-                response = self.supabase.table(table).select("*").limit(5).execute()
+                response = await self.executors.run_io(self.supabase.table(table).select("*").limit(5).execute)
 
                 if hasattr(response, 'data'):
                     return {
@@ -459,38 +491,25 @@ class FinancialMCPServer:
 
     # 保留原有方法...
     async def load_excel_data(self, file_path: str, sheet_name: str = None):
-        """Load Excel data with caching"""
-        cache_key = f"{file_path}:{sheet_name}"
-        if cache_key not in self.excel_files:
-            if sheet_name:
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
-            else:
-                df = pd.read_excel(file_path)
-            self.excel_files[cache_key] = df
-        return self.excel_files[cache_key]
+        """Load Excel data with caching (validated by file mtime/size)"""
+        return await self.excel_files.get(file_path, sheet_name)
 
     async def get_reports_summary(self) -> str:
         """Get summary of available financial reports"""
-        # Scan for Excel files in reports directory
-        reports_dir = "./financial_reports"  # Adjust path
+        # 清单按stat差异增量更新，只有变化的工作簿才需要解析
+        entries = await self.executors.run_io(self.report_manifest.refresh)
         available_reports = []
-
-        if os.path.exists(reports_dir):
-            for file in os.listdir(reports_dir):
-                if file.endswith(('.xlsx', '.xls')):
-                    # Get basic info about each Excel file
-                    try:
-                        xl_file = pd.ExcelFile(os.path.join(reports_dir, file))
-                        available_reports.append({
-                            "filename": file,
-                            "sheets": xl_file.sheet_names,
-                            "last_modified": os.path.getmtime(os.path.join(reports_dir, file))
-                        })
-                    except Exception as e:
-                        available_reports.append({
-                            "filename": file,
-                            "error": str(e)
-                        })
+        for entry in entries:
+            if "error" in entry:
+                available_reports.append({"filename": entry["filename"], "error": entry["error"]})
+            else:
+                available_reports.append({
+                    "filename": entry["filename"],
+                    "sheets": entry["sheets"],
+                    "row_counts": entry["row_counts"],
+                    "size": entry["size"],
+                    "last_modified": entry["last_modified"]
+                })
 
         return json.dumps({
             "available_reports": available_reports,
@@ -498,36 +517,57 @@ class FinancialMCPServer:
         })
 
     async def get_database_schema(self) -> str:
-        """Get database schema information from Supabase"""
+        """Get database schema information from Supabase (one query, cached with a TTL)"""
         if not self.supabase:
             return json.dumps({"error": "Supabase client not initialized. Check your environment variables."})
 
+        # 并发读取时只查询一次
+        async with self._schema_lock:
+            if self._schema_cache and self._schema_cache[0] > time.monotonic():
+                return self._schema_cache[1]
+            try:
+                rows = await self.executors.run_io(self._fetch_schema_columns)
+                schema_info = {}
+                for row in rows:
+                    schema_info.setdefault(row["table_name"], []).append({
+                        "name": row["column_name"],
+                        "type": row["data_type"],
+                        "nullable": row["is_nullable"] == "YES"
+                    })
+                result = json.dumps(schema_info)
+                self._schema_cache = (time.monotonic() + self.schema_ttl, result)
+                return result
+            except Exception as e:
+                return json.dumps({"error": f"Error fetching schema from Supabase: {str(e)}"})
+
+    def _fetch_schema_columns(self) -> list:
+        """
+        一次请求取回 public 下所有表的字段信息，优先调用RPC函数:
+
+            create or replace function get_public_schema()
+            returns table (table_name text, column_name text, data_type text, is_nullable text)
+            language sql stable as $$
+                select c.table_name::text, c.column_name::text, c.data_type::text, c.is_nullable::text
+                from information_schema.columns c
+                where c.table_schema = 'public'
+                order by c.table_name, c.ordinal_position
+            $$;
+
+        RPC不存在时退化为对 information_schema.columns 的单次查询
+        """
         try:
-            # 查询所有表名
-            response = self.supabase.table("information_schema.tables") \
-                .select("table_name") \
-                .eq("table_schema", "public") \
-                .execute()
-            tables = [row["table_name"] for row in response.data]
-
-            schema_info = {}
-            for table_name in tables:
-                # 查询每个表的字段信息
-                col_response = self.supabase.table("information_schema.columns") \
-                    .select("column_name,data_type,is_nullable") \
-                    .eq("table_name", table_name) \
-                    .execute()
-                schema_info[table_name] = [
-                    {
-                        "name": col["column_name"],
-                        "type": col["data_type"],
-                        "nullable": col["is_nullable"] == "YES"
-                    }
-                    for col in col_response.data
-                ]
-            return json.dumps(schema_info)
+            return self.supabase.rpc("get_public_schema", {}).execute().data
         except Exception as e:
-            return json.dumps({"error": f"Error fetching schema from Supabase: {str(e)}"})
+            print(f"get_public_schema RPC unavailable, querying information_schema directly: {e}", file=sys.stderr)
+            return self.supabase.table("information_schema.columns") \
+                .select("table_name,column_name,data_type,is_nullable") \
+                .eq("table_schema", "public") \
+                .order("table_name") \
+                .execute().data
+
+    def invalidate_schema_cache(self):
+        """表结构变化后调用，下一次读取会重新查询"""
+        self._schema_cache = None
 
     async def query_financial_data(self, arguments: dict) -> dict:
         """Process natural language queries for financial data"""
@@ -537,12 +577,8 @@ class FinancialMCPServer:
 
         # This is where you'd integrate with an LLM to interpret the question
         # For now, providing a structured approach
-
-        # Example: Load balance sheet data
+        # 各分支按需读取数据，不再预先加载用不到的资产负债表
         try:
-            if report_type in ["balance_sheet", "all"]:
-                balance_sheet = await self.load_excel_data("./financial_reports/balance_sheet.xlsx")
-
             # Simple keyword-based analysis (you'd replace this with LLM processing)
             if "revenue" in question.lower():
                 # Extract revenue data
@@ -572,53 +608,43 @@ class FinancialMCPServer:
             return {"error": "Supabase client not initialized. Check your environment variables."}
 
         try:
-            query = self.supabase.table("sales_orders").select("*")
-            # 处理日期范围
-            if date_range:
-                # 假设 date_range 是 "2023-01-01,2023-12-31"
-                if "," in date_range:
-                    start, end = date_range.split(",")
-                    query = query.gte("order_date", start).lte("order_date", end)
-                else:
-                    query = query.gte("order_date", date_range)
-            # 处理其他过滤条件
-            for key, value in filters.items():
-                query = query.eq(key, value)
-            response = query.execute()
-            df = pd.DataFrame(response.data)
-
-            # 分析逻辑
-            if not df.empty:
-                if "top" in question.lower() and "customer" in question.lower():
-                    if 'customer_name' in df.columns and 'total_amount' in df.columns:
-                        top_customers = df.groupby('customer_name')['total_amount'].sum().sort_values(ascending=False).head(10)
-                        return {
-                            "question": question,
-                            "analysis": "Top customers by sales volume",
-                            "results": top_customers.to_dict()
-                        }
-                elif "monthly" in question.lower() or "trend" in question.lower():
-                    if 'order_date' in df.columns and 'total_amount' in df.columns:
-                        monthly_sales = df.groupby(pd.to_datetime(df['order_date']).dt.to_period('M'))['total_amount'].sum()
-                        return {
-                            "question": question,
-                            "analysis": "Monthly sales trend",
-                            "results": {str(k): float(v) for k, v in monthly_sales.items()}
-                        }
+            # 镜像可用时在本地聚合，否则聚合下推到数据库端，只传回结果行
+            analysis = classify_sales_question(question)
+            start, end = parse_date_range(date_range)
+            aggregator = await self._sales_backend(arguments.get("force_refresh", False))
+            aggregated = await self.executors.run_io(aggregator.aggregate, analysis, start, end, filters)
+
+            if analysis == TOP_CUSTOMERS and aggregated["results"]:
                 return {
                     "question": question,
-                    "total_records": len(df),
-                    "total_sales": float(df['total_amount'].sum()) if 'total_amount' in df.columns else "N/A",
-                    "date_range": f"{df['order_date'].min()} to {df['order_date'].max()}" if 'order_date' in df.columns else "N/A"
+                    "analysis": "Top customers by sales volume",
+                    "results": aggregated["results"],
+                    "source": aggregated["source"]
                 }
-            else:
+            if analysis == MONTHLY_TREND and aggregated["results"]:
                 return {
                     "question": question,
-                    "total_records": 0,
-                    "total_sales": 0,
-                    "date_range": "N/A",
-                    "note": "No records found for the given query."
+                    "analysis": "Monthly sales trend",
+                    "results": aggregated["results"],
+                    "source": aggregated["source"]
                 }
+            if analysis != TOTALS:
+                aggregated = await self.executors.run_io(aggregator.aggregate, TOTALS, start, end, filters)
+            if aggregated["total_records"]:
+                return {
+                    "question": question,
+                    "total_records": aggregated["total_records"],
+                    "total_sales": aggregated["total_sales"],
+                    "date_range": f"{aggregated['min_date']} to {aggregated['max_date']}",
+                    "source": aggregated["source"]
+                }
+            return {
+                "question": question,
+                "total_records": 0,
+                "total_sales": 0,
+                "date_range": "N/A",
+                "note": "No records found for the given query."
+            }
         except Exception as e:
             return {"error": f"Error querying sales data from Supabase: {str(e)}"}
 
@@ -641,55 +667,183 @@ class FinancialMCPServer:
             ]
         }
 
+    async def _sales_backend(self, force_refresh: bool = False):
+        """
+        镜像就绪时按新鲜度预算增量同步并返回镜像；未就绪时在后台继续同步，本次返回远端聚合器，
+        首次全量同步不会占用工具调用的期限
+        """
+        if self.sales_mirror is None:
+            return self.sales_aggregator
+        if not self.sales_mirror.is_ready():
+            self.sales_mirror.start_background_sync()
+            return self.sales_aggregator
+        await self.executors.run_io(self.sales_mirror.ensure_fresh, force_refresh)
+        return self.sales_mirror
+
+    async def _ensure_rollup(self, force_refresh: bool = False):
+        """
+        数据源版本变化时重建期间汇总立方体，返回 (立方体, 本次选用的销售数据源)
+        镜像版本取自共享镜像文件的同步状态，其他服务进程完成的同步同样触发重建
+        数据源为远端聚合器时（未启用镜像或镜像未就绪）立方体中没有销售指标
+        """
+        backend = await self._sales_backend(force_refresh)
+        mirror = self.sales_mirror if backend is self.sales_mirror else None
+        try:
+            stat = os.stat(INCOME_STATEMENT_PATH)
+            income_version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            income_version = None
+        mirror_version = await self.executors.run_io(mirror.data_version) if mirror else None
+        version = (mirror_version, income_version)
+
+        async with self._rollup_lock:
+            if self.period_rollup.is_current(version):
+                return self.period_rollup, backend
+            sales_monthly = await self.executors.run_io(mirror.monthly_totals) if mirror else None
+            income_statement = None
+            if income_version is not None:
+                try:
+                    income_statement = await self.load_excel_data(INCOME_STATEMENT_PATH)
+                except Exception as e:
+                    print(f"利润表加载失败，汇总中不含利润指标: {e}", file=sys.stderr)
+            rebuild_start = time.time()
+            # groupby/resample 是CPU密集计算，在进程池中构建后换入
+            tables = await self.executors.run_cpu(build_rollup_tables, sales_monthly, income_statement)
+            self.period_rollup.replace(version, tables)
+            print(f"期间汇总已重建，指标: {self.period_rollup.metrics}，"
+                  f"耗时 {time.time() - rebuild_start:.2f}秒", file=sys.stderr)
+        return self.period_rollup, backend
+
     async def compare_periods(self, arguments: dict) -> dict:
         """Compare data across time periods"""
         metric = arguments["metric"]
         periods = arguments["periods"]
         analysis_type = arguments.get("analysis_type", "percentage")
 
-        return {
-            "metric": metric,
-            "periods": periods,
-            "analysis_type": analysis_type,
-            "status": "Period comparison would be implemented here"
-        }
+        parsed = []
+        for label in periods:
+            period = parse_period(label)
+            if period is None:
+                return {"error": f"无法识别的期间: {label}"}
+            parsed.append(period)
+        # 按开始日期排序，比较结果总是从早到晚
+        parsed.sort(key=lambda period: period[2])
+        keys = [period[1] for period in parsed]
+
+        try:
+            rollup, backend = await self._ensure_rollup(arguments.get("force_refresh", False))
+            resolved = rollup.resolve_metric(metric)
+            if resolved is not None:
+                # 立方体查表，代价只与期间数有关
+                values = rollup.values_for(resolved, [(grain, key) for grain, key, _, _ in parsed])
+                source = "rollup"
+            elif self.supabase and backend is self.sales_aggregator:
+                # 镜像未启用或未就绪时逐期间在数据库端汇总销售额
+                resolved = "order_count" if any(k in metric.lower() for k in ("volume", "count", "订单数", "单量")) \
+                    else "sales_amount"
+                values = []
+                for _, _, start, end in parsed:
+                    totals = await self.executors.run_io(
+                        self.sales_aggregator.aggregate, TOTALS, start.isoformat(), end.isoformat(), {}
+                    )
+                    values.append(totals["total_records"] if resolved == "order_count" else totals["total_sales"])
+                source = "supabase"
+            else:
+                return {"error": f"不支持的指标: {metric}", "available_metrics": rollup.metrics}
+
+            result = {
+                "metric": metric,
+                "resolved_metric": resolved,
+                "periods": keys,
+                "analysis_type": analysis_type,
+                "values": dict(zip(keys, values)),
+                "source": source
+            }
+            result.update(compare_values(keys, values, analysis_type))
+            return result
+        except Exception as e:
+            return {"error": f"Error comparing periods: {str(e)}"}
+
+    def _period_window(self, time_period: str = None):
+        """把时间段解析为 (粒度, 截止键)，无法解析时取最近12个月"""
+        period = parse_period(time_period) if time_period else None
+        return (period[0], period[1]) if period else (MONTH, None)
 
     async def analyze_revenue(self, question: str, time_period: str = None) -> dict:
         """Analyze revenue-related questions"""
-        # Placeholder for revenue analysis logic
-        return {
+        rollup, _ = await self._ensure_rollup()
+        metric = rollup.resolve_metric("revenue")
+        if metric is None:
+            return {"analysis_type": "Revenue Analysis", "question": question,
+                    "error": "没有可用的收入数据（需要销售镜像或利润表）"}
+
+        grain, end_key = self._period_window(time_period)
+        series = rollup.series(metric, grain, end_key)
+        keys = list(series)
+        result = {
             "analysis_type": "Revenue Analysis",
             "question": question,
             "time_period": time_period,
-            "results": "Revenue analysis results would be calculated here"
+            "metric": metric,
+            "grain": grain,
+            "results": series
         }
+        result.update(compare_values(keys, list(series.values()), "trend"))
+        return result
 
     async def analyze_profitability(self, question: str, time_period: str = None) -> dict:
         """Analyze profitability-related questions"""
-        # Placeholder for profitability analysis logic
-        return {
+        rollup, _ = await self._ensure_rollup()
+        metrics = [m for m in ("revenue", "gross_profit", "net_profit", "gross_margin", "net_margin")
+                   if m in rollup.metrics]
+        if not any(m in metrics for m in ("gross_profit", "net_profit")):
+            return {"analysis_type": "Profitability Analysis", "question": question,
+                    "error": "利润表中未找到利润指标", "available_metrics": rollup.metrics}
+
+        grain, end_key = self._period_window(time_period)
+        results = {metric: rollup.series(metric, grain, end_key) for metric in metrics}
+        profit_metric = "net_profit" if "net_profit" in results else "gross_profit"
+        series = results[profit_metric]
+        analysis = {
             "analysis_type": "Profitability Analysis",
             "question": question,
             "time_period": time_period,
-            "results": "Profitability analysis results would be calculated here"
+            "grain": grain,
+            "results": results
         }
+        analysis.update(compare_values(list(series), list(series.values()), "trend"))
+        return analysis
 
-    async def get_balance_sheet_data(self) -> str:
+    async def get_balance_sheet_data(self, page: PageRequest = None) -> str:
         """Get latest balance sheet data"""
         try:
-            df = await self.load_excel_data("./financial_reports/balance_sheet.xlsx")
-            return df.to_json(orient='records')
+            return await self._read_report_page("./financial_reports/balance_sheet.xlsx", page)
         except Exception as e:
             return json.dumps({"error": f"Could not load balance sheet: {str(e)}"})
 
-    async def get_income_statement_data(self) -> str:
+    async def get_income_statement_data(self, page: PageRequest = None) -> str:
         """Get latest income statement data"""
         try:
-            df = await self.load_excel_data("./financial_reports/income_statement.xlsx")
-            return df.to_json(orient='records')
+            return await self._read_report_page(INCOME_STATEMENT_PATH, page)
         except Exception as e:
             return json.dumps({"error": f"Could not load income statement: {str(e)}"})
 
+    async def _read_report_page(self, file_path: str, page: PageRequest = None) -> str:
+        """读取报表的一页，游标绑定文件版本（mtime和大小）；不带分页参数时返回完整的记录数组"""
+        stat = os.stat(file_path)
+        version = f"{stat.st_mtime_ns}-{stat.st_size}"
+        df = await self.load_excel_data(file_path)
+        if page is None or not page.paged:
+            return await self.executors.run_io(encode_rows, df)
+        rows, next_cursor = paginate_frame(df, page, version)
+        meta = {
+            "columns": [str(c) for c in rows.columns],
+            "total_rows": len(df),
+            "limit": page.limit,
+            "next_cursor": next_cursor
+        }
+        return await self.executors.run_io(encode_page, "rows", rows, meta)
+
     async def test_tool(self, arguments: dict) -> dict:
         """A simple test tool to verify MCP connection"""
         message = arguments["message"]
@@ -757,8 +911,12 @@ class FinancialMCPServer:
         return analysis_result
 
 
+_embeddings = None
+
+
 def get_qestion_embedding(question):
     """获取问题的嵌入向量"""
+    global _embeddings
     try:
         # 初始化嵌入模型
         api_key = os.getenv("TEXT-EMBEDDING-V1_KEY")
@@ -766,15 +924,24 @@ def get_qestion_embedding(question):
             print("TEXT-EMBEDDING-V1_KEY not found, using dummy embedding", file=sys.stderr)
             return [0.1] * 1536
             
-        embeddings = QwenEmbeddings(api_key, "https://dashscope.aliyuncs.com/compatible-mode/v1")
-        # 初始化向量存储
-        question_embedding = embeddings._get_embedding(question)
+        # 嵌入模型只初始化一次，重复的问题命中嵌入缓存
+        if _embeddings is None:
+            _embeddings = QwenEmbeddings(api_key, "https://dashscope.aliyuncs.com/compatible-mode/v1")
+        question_embedding = _embeddings._get_embedding(question)
         return question_embedding
     except Exception as e:
         print(f"Error in get_qestion_embedding: {e}", file=sys.stderr)
         # 返回假的嵌入向量作为备选
         return [0.1] * 1536
 
+
+def real_question_embedding(question):
+    """获取问题的嵌入向量，只能得到占位向量时返回None"""
+    embedding = get_qestion_embedding(question)
+    if embedding and len(embedding) == 1536 and all(x == 0.1 for x in embedding):
+        return None
+    return embedding
+
 # Server startup
 async def main():
     print("启动 Financial MCP 服务器...")
@@ -785,11 +952,14 @@ async def main():
     print("开始监听 stdio 连接...")
     async with stdio_server() as (read_stream, write_stream):
         print("stdio 服务器已准备就绪，开始运行 MCP 应用...")
-        await server.app.run(
-            read_stream,
-            write_stream,
-            server.app.create_initialization_options()
-        )
+        try:
+            await server.app.run(
+                read_stream,
+                write_stream,
+                server.app.create_initialization_options()
+            )
+        finally:
+            server.executors.shutdown()
 
 
 if __name__ == "__main__":
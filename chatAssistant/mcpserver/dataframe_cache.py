@@ -0,0 +1,153 @@
+import asyncio
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from mcpserver.report_snapshots import read_snapshot, write_snapshot
+
+CacheKey = Tuple[str, Optional[str]]
+
+
+class _CachedFrame:
+    __slots__ = ("df", "mtime", "size", "nbytes")
+
+    def __init__(self, df: pd.DataFrame, mtime: float, size: int, nbytes: int):
+        self.df = df
+        self.mtime = mtime
+        self.size = size
+        self.nbytes = nbytes
+
+
+class DataFrameCache:
+    """
+    报表DataFrame缓存
+    - 以文件的mtime和大小校验，文件被替换后不会返回旧数据
+    - 按 memory_usage(deep=True) 统计占用，超过上限时LRU淘汰
+    - 加载时收缩dtype以降低常驻内存
+    - 后台定期检查已缓存文件，发生变化时提前重新加载
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, watch_interval: float = 30, executor: Executor = None):
+        self.max_bytes = max_bytes
+        self.executor = executor
+        self.watch_interval = watch_interval
+        self.current_bytes = 0
+        self._entries: "OrderedDict[CacheKey, _CachedFrame]" = OrderedDict()
+        self._loading: Dict[CacheKey, asyncio.Task] = {}
+        self._watcher: Optional[asyncio.Task] = None
+
+    async def get(self, file_path: str, sheet_name: str = None) -> pd.DataFrame:
+        """获取报表数据，缓存有效时直接返回，否则（重新）加载"""
+        self._ensure_watcher()
+        key = (os.path.abspath(file_path), sheet_name)
+        stat = os.stat(key[0])
+        entry = self._entries.get(key)
+        if entry is not None and entry.mtime == stat.st_mtime and entry.size == stat.st_size:
+            self._entries.move_to_end(key)
+            return entry.df
+        return await self._reload(key)
+
+    async def _reload(self, key: CacheKey) -> pd.DataFrame:
+        """同一文件的并发加载只执行一次"""
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key))
+            self._loading[key] = task
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, key: CacheKey) -> pd.DataFrame:
+        file_path, sheet_name = key
+        stat = os.stat(file_path)
+        # pd.read_excel 是阻塞的，放到线程中执行，避免卡住事件循环；
+        # 快照是内存映射读取，必须留在本进程，因此这里用线程池而不是进程池
+        loop = asyncio.get_running_loop()
+        df = await loop.run_in_executor(self.executor, self._read_frame, file_path, sheet_name)
+        nbytes = int(df.memory_usage(deep=True).sum())
+
+        self._discard(key)
+        if nbytes <= self.max_bytes:
+            self._entries[key] = _CachedFrame(df, stat.st_mtime, stat.st_size, nbytes)
+            self.current_bytes += nbytes
+            self._evict()
+        print(f"[DataFrame缓存] 已加载 {os.path.basename(file_path)}:{sheet_name}，"
+              f"{len(df)} 行，{nbytes / 1024 / 1024:.2f}MB，缓存总占用 {self.current_bytes / 1024 / 1024:.2f}MB",
+              file=sys.stderr)
+        return df
+
+    @staticmethod
+    def _read_frame(file_path: str, sheet_name: Optional[str]) -> pd.DataFrame:
+        """优先读取内存映射的列式快照，快照缺失或过期时解析Excel并生成快照"""
+        df = read_snapshot(file_path, sheet_name)
+        if df is not None:
+            return df
+        if sheet_name:
+            df = pd.read_excel(file_path, sheet_name=sheet_name)
+        else:
+            df = pd.read_excel(file_path)
+        df = DataFrameCache.shrink_dtypes(df)
+        write_snapshot(file_path, sheet_name, df)
+        return df
+
+    @staticmethod
+    def shrink_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+        """收缩dtype：整数向下转换，浮点仅在无损时转为float32，低基数字符串列转为category"""
+        for column in df.columns:
+            series = df[column]
+            if pd.api.types.is_integer_dtype(series):
+                df[column] = pd.to_numeric(series, downcast="integer")
+            elif pd.api.types.is_float_dtype(series):
+                narrowed = series.astype(np.float32)
+                # 金额数据不能损失精度，只有转换后数值完全一致才采用
+                if narrowed.astype(np.float64).equals(series.astype(np.float64)):
+                    df[column] = narrowed
+            elif series.dtype == object and len(series) > 0:
+                if series.nunique(dropna=True) <= len(series) // 2:
+                    df[column] = series.astype("category")
+        return df
+
+    def _discard(self, key: CacheKey):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry.nbytes
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._discard(key)
+            print(f"[DataFrame缓存] 内存超限，淘汰 {key[0]}:{key[1]}", file=sys.stderr)
+
+    def _ensure_watcher(self):
+        if self.watch_interval and (self._watcher is None or self._watcher.done()):
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        """定期检查已缓存的文件，变化时在后台重新加载，删除时移出缓存"""
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            for key, entry in list(self._entries.items()):
+                try:
+                    stat = os.stat(key[0])
+                except FileNotFoundError:
+                    self._discard(key)
+                    continue
+                if (stat.st_mtime != entry.mtime or stat.st_size != entry.size) and key not in self._loading:
+                    print(f"[DataFrame缓存] 检测到文件变化，后台重新加载 {key[0]}", file=sys.stderr)
+                    try:
+                        await self._reload(key)
+                    except Exception as e:
+                        print(f"[DataFrame缓存] 重新加载失败: {e}", file=sys.stderr)
+
+    def get_stats(self) -> dict:
+        """获取缓存占用情况"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "files": [f"{path}:{sheet}" for path, sheet in self._entries],
+        }
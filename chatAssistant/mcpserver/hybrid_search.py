@@ -0,0 +1,118 @@
+"""
+混合检索：向量检索和关键词检索并发执行，按倒数排名融合（RRF）合并
+
+两路检索共用一个期限，期限内完成的检索结果参与融合，超时的检索被放弃；
+每条结果记录来自哪些检索及各自的排名，便于调参。
+"""
+import asyncio
+import hashlib
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Sequence
+
+VECTOR = "vector"
+KEYWORD = "keyword"
+SEARCH_MODES = {
+    "hybrid": (VECTOR, KEYWORD),
+    "vector": (VECTOR,),
+    "keyword": (KEYWORD,),
+}
+RRF_K = 60
+
+
+def _doc_key(doc: Dict[str, Any]) -> str:
+    if doc.get("id") is not None:
+        return str(doc["id"])
+    return hashlib.sha1(str(doc.get("content", "")).encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(ranked: Dict[str, List[Dict[str, Any]]], k: int = RRF_K) -> List[Dict[str, Any]]:
+    """score = Σ 1 / (k + rank)，同一文档在多路结果中出现时得分累加"""
+    fused: Dict[str, Dict[str, Any]] = {}
+    for source, docs in ranked.items():
+        for rank, doc in enumerate(docs, 1):
+            entry = fused.setdefault(_doc_key(doc), {
+                "id": doc.get("id"),
+                "content": doc.get("content"),
+                "score": 0.0,
+                "sources": [],
+                "ranks": {},
+            })
+            entry["score"] += 1.0 / (k + rank)
+            entry["sources"].append(source)
+            entry["ranks"][source] = rank
+            if doc.get("similarity") is not None:
+                entry["similarity"] = doc["similarity"]
+    return sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)
+
+
+class HybridSearcher:
+    """
+    run_io: 把阻塞调用放到线程池执行的协程函数
+    embed: 文本 -> 向量，返回 None 表示嵌入不可用
+    """
+
+    def __init__(self, supabase, run_io: Callable[..., Awaitable], embed: Callable[[str], List[float]],
+                 match_threshold: float = 0.3, match_count: int = 3, keyword_limit: int = 5):
+        self.supabase = supabase
+        self.run_io = run_io
+        self.embed = embed
+        self.match_threshold = match_threshold
+        self.match_count = match_count
+        self.keyword_limit = keyword_limit
+
+    def _vector_search(self, question: str, table: str) -> List[Dict[str, Any]]:
+        embedding = self.embed(",".join(question.lower().split()))
+        if not embedding:
+            raise RuntimeError("嵌入服务不可用")
+        response = self.supabase.rpc(
+            "match_documents",
+            {
+                "query_embedding": embedding,
+                "match_threshold": self.match_threshold,
+                "match_count": self.match_count,
+                "table_name": table
+            }
+        ).execute()
+        return response.data or []
+
+    def _keyword_search(self, question: str, table: str) -> List[Dict[str, Any]]:
+        # 使用 ilike 进行模糊文本搜索
+        response = self.supabase.table(table).select("*").ilike("content", f"%{question}%") \
+            .limit(self.keyword_limit).execute()
+        return response.data or []
+
+    async def _timed(self, source: str, question: str, table: str):
+        started = time.time()
+        search = self._vector_search if source == VECTOR else self._keyword_search
+        docs = await self.run_io(search, question, table)
+        return docs, time.time() - started
+
+    async def search(self, question: str, table: str = "testdoc",
+                     sources: Sequence[str] = SEARCH_MODES["hybrid"], deadline: float = 2.0) -> Dict[str, Any]:
+        """并发执行各路检索，期限到达时用已完成的结果融合"""
+        started = time.time()
+        tasks = {asyncio.ensure_future(self._timed(source, question, table)): source for source in sources}
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            # 线程中的请求无法中断，结果到达后直接丢弃
+            task.cancel()
+
+        ranked: Dict[str, List[Dict[str, Any]]] = {}
+        report: Dict[str, Dict[str, Any]] = {}
+        for task, source in tasks.items():
+            if task in pending:
+                report[source] = {"status": "timeout"}
+            elif task.exception() is not None:
+                report[source] = {"status": "error", "error": str(task.exception())}
+                print(f"[混合检索] {source} 检索失败: {task.exception()}", file=sys.stderr)
+            else:
+                docs, elapsed = task.result()
+                ranked[source] = docs
+                report[source] = {"status": "ok", "count": len(docs), "elapsed_ms": round(elapsed * 1000, 1)}
+
+        return {
+            "matches": reciprocal_rank_fusion(ranked),
+            "sources": report,
+            "elapsed_ms": round((time.time() - started) * 1000, 1),
+        }
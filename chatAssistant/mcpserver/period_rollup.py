@@ -0,0 +1,185 @@
+"""
+期间汇总立方体
+
+按月、季度、年预先汇总各指标（销售镜像的销售额/订单数，利润表的收入/成本/利润），
+期间比较只需按键查表，代价与期间数成正比，不再扫描明细。
+数据源版本（镜像 data_version、利润表文件的 mtime 和大小）变化时整体重算。
+"""
+import re
+from threading import Lock
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from mcpserver.periods import YEAR, QUARTER, MONTH
+
+# 利润表列名 -> 指标名
+INCOME_METRIC_ALIASES = {
+    "revenue": ("revenue", "营业收入", "营业总收入", "主营业务收入", "收入"),
+    "cost": ("cost", "营业成本", "成本"),
+    "gross_profit": ("gross profit", "毛利", "毛利润"),
+    "operating_profit": ("operating profit", "营业利润"),
+    "net_profit": ("net profit", "net income", "净利润"),
+}
+_DATE_COLUMN_NAMES = ("date", "period", "month", "日期", "期间", "月份", "会计期间")
+
+# 比率指标不能跨期相加，在每个粒度汇总之后再计算
+RATIO_METRICS = {
+    "gross_margin": ("gross_profit", "revenue"),
+    "net_margin": ("net_profit", "revenue"),
+    "average_order_value": ("sales_amount", "order_count"),
+}
+
+# 自然语言指标 -> 指标名，按顺序匹配
+METRIC_KEYWORDS = [
+    (("net margin", "净利率"), "net_margin"),
+    (("gross margin", "毛利率"), "gross_margin"),
+    (("average order", "客单价"), "average_order_value"),
+    (("net profit", "net income", "净利润"), "net_profit"),
+    (("gross profit", "毛利"), "gross_profit"),
+    (("operating profit", "营业利润"), "operating_profit"),
+    (("profit", "利润"), "net_profit"),
+    (("cost", "成本"), "cost"),
+    (("volume", "count", "orders", "订单数", "单量"), "order_count"),
+    (("sales", "销售"), "sales_amount"),
+    (("revenue", "收入", "营收"), "revenue"),
+]
+
+_FREQ = {QUARTER: "Q", YEAR: "Y"}
+
+
+def _period_key(period: pd.Period, grain: str) -> str:
+    """与 parse_period 的规范化键一致: 2024 / 2024Q1 / 2024-03"""
+    if grain == YEAR:
+        return str(period.year)
+    if grain == QUARTER:
+        return f"{period.year}Q{period.quarter}"
+    return f"{period.year}-{period.month:02d}"
+
+
+def income_statement_monthly(df: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """识别利润表的日期列和指标列，按月汇总；无法识别时返回None"""
+    date_column = None
+    for column in df.columns:
+        name = str(column).strip().lower()
+        if pd.api.types.is_datetime64_any_dtype(df[column]) or name in _DATE_COLUMN_NAMES:
+            date_column = column
+            break
+    if date_column is None:
+        return None
+
+    columns = {}
+    for metric, aliases in INCOME_METRIC_ALIASES.items():
+        for column in df.columns:
+            name = re.sub(r"[\s_]+", " ", str(column).strip().lower())
+            if column != date_column and name in aliases and metric not in columns.values():
+                columns[column] = metric
+                break
+    if not columns:
+        return None
+
+    dates = pd.to_datetime(df[date_column].astype(str).str.replace("年", "-").str.replace("月", ""),
+                           errors="coerce")
+    values = df[list(columns)].apply(pd.to_numeric, errors="coerce").rename(columns=columns)
+    values = values[dates.notna().to_numpy()]
+    if values.empty:
+        return None
+    values.index = dates.dropna().dt.to_period("M")
+    return values.groupby(level=0).sum(min_count=1).astype("float64")
+
+
+def build_rollup_tables(sales_monthly: List[Dict[str, Any]] = None,
+                        income_statement: pd.DataFrame = None) -> Dict[str, pd.DataFrame]:
+    """由月度销售汇总和利润表构建各粒度汇总表；纯函数，可在进程池中执行"""
+    frames = []
+    if sales_monthly:
+        sales = pd.DataFrame(sales_monthly).dropna(subset=["month"])
+        sales.index = pd.PeriodIndex(sales.pop("month"), freq="M")
+        frames.append(sales[["sales_amount", "order_count"]].astype("float64"))
+    if income_statement is not None:
+        income = income_statement_monthly(income_statement)
+        if income is not None:
+            frames.append(income)
+
+    tables = {}
+    if frames:
+        monthly = pd.concat(frames, axis=1).groupby(level=0).sum(min_count=1).sort_index()
+        tables[MONTH] = monthly
+        for grain, freq in _FREQ.items():
+            tables[grain] = monthly.groupby(monthly.index.asfreq(freq)).sum(min_count=1)
+        for grain, table in tables.items():
+            for ratio, (numerator, denominator) in RATIO_METRICS.items():
+                if numerator in table and denominator in table:
+                    table[ratio] = table[numerator] / table[denominator].replace(0, np.nan)
+            table.index = pd.Index([_period_key(p, grain) for p in table.index])
+    return tables
+
+
+class PeriodRollup:
+    """各粒度一张宽表：行是期间键，列是指标"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.version: Optional[Hashable] = None
+        self.tables: Dict[str, pd.DataFrame] = {}
+
+    @property
+    def metrics(self) -> List[str]:
+        table = self.tables.get(MONTH)
+        return list(table.columns) if table is not None else []
+
+    def is_current(self, version: Hashable) -> bool:
+        return self.version == version and bool(self.tables)
+
+    def replace(self, version: Hashable, tables: Dict[str, pd.DataFrame]):
+        """换入新构建的汇总表"""
+        with self._lock:
+            self.tables = tables
+            self.version = version
+
+    def rebuild(self, version: Hashable, sales_monthly: List[Dict[str, Any]] = None,
+                income_statement: pd.DataFrame = None):
+        """在当前进程内重建立方体"""
+        self.replace(version, build_rollup_tables(sales_monthly, income_statement))
+
+    def lookup(self, metric: str, grain: str, keys: List[str]) -> np.ndarray:
+        """按期间键取值，缺失的期间为NaN"""
+        table = self.tables.get(grain)
+        if table is None or metric not in table:
+            return np.full(len(keys), np.nan)
+        return table[metric].reindex(keys).to_numpy(dtype="float64")
+
+    def values_for(self, metric: str, periods: List[Tuple[str, str]]) -> List[Optional[float]]:
+        """periods 为 [(粒度, 键)]，同一粒度一次批量查询"""
+        values: List[Optional[float]] = [None] * len(periods)
+        for grain in {grain for grain, _ in periods}:
+            positions = [i for i, (g, _) in enumerate(periods) if g == grain]
+            found = self.lookup(metric, grain, [periods[i][1] for i in positions])
+            for position, value in zip(positions, found):
+                values[position] = None if np.isnan(value) else float(value)
+        return values
+
+    def series(self, metric: str, grain: str, end_key: str = None, count: int = 12) -> Dict[str, Optional[float]]:
+        """某粒度下截至 end_key（默认最新）的最近 count 个期间"""
+        table = self.tables.get(grain)
+        if table is None or metric not in table:
+            return {}
+        column = table[metric]
+        if end_key is not None:
+            if end_key not in column.index:
+                return {}
+            column = column.iloc[:column.index.get_loc(end_key) + 1]
+        return {key: None if np.isnan(value) else float(value) for key, value in column.tail(count).items()}
+
+    def resolve_metric(self, text: str) -> Optional[str]:
+        """把自然语言指标映射到立方体中已有的指标，收入缺失时退回销售额"""
+        lowered = text.lower()
+        available = self.metrics
+        for keywords, metric in METRIC_KEYWORDS:
+            if any(k in lowered for k in keywords):
+                if metric in available:
+                    return metric
+                if metric == "revenue" and "sales_amount" in available:
+                    return "sales_amount"
+        return None
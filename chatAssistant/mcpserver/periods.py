@@ -0,0 +1,81 @@
+"""
+期间标签解析与期间比较（年、季度、月）
+"""
+import calendar
+import re
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+YEAR = "year"
+QUARTER = "quarter"
+MONTH = "month"
+
+_PATTERNS = [
+    (re.compile(r"^(\d{4})\s*年?\s*(?:第\s*)?[Qq第]?\s*([1-4])\s*(?:季度|季)$"), QUARTER),
+    (re.compile(r"^(\d{4})\s*年?\s*[-_ ]?\s*[Qq]([1-4])$"), QUARTER),
+    (re.compile(r"^[Qq]([1-4])\s*[-_ ]?\s*(\d{4})$"), "quarter_first"),
+    (re.compile(r"^(\d{4})\s*[-/年.]\s*(\d{1,2})\s*月?$"), MONTH),
+    (re.compile(r"^(\d{4})\s*年?$"), YEAR),
+]
+
+
+def parse_period(label: str) -> Optional[Tuple[str, str, date, date]]:
+    """
+    解析期间标签，返回 (粒度, 规范化键, 开始日期, 结束日期)
+    支持: "2024", "2024年", "2024-03", "2024年3月", "Q1 2024", "2024Q1", "2024年第1季度"
+    """
+    text = str(label).strip()
+    for pattern, kind in _PATTERNS:
+        match = pattern.match(text)
+        if not match:
+            continue
+        if kind == "quarter_first":
+            quarter, year = int(match.group(1)), int(match.group(2))
+            kind = QUARTER
+        elif kind == YEAR:
+            year = int(match.group(1))
+            return YEAR, f"{year}", date(year, 1, 1), date(year, 12, 31)
+        else:
+            year, second = int(match.group(1)), int(match.group(2))
+            if kind == MONTH:
+                if not 1 <= second <= 12:
+                    return None
+                last_day = calendar.monthrange(year, second)[1]
+                return MONTH, f"{year}-{second:02d}", date(year, second, 1), date(year, second, last_day)
+            quarter = second
+        first_month = (quarter - 1) * 3 + 1
+        last_month = first_month + 2
+        return (QUARTER, f"{year}Q{quarter}", date(year, first_month, 1),
+                date(year, last_month, calendar.monthrange(year, last_month)[1]))
+    return None
+
+
+def compare_values(labels: List[str], values: List[Optional[float]], analysis_type: str = "percentage") -> Dict:
+    """对按时间排列的期间数值做比较：absolute(差额)、percentage(环比)、trend(趋势方向和斜率)"""
+    comparisons = []
+    for i in range(1, len(labels)):
+        previous, current = values[i - 1], values[i]
+        item = {"from": labels[i - 1], "to": labels[i]}
+        if previous is None or current is None:
+            item["note"] = "missing data"
+        elif analysis_type == "absolute":
+            item["change"] = current - previous
+        else:
+            item["change"] = current - previous
+            item["change_pct"] = (current - previous) / abs(previous) * 100 if previous else None
+        comparisons.append(item)
+
+    result = {"comparisons": comparisons}
+    if analysis_type == "trend":
+        points = [(i, v) for i, v in enumerate(values) if v is not None]
+        if len(points) >= 2:
+            n = len(points)
+            mean_x = sum(x for x, _ in points) / n
+            mean_y = sum(y for _, y in points) / n
+            denominator = sum((x - mean_x) ** 2 for x, _ in points)
+            slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / denominator if denominator else 0.0
+            result["trend"] = {
+                "slope_per_period": slope,
+                "direction": "up" if slope > 0 else "down" if slope < 0 else "flat",
+            }
+    return result
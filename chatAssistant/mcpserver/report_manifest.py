@@ -0,0 +1,96 @@
+import json
+import os
+import sys
+from threading import Lock
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from mcpserver.dataframe_cache import DataFrameCache
+from mcpserver.report_snapshots import read_snapshot, write_snapshot
+
+MANIFEST_FILENAME = ".manifest.json"
+
+
+class ReportManifest:
+    """
+    报表目录的清单索引：文件名、大小、mtime、工作表名和每个工作表的行数
+    每次刷新只对目录做一次stat比对，只有新增或变化的工作簿才会被解析；结果持久化到目录下的 .manifest.json
+    """
+
+    def __init__(self, reports_dir: str, manifest_path: str = None):
+        self.reports_dir = reports_dir
+        self.manifest_path = manifest_path or os.path.join(reports_dir, MANIFEST_FILENAME)
+        self._lock = Lock()
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def _index_workbook(file_path: str) -> Dict[str, Any]:
+        """解析工作簿的工作表名和行数，顺便生成列式快照供后续读取"""
+        xl_file = pd.ExcelFile(file_path)
+        row_counts = {}
+        for sheet in xl_file.sheet_names:
+            df = read_snapshot(file_path, sheet)
+            if df is None:
+                # 与 ingest_reports 一致，快照中保存压缩后的类型，DataFrameCache 直接加载
+                df = DataFrameCache.shrink_dtypes(xl_file.parse(sheet))
+                write_snapshot(file_path, sheet, df)
+            row_counts[sheet] = len(df)
+        return {"sheets": xl_file.sheet_names, "row_counts": row_counts}
+
+    def refresh(self) -> List[Dict[str, Any]]:
+        """按stat差异增量更新清单，返回当前所有报表的条目"""
+        with self._lock:
+            if not os.path.exists(self.reports_dir):
+                return []
+
+            seen = set()
+            changed = False
+            for dir_entry in os.scandir(self.reports_dir):
+                if not dir_entry.is_file() or not dir_entry.name.endswith(('.xlsx', '.xls')):
+                    continue
+                seen.add(dir_entry.name)
+                stat = dir_entry.stat()
+                previous = self._entries.get(dir_entry.name)
+                if previous and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+                    continue
+
+                entry = {
+                    "filename": dir_entry.name,
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "last_modified": stat.st_mtime,
+                }
+                try:
+                    entry.update(self._index_workbook(dir_entry.path))
+                except Exception as e:
+                    entry["error"] = str(e)
+                print(f"[报表清单] 已索引 {dir_entry.name}", file=sys.stderr)
+                self._entries[dir_entry.name] = entry
+                changed = True
+
+            for name in list(self._entries):
+                if name not in seen:
+                    del self._entries[name]
+                    changed = True
+
+            if changed:
+                try:
+                    self._save()
+                except OSError as e:
+                    print(f"[报表清单] 保存清单失败: {e}", file=sys.stderr)
+
+            return [self._entries[name] for name in sorted(self._entries)]
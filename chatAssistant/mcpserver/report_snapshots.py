@@ -0,0 +1,132 @@
+"""
+财务报表的列式快照
+
+pd.read_excel 很慢，而且每个服务器进程启动时都要重复解析。这里把每个工作簿/工作表
+转换为未压缩的 Arrow IPC 文件，保存在原文件旁边（balance_sheet.xlsx -> balance_sheet.arrow，
+指定工作表时为 balance_sheet.<sheet>.arrow）。读取时通过内存映射打开，多个进程共享同一份页缓存。
+
+快照的 schema 元数据中记录了源文件的 mtime 和大小，源文件变化后快照自动失效。
+pyarrow 未安装时所有函数退化为直接读取 Excel。
+
+用法: python mcpserver/report_snapshots.py [报表目录]
+"""
+import os
+import re
+import sys
+from typing import List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+    feather = None
+
+SNAPSHOT_SUFFIX = ".arrow"
+_META_MTIME = b"source_mtime_ns"
+_META_SIZE = b"source_size"
+
+
+def snapshots_available() -> bool:
+    return pa is not None
+
+
+def snapshot_path(file_path: str, sheet_name: Optional[str] = None) -> str:
+    """快照文件路径，与源文件放在同一目录"""
+    base, _ = os.path.splitext(file_path)
+    if sheet_name:
+        safe_sheet = re.sub(r"[^\w\-]+", "_", str(sheet_name))
+        return f"{base}.{safe_sheet}{SNAPSHOT_SUFFIX}"
+    return f"{base}{SNAPSHOT_SUFFIX}"
+
+
+def read_snapshot(file_path: str, sheet_name: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """以内存映射方式读取快照；快照不存在或已过期时返回None"""
+    if pa is None:
+        return None
+    path = snapshot_path(file_path, sheet_name)
+    if not os.path.exists(path):
+        return None
+    try:
+        stat = os.stat(file_path)
+        table = feather.read_table(path, memory_map=True)
+        metadata = table.schema.metadata or {}
+        if (metadata.get(_META_MTIME) != str(stat.st_mtime_ns).encode()
+                or metadata.get(_META_SIZE) != str(stat.st_size).encode()):
+            return None
+        # split_blocks 让无空值的数值列尽量直接引用映射的内存
+        return table.to_pandas(split_blocks=True)
+    except Exception as e:
+        print(f"[报表快照] 读取快照失败 {path}: {e}", file=sys.stderr)
+        return None
+
+
+def write_snapshot(file_path: str, sheet_name: Optional[str], df: pd.DataFrame) -> Optional[str]:
+    """写入快照，先写临时文件再原子替换，读取方不会看到写了一半的文件"""
+    if pa is None:
+        return None
+    path = snapshot_path(file_path, sheet_name)
+    try:
+        stat = os.stat(file_path)
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Excel中混合类型的列统一转为字符串
+            df = df.copy()
+            for column in df.columns:
+                if df[column].dtype == object:
+                    df[column] = df[column].astype(str)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[_META_MTIME] = str(stat.st_mtime_ns).encode()
+        metadata[_META_SIZE] = str(stat.st_size).encode()
+        table = table.replace_schema_metadata(metadata)
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+        return path
+    except Exception as e:
+        print(f"[报表快照] 写入快照失败 {path}: {e}", file=sys.stderr)
+        return None
+
+
+def ingest_reports(reports_dir: str = "./financial_reports") -> List[str]:
+    """把目录下所有工作簿的每个工作表转换为快照，已是最新的快照会跳过"""
+    from mcpserver.dataframe_cache import DataFrameCache
+
+    written = []
+    if pa is None:
+        print("[报表快照] 未安装 pyarrow，跳过快照生成", file=sys.stderr)
+        return written
+    for file in sorted(os.listdir(reports_dir)):
+        if not file.endswith((".xlsx", ".xls")):
+            continue
+        file_path = os.path.join(reports_dir, file)
+        try:
+            xl_file = pd.ExcelFile(file_path)
+            for index, sheet in enumerate(xl_file.sheet_names):
+                # 第一个工作表同时作为不指定工作表时的默认快照
+                targets = [sheet, None] if index == 0 else [sheet]
+                pending = [t for t in targets if read_snapshot(file_path, t) is None]
+                if not pending:
+                    continue
+                df = DataFrameCache.shrink_dtypes(xl_file.parse(sheet))
+                for target in pending:
+                    path = write_snapshot(file_path, target, df)
+                    if path:
+                        written.append(path)
+        except Exception as e:
+            print(f"[报表快照] 处理 {file} 失败: {e}", file=sys.stderr)
+    return written
+
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    target_dir = sys.argv[1] if len(sys.argv) > 1 else "./financial_reports"
+    paths = ingest_reports(target_dir)
+    print(f"生成 {len(paths)} 个快照")
+    for p in paths:
+        print(f"  - {p}")
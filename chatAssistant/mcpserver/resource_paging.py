@@ -0,0 +1,146 @@
+"""
+资源分页：游标、列投影和分块JSON编码
+
+资源URI可带查询参数，例如 financial://reports/balance-sheet?limit=200&columns=科目,期末余额&cursor=...
+- limit: 每页行数，默认 FINANCIAL_RESOURCE_PAGE_SIZE（500），上限 MAX_PAGE_SIZE
+- columns: 逗号分隔的列名，只返回这些列
+- cursor: 上一页返回的 next_cursor，不透明字符串
+报表游标记录偏移量和文件版本，翻页期间文件被替换时游标失效；Supabase表按 id 做键集分页。
+每页按 chunk_rows 行分块编码写入缓冲区，不会一次性构造整页的Python对象。
+
+返回结构:
+- 带任一分页参数: 报表为 {columns, total_rows, limit, next_cursor, rows}，
+  Supabase表为 {count, limit, next_cursor, <documents|financial_data>}
+- 不带分页参数: 与分页前一致，报表为完整的记录数组，Supabase表为 {<documents|financial_data>, count}
+"""
+import base64
+import io
+import json
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+
+import pandas as pd
+
+DEFAULT_PAGE_SIZE = int(os.getenv("FINANCIAL_RESOURCE_PAGE_SIZE", "500"))
+MAX_PAGE_SIZE = 5000
+ENCODE_CHUNK_ROWS = 200
+
+_SAFE_COLUMN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class PageRequest:
+    """一次分页读取的参数"""
+
+    __slots__ = ("cursor", "limit", "columns", "paged")
+
+    def __init__(self, cursor: str = None, limit: int = None, columns: List[str] = None):
+        # 调用方显式要求分页时返回分页结构，否则保持原有结构
+        self.paged = bool(cursor or limit or columns)
+        self.cursor = cursor
+        self.limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+        self.columns = columns or None
+
+
+def parse_resource_uri(uri) -> Tuple[str, PageRequest]:
+    """拆分资源URI，返回 (不含查询参数的URI, 分页参数)"""
+    parts = urlsplit(str(uri))
+    base = urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+    query = parse_qs(parts.query)
+    limit = query.get("limit", [None])[0]
+    columns = query.get("columns", [None])[0]
+    return base, PageRequest(
+        cursor=query.get("cursor", [None])[0],
+        limit=int(limit) if limit and limit.isdigit() else None,
+        columns=[c.strip() for c in columns.split(",") if c.strip()] if columns else None
+    )
+
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    raw = json.dumps(state, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError):
+        raise ValueError("无效的游标")
+
+
+def paginate_frame(df: pd.DataFrame, page: PageRequest, version: str) -> Tuple[pd.DataFrame, Optional[str]]:
+    """按偏移量切出一页并做列投影，返回 (页数据, 下一页游标)"""
+    state = decode_cursor(page.cursor) if page.cursor else {"offset": 0, "version": version}
+    if state.get("version") != version:
+        raise ValueError("游标已失效：报表在翻页期间已更新，请从第一页重新读取")
+    if page.columns:
+        unknown = [c for c in page.columns if c not in df.columns]
+        if unknown:
+            raise ValueError(f"未知的列: {unknown}")
+    offset = int(state.get("offset", 0))
+    end = offset + page.limit
+    rows = df.iloc[offset:end]
+    if page.columns:
+        rows = rows[page.columns]
+    next_cursor = encode_cursor({"offset": end, "version": version}) if end < len(df) else None
+    return rows, next_cursor
+
+
+def fetch_table_page(supabase, table: str, page: PageRequest, default_columns: str = "*") -> Tuple[List[Dict], Optional[str]]:
+    """按 id 键集分页读取Supabase表（阻塞调用，应在线程池中执行）"""
+    if page.columns:
+        invalid = [c for c in page.columns if not _SAFE_COLUMN.match(c)]
+        if invalid:
+            raise ValueError(f"非法的列名: {invalid}")
+        select = ",".join(["id"] + [c for c in page.columns if c != "id"])
+    else:
+        select = default_columns
+    query = supabase.table(table).select(select).order("id")
+    if page.cursor:
+        query = query.gt("id", decode_cursor(page.cursor)["after"])
+    # 多取一行判断是否还有下一页
+    rows = query.limit(page.limit + 1).execute().data
+    has_more = len(rows) > page.limit
+    rows = rows[:page.limit]
+    next_cursor = encode_cursor({"after": rows[-1]["id"]}) if has_more else None
+    return rows, next_cursor
+
+
+def _iter_row_chunks(rows, chunk_rows: int) -> Iterable[str]:
+    """把行按块编码为JSON数组元素片段（不含外层方括号）"""
+    if isinstance(rows, pd.DataFrame):
+        for start in range(0, len(rows), chunk_rows):
+            yield rows.iloc[start:start + chunk_rows].to_json(orient="records", force_ascii=False)[1:-1]
+    else:
+        for start in range(0, len(rows), chunk_rows):
+            yield ",".join(json.dumps(row, ensure_ascii=False, default=str) for row in rows[start:start + chunk_rows])
+
+
+def encode_rows(rows, chunk_rows: int = ENCODE_CHUNK_ROWS) -> str:
+    """编码为JSON记录数组，行数据分块写入"""
+    buffer = io.StringIO()
+    buffer.write("[")
+    first = True
+    for chunk in _iter_row_chunks(rows, chunk_rows):
+        if not chunk:
+            continue
+        if not first:
+            buffer.write(",")
+        buffer.write(chunk)
+        first = False
+    buffer.write("]")
+    return buffer.getvalue()
+
+
+def encode_page(rows_key: str, rows, meta: Dict[str, Any], chunk_rows: int = ENCODE_CHUNK_ROWS) -> str:
+    """编码一页结果: {meta..., rows_key: [...]}，行数据分块写入"""
+    buffer = io.StringIO()
+    buffer.write("{")
+    for key, value in meta.items():
+        buffer.write(f"{json.dumps(key)}:{json.dumps(value, ensure_ascii=False, default=str)},")
+    buffer.write(f"{json.dumps(rows_key)}:")
+    buffer.write(encode_rows(rows, chunk_rows))
+    buffer.write("}")
+    return buffer.getvalue()
@@ -0,0 +1,170 @@
+"""
+query_sales_data 的聚合下推层
+
+支持的分析（前十客户、月度趋势、汇总）优先交给数据库端的分组查询完成，只传回结果行。
+需要在 Supabase 中创建以下函数，filters 为 jsonb 等值过滤条件（如 {"region": "华东"}）:
+
+    create or replace function sales_top_customers(start_date date, end_date date, filters jsonb, max_rows int)
+    returns table (customer_name text, total_amount numeric) language sql stable as $$
+        select s.customer_name, sum(s.total_amount) from sales_orders s
+        where (start_date is null or s.order_date >= start_date)
+          and (end_date is null or s.order_date <= end_date)
+          and to_jsonb(s) @> coalesce(filters, '{}'::jsonb)
+        group by s.customer_name order by 2 desc limit max_rows
+    $$;
+
+    create or replace function sales_monthly_trend(start_date date, end_date date, filters jsonb)
+    returns table (month text, total_amount numeric) language sql stable as $$
+        select to_char(s.order_date, 'YYYY-MM'), sum(s.total_amount) from sales_orders s
+        where (start_date is null or s.order_date >= start_date)
+          and (end_date is null or s.order_date <= end_date)
+          and to_jsonb(s) @> coalesce(filters, '{}'::jsonb)
+        group by 1 order by 1
+    $$;
+
+    create or replace function sales_totals(start_date date, end_date date, filters jsonb)
+    returns table (total_records bigint, total_sales numeric, min_date date, max_date date)
+    language sql stable as $$
+        select count(*), sum(s.total_amount), min(s.order_date), max(s.order_date) from sales_orders s
+        where (start_date is null or s.order_date >= start_date)
+          and (end_date is null or s.order_date <= end_date)
+          and to_jsonb(s) @> coalesce(filters, '{}'::jsonb)
+    $$;
+
+函数不存在或调用失败时，退化为只取所需列、分页流式读取并增量聚合，内存占用与结果大小相关而不是表大小。
+"""
+import sys
+from collections import defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+TOP_CUSTOMERS = "top_customers"
+MONTHLY_TREND = "monthly_trend"
+TOTALS = "totals"
+
+# 每种分析需要的列
+_PROJECTIONS = {
+    TOP_CUSTOMERS: "customer_name,total_amount",
+    MONTHLY_TREND: "order_date,total_amount",
+    TOTALS: "order_date,total_amount",
+}
+
+
+def classify_sales_question(question: str) -> str:
+    """根据问题关键词选择分析类型"""
+    lowered = question.lower()
+    if "top" in lowered and "customer" in lowered:
+        return TOP_CUSTOMERS
+    if "monthly" in lowered or "trend" in lowered:
+        return MONTHLY_TREND
+    return TOTALS
+
+
+def parse_date_range(date_range: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """date_range 形如 "2023-01-01,2023-12-31" 或只有开始日期"""
+    if not date_range:
+        return None, None
+    if "," in date_range:
+        start, end = date_range.split(",", 1)
+        return start.strip() or None, end.strip() or None
+    return date_range.strip(), None
+
+
+class SalesAggregator:
+    """把销售分析下推到数据库执行，失败时分页流式聚合"""
+
+    PAGE_SIZE = 1000
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+
+    def aggregate(self, analysis: str, start: Optional[str], end: Optional[str],
+                  filters: Dict[str, Any], limit: int = 10) -> Dict[str, Any]:
+        """
+        排行和月度趋势返回 {"results": {...}, "source": ...}；
+        汇总返回 {"total_records", "total_sales", "min_date", "max_date", "source": ...}；
+        source 为 "pushdown" 或 "streamed"
+        """
+        try:
+            return self._pushdown(analysis, start, end, filters, limit)
+        except Exception as e:
+            print(f"[销售聚合] 下推失败，改为分页流式聚合: {e}", file=sys.stderr)
+            return self._streamed(analysis, start, end, filters, limit)
+
+    def _pushdown(self, analysis, start, end, filters, limit) -> Dict[str, Any]:
+        params = {"start_date": start, "end_date": end, "filters": filters or {}}
+        if analysis == TOP_CUSTOMERS:
+            data = self.supabase.rpc("sales_top_customers", dict(params, max_rows=limit)).execute().data
+            return {"results": {row["customer_name"]: float(row["total_amount"] or 0) for row in data},
+                    "source": "pushdown"}
+        if analysis == MONTHLY_TREND:
+            data = self.supabase.rpc("sales_monthly_trend", params).execute().data
+            return {"results": {row["month"]: float(row["total_amount"] or 0) for row in data},
+                    "source": "pushdown"}
+        data = self.supabase.rpc("sales_totals", params).execute().data
+        row = data[0] if data else {}
+        return {
+            "total_records": int(row.get("total_records") or 0),
+            "total_sales": float(row.get("total_sales") or 0),
+            "min_date": row.get("min_date"),
+            "max_date": row.get("max_date"),
+            "source": "pushdown",
+        }
+
+    def _pages(self, columns: str, start, end, filters):
+        """
+        按 id 键集分页读取所需列，逐页产出，避免一次性拉取整表
+        order_date 不唯一，按它做偏移分页时同一天的行会跨页漏读或重复，id 唯一且有索引
+        """
+        last_id = None
+        while True:
+            query = self.supabase.table("sales_orders").select(f"id,{columns}")
+            if start:
+                query = query.gte("order_date", start)
+            if end:
+                query = query.lte("order_date", end)
+            for key, value in (filters or {}).items():
+                query = query.eq(key, value)
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            rows = query.order("id").limit(self.PAGE_SIZE).execute().data
+            if not rows:
+                return
+            yield rows
+            if len(rows) < self.PAGE_SIZE:
+                return
+            last_id = rows[-1]["id"]
+
+    def _streamed(self, analysis, start, end, filters, limit) -> Dict[str, Any]:
+        sums = defaultdict(float)
+        total_records = 0
+        total_sales = 0.0
+        min_date = max_date = None
+        for rows in self._pages(_PROJECTIONS[analysis], start, end, filters):
+            for row in rows:
+                amount = float(row.get("total_amount") or 0)
+                if analysis == TOP_CUSTOMERS:
+                    sums[row.get("customer_name")] += amount
+                    continue
+                order_date = row.get("order_date")
+                if analysis == MONTHLY_TREND:
+                    if order_date:
+                        sums[str(order_date)[:7]] += amount
+                    continue
+                total_records += 1
+                total_sales += amount
+                if order_date:
+                    min_date = order_date if min_date is None or order_date < min_date else min_date
+                    max_date = order_date if max_date is None or order_date > max_date else max_date
+
+        if analysis == TOP_CUSTOMERS:
+            top = sorted(sums.items(), key=lambda item: item[1], reverse=True)[:limit]
+            return {"results": dict(top), "source": "streamed"}
+        if analysis == MONTHLY_TREND:
+            return {"results": dict(sorted(sums.items())), "source": "streamed"}
+        return {
+            "total_records": total_records,
+            "total_sales": total_sales,
+            "min_date": min_date,
+            "max_date": max_date,
+            "source": "streamed",
+        }
@@ -0,0 +1,289 @@
+"""
+sales_orders 和 financial_data 的本地分析镜像（SQLite）
+
+按水位线增量同步：优先使用 updated_at 列，没有时 sales_orders 使用 order_date，
+financial_data 使用 created_at。每次同步只拉取水位线之后（含等于水位线）的行并按 id 覆盖写入，
+同步内按 (水位线, id) 键集分页，水位线相同的行不会跨页漏读或重复。
+水位线同步不会感知远端删除，需要时可用 force_full 重新全量同步。
+
+数据新鲜度由 max_staleness（秒）控制：距离上次同步超过该值时，查询前先增量同步；
+force=True 时无论新鲜度都立即同步。同一时间只有一个同步在进行，等待者拿到锁后重新判断新鲜度；
+多个服务进程共用一个镜像文件时，用 <db_path>.lock 文件锁在进程间串行同步，
+其他进程完成的同步同样计入新鲜度，数据版本（data_version）也取自持久化的同步状态。
+首次全量同步较慢，应通过 start_background_sync 在后台完成，就绪前由调用方改用远端聚合。
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from threading import Lock, Thread
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有文件锁，只在进程内串行同步
+    fcntl = None
+
+from mcpserver.sales_aggregation import TOP_CUSTOMERS, MONTHLY_TREND
+
+# 表名 -> 候选水位线列（按优先级）
+MIRRORED_TABLES = {
+    "sales_orders": ["updated_at", "order_date"],
+    "financial_data": ["updated_at", "created_at"],
+}
+
+_SAFE_COLUMN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class LocalSalesMirror:
+    """远端表的本地SQLite镜像，提供与 SalesAggregator 相同的 aggregate 接口"""
+
+    PAGE_SIZE = 1000
+
+    def __init__(self, supabase, db_path: str = "./.mirror/sales_mirror.db", max_staleness: float = 300):
+        self.supabase = supabase
+        self.db_path = db_path
+        self.max_staleness = max_staleness
+        self._lock = Lock()
+        # 保证同一时间只有一个同步，避免并发的过期请求各自全量拉取
+        self._sync_lock = Lock()
+        self._background: Optional[Thread] = None
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock_path = f"{db_path}.lock"
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        with self._lock, self.conn:
+            self.conn.execute("""
+                create table if not exists sales_orders (
+                    id text primary key,
+                    order_date text,
+                    customer_name text,
+                    total_amount real,
+                    watermark text,
+                    raw text
+                )""")
+            self.conn.execute("create index if not exists idx_sales_orders_date on sales_orders(order_date)")
+            self.conn.execute("""
+                create table if not exists financial_data (
+                    id text primary key,
+                    watermark text,
+                    raw text
+                )""")
+            self.conn.execute("""
+                create table if not exists sync_state (
+                    table_name text primary key,
+                    watermark_column text,
+                    watermark text,
+                    last_sync real,
+                    row_count integer
+                )""")
+
+    # ---------- 同步 ----------
+
+    def _state(self, table: str) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self.conn.execute("select * from sync_state where table_name = ?", (table,)).fetchone()
+
+    def is_ready(self) -> bool:
+        """至少完成过一次 sales_orders 同步"""
+        return self.supabase is not None and self._state("sales_orders") is not None
+
+    def data_version(self, table: str = "sales_orders") -> Optional[Tuple]:
+        """
+        表的数据版本，取自持久化的同步状态，任一进程完成同步后都会变化，供下游（如期间汇总）判断是否需要重算
+        尚未同步过时返回None
+        """
+        state = self._state(table)
+        return (state["watermark"], state["row_count"], state["last_sync"]) if state else None
+
+    def last_sync_age(self, table: str = "sales_orders") -> Optional[float]:
+        state = self._state(table)
+        return time.time() - state["last_sync"] if state else None
+
+    def _stale_tables(self, force: bool) -> List[str]:
+        tables = []
+        for table in MIRRORED_TABLES:
+            age = self.last_sync_age(table)
+            if force or age is None or age >= self.max_staleness:
+                tables.append(table)
+        return tables
+
+    def ensure_fresh(self, force: bool = False) -> int:
+        """超过新鲜度预算或强制时增量同步所有镜像表，返回本次写入的行数；同步失败时保留已有数据"""
+        if self.supabase is None or not self._stale_tables(force):
+            return 0
+        requested = time.time()
+        with self._sync_lock, self._process_lock():
+            changed = 0
+            for table in MIRRORED_TABLES:
+                state = self._state(table)
+                last_sync = state["last_sync"] if state else None
+                if last_sync is not None and last_sync >= requested:
+                    # 等锁期间其他请求（或其他进程）已完成同步，强制刷新也无需再拉
+                    continue
+                if not force and last_sync is not None and time.time() - last_sync < self.max_staleness:
+                    continue
+                try:
+                    changed += self.sync_table(table)
+                except Exception as e:
+                    print(f"[本地镜像] 同步 {table} 失败: {e}", file=sys.stderr)
+            return changed
+
+    @contextmanager
+    def _process_lock(self):
+        """跨进程的同步锁；等待期间其他进程完成的同步由调用方按 last_sync 跳过"""
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a+") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def start_background_sync(self):
+        """在后台线程中同步（首次全量同步可能较慢），已有后台同步在进行时直接返回"""
+        if self.supabase is None:
+            return
+        with self._lock:
+            if self._background is not None and self._background.is_alive():
+                return
+            self._background = Thread(target=self.ensure_fresh, daemon=True, name="sales-mirror-sync")
+            self._background.start()
+
+    def _detect_watermark_column(self, table: str) -> Optional[str]:
+        sample = self.supabase.table(table).select("*").limit(1).execute().data
+        if not sample:
+            return None
+        for column in MIRRORED_TABLES[table]:
+            if column in sample[0]:
+                return column
+        return None
+
+    def sync_table(self, table: str, force_full: bool = False) -> int:
+        """从水位线开始分页拉取并覆盖写入，返回写入的行数"""
+        sync_start = time.time()
+        state = None if force_full else self._state(table)
+        column = state["watermark_column"] if state else self._detect_watermark_column(table)
+        watermark = state["watermark"] if state else None
+        if force_full:
+            with self._lock, self.conn:
+                self.conn.execute(f"delete from {table}")
+
+        written = 0
+        new_watermark = watermark
+        cursor = None  # 上一页最后一行的 (水位线, id)
+        while True:
+            query = self.supabase.table(table).select("*")
+            if column and watermark:
+                query = query.gte(column, watermark)
+            if cursor is not None:
+                last_mark, last_id = cursor
+                if column:
+                    query = query.or_(f'{column}.gt."{last_mark}",and({column}.eq."{last_mark}",id.gt."{last_id}")')
+                else:
+                    query = query.gt("id", last_id)
+            if column:
+                query = query.order(column)
+            rows = query.order("id").limit(self.PAGE_SIZE).execute().data
+            if not rows:
+                break
+            self._upsert(table, column, rows)
+            written += len(rows)
+            if column:
+                page_max = max((str(r[column]) for r in rows if r.get(column) is not None), default=None)
+                if page_max and (new_watermark is None or page_max > new_watermark):
+                    new_watermark = page_max
+            if len(rows) < self.PAGE_SIZE:
+                break
+            cursor = (rows[-1].get(column) if column else None, rows[-1]["id"])
+
+        with self._lock, self.conn:
+            row_count = self.conn.execute(f"select count(*) from {table}").fetchone()[0]
+            self.conn.execute(
+                "insert or replace into sync_state values (?, ?, ?, ?, ?)",
+                (table, column, new_watermark, time.time(), row_count)
+            )
+        print(f"[本地镜像] {table} 同步 {written} 行，耗时 {time.time() - sync_start:.2f}秒，"
+              f"水位线 {new_watermark}", file=sys.stderr)
+        return written
+
+    def _upsert(self, table: str, column: Optional[str], rows: List[Dict[str, Any]]):
+        records = []
+        for row in rows:
+            raw = json.dumps(row, ensure_ascii=False, sort_keys=True, default=str)
+            row_id = str(row["id"]) if row.get("id") is not None else hashlib.sha1(raw.encode("utf-8")).hexdigest()
+            watermark = str(row.get(column)) if column and row.get(column) is not None else None
+            if table == "sales_orders":
+                amount = row.get("total_amount")
+                records.append((row_id, row.get("order_date"), row.get("customer_name"),
+                                float(amount) if amount is not None else None, watermark, raw))
+            else:
+                records.append((row_id, watermark, raw))
+        placeholders = ", ".join("?" * len(records[0]))
+        with self._lock, self.conn:
+            self.conn.executemany(f"insert or replace into {table} values ({placeholders})", records)
+
+    # ---------- 查询 ----------
+
+    def query(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        """在镜像上执行只读SQL"""
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, params).fetchall()]
+
+    @staticmethod
+    def _where(start: Optional[str], end: Optional[str], filters: Dict[str, Any]):
+        clauses, params = [], []
+        if start:
+            clauses.append("order_date >= ?")
+            params.append(start)
+        if end:
+            # order_date 可能带时间部分，结束日期当天全部包含
+            clauses.append("substr(order_date, 1, 10) <= ?")
+            params.append(end)
+        for key, value in (filters or {}).items():
+            if not _SAFE_COLUMN.match(key):
+                raise ValueError(f"非法的过滤字段: {key}")
+            clauses.append(f"json_extract(raw, '$.{key}') = ?")
+            params.append(value)
+        return (" where " + " and ".join(clauses)) if clauses else "", tuple(params)
+
+    def aggregate(self, analysis: str, start: Optional[str], end: Optional[str],
+                  filters: Dict[str, Any], limit: int = 10) -> Dict[str, Any]:
+        """与 SalesAggregator.aggregate 返回结构一致，数据来自本地镜像"""
+        where, params = self._where(start, end, filters)
+        if analysis == TOP_CUSTOMERS:
+            rows = self.query(
+                f"select customer_name, sum(total_amount) as total from sales_orders{where} "
+                f"group by customer_name order by total desc limit ?", params + (limit,))
+            return {"results": {r["customer_name"]: r["total"] or 0.0 for r in rows}, "source": "mirror"}
+        if analysis == MONTHLY_TREND:
+            rows = self.query(
+                f"select substr(order_date, 1, 7) as month, sum(total_amount) as total from sales_orders{where} "
+                f"group by month order by month", params)
+            return {"results": {r["month"]: r["total"] or 0.0 for r in rows if r["month"]}, "source": "mirror"}
+        row = self.query(
+            f"select count(*) as total_records, sum(total_amount) as total_sales, "
+            f"min(order_date) as min_date, max(order_date) as max_date from sales_orders{where}", params)[0]
+        return {
+            "total_records": row["total_records"],
+            "total_sales": row["total_sales"] or 0.0,
+            "min_date": row["min_date"],
+            "max_date": row["max_date"],
+            "source": "mirror",
+        }
+
+    def monthly_totals(self) -> List[Dict[str, Any]]:
+        """按月汇总销售额和订单数"""
+        return self.query(
+            "select substr(order_date, 1, 7) as month, sum(total_amount) as sales_amount, count(*) as order_count "
+            "from sales_orders where order_date is not null group by month order by month")
@@ -0,0 +1,146 @@
+"""
+工具执行器：把阻塞工作移出事件循环
+
+- I/O（Supabase请求、嵌入接口、文件读取）在有界线程池中执行
+- CPU密集的pandas计算在进程池中执行，函数和参数必须可pickle；进程池不可用时退回线程池
+- 每个工具有独立的并发上限，超出的调用排队等待，不影响其他工具
+- 记录每个工具的排队时间（等待并发名额 + 等待池中空闲worker）和执行时间
+"""
+import asyncio
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional
+
+
+def _timed_call(func: Callable, args: tuple):
+    """在worker中记录开始时间，用于计算池内排队时间（进程间比较墙上时间）"""
+    return time.time(), func(*args)
+
+
+def parse_limits(spec: str) -> Dict[str, int]:
+    """解析 "query_sales_data=4,compare_periods=2" 形式的并发上限配置"""
+    limits = {}
+    for item in (spec or "").split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip().isdigit():
+            limits[name.strip()] = int(value)
+    return limits
+
+
+class _ToolStats:
+    __slots__ = ("calls", "active", "peak", "queue_time", "max_queue_time", "run_time")
+
+    def __init__(self):
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self.queue_time = 0.0
+        self.max_queue_time = 0.0
+        self.run_time = 0.0
+
+
+class ToolExecutor:
+    """I/O线程池 + CPU进程池 + 按工具的并发限制"""
+
+    def __init__(self, io_workers: int = 8, cpu_workers: int = 2, default_limit: int = 4,
+                 tool_limits: Dict[str, int] = None):
+        self.io_pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="financial-io")
+        self.cpu_workers = cpu_workers
+        self._cpu_pool: Optional[ProcessPoolExecutor] = None
+        self._cpu_unavailable = False
+        self.default_limit = default_limit
+        self.tool_limits = tool_limits or {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._stats: Dict[str, _ToolStats] = defaultdict(_ToolStats)
+        self._pool_queue_time = {"io": 0.0, "cpu": 0.0}
+        self._pool_calls = {"io": 0, "cpu": 0}
+
+    @classmethod
+    def from_env(cls) -> "ToolExecutor":
+        return cls(
+            io_workers=int(os.getenv("FINANCIAL_IO_WORKERS", "8")),
+            cpu_workers=int(os.getenv("FINANCIAL_CPU_WORKERS", str(min(4, os.cpu_count() or 1)))),
+            default_limit=int(os.getenv("FINANCIAL_TOOL_CONCURRENCY_DEFAULT", "4")),
+            tool_limits=parse_limits(os.getenv("FINANCIAL_TOOL_CONCURRENCY", ""))
+        )
+
+    def _cpu_executor(self):
+        """首次使用时创建进程池；创建失败（受限环境）时改用线程池"""
+        if self._cpu_pool is None and not self._cpu_unavailable:
+            try:
+                self._cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers)
+            except (OSError, NotImplementedError) as e:
+                print(f"[工具执行器] 进程池不可用，CPU任务改用线程池: {e}", file=sys.stderr)
+                self._cpu_unavailable = True
+        return self._cpu_pool or self.io_pool
+
+    async def _submit(self, kind: str, executor, func: Callable, args: tuple) -> Any:
+        loop = asyncio.get_running_loop()
+        submitted = time.time()
+        started, result = await loop.run_in_executor(executor, _timed_call, func, args)
+        self._pool_calls[kind] += 1
+        self._pool_queue_time[kind] += max(0.0, started - submitted)
+        return result
+
+    async def run_io(self, func: Callable, *args) -> Any:
+        """在I/O线程池中执行阻塞调用"""
+        return await self._submit("io", self.io_pool, func, args)
+
+    async def run_cpu(self, func: Callable, *args) -> Any:
+        """在进程池中执行CPU密集的计算，func 需为模块级函数"""
+        return await self._submit("cpu", self._cpu_executor(), func, args)
+
+    @asynccontextmanager
+    async def limit(self, tool_name: str):
+        """按工具限制并发，记录排队和执行时间"""
+        semaphore = self._semaphores.get(tool_name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.tool_limits.get(tool_name, self.default_limit))
+            self._semaphores[tool_name] = semaphore
+        stats = self._stats[tool_name]
+        enqueued = time.time()
+        async with semaphore:
+            started = time.time()
+            waited = started - enqueued
+            stats.calls += 1
+            stats.active += 1
+            stats.peak = max(stats.peak, stats.active)
+            stats.queue_time += waited
+            stats.max_queue_time = max(stats.max_queue_time, waited)
+            try:
+                yield
+            finally:
+                stats.active -= 1
+                stats.run_time += time.time() - started
+
+    def get_stats(self) -> Dict[str, Any]:
+        tools = {}
+        for name, stats in self._stats.items():
+            tools[name] = {
+                "limit": self.tool_limits.get(name, self.default_limit),
+                "calls": stats.calls,
+                "active": stats.active,
+                "peak": stats.peak,
+                "avg_queue_ms": round(stats.queue_time / stats.calls * 1000, 2) if stats.calls else 0.0,
+                "max_queue_ms": round(stats.max_queue_time * 1000, 2),
+                "avg_run_ms": round(stats.run_time / stats.calls * 1000, 2) if stats.calls else 0.0,
+            }
+        pools = {
+            kind: {
+                "calls": self._pool_calls[kind],
+                "avg_queue_ms": round(self._pool_queue_time[kind] / self._pool_calls[kind] * 1000, 2)
+                if self._pool_calls[kind] else 0.0,
+            }
+            for kind in ("io", "cpu")
+        }
+        pools["cpu"]["process_pool"] = self._cpu_pool is not None
+        return {"tools": tools, "pools": pools}
+
+    def shutdown(self):
+        self.io_pool.shutdown(wait=False)
+        if self._cpu_pool is not None:
+            self._cpu_pool.shutdown(wait=False)
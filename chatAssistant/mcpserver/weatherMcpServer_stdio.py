@@ -5,6 +5,7 @@ from datetime import datetime
 import json
 from collections import defaultdict
 
+import anyio
 import requests
 from dotenv import load_dotenv
 from mcp.server.fastmcp import FastMCP
@@ -159,7 +160,7 @@ def get_weather(city_name: str) -> List[Dict]:
 
 
 @mcp.tool('query_weather', '查询城市天气')
-def query_weather(city: str) -> List[Dict]:
+async def query_weather(city: str) -> List[Dict]:
     """
     输入指定城市的中文名称，返回当前天气查询结果。
     :param city: 城市名称
@@ -170,7 +171,11 @@ def query_weather(city: str) -> List[Dict]:
     print(f"[天气工具] 收到查询请求: {city}", file=sys.stderr)
     
     try:
-        result = get_weather(city)
+        # 阻塞的HTTP请求放到线程中执行，进程内加载时不会卡住客户端的事件循环
+        result = await anyio.to_thread.run_sync(get_weather, city)
+        if isinstance(result, str):
+            # get_weather 以文本返回失败原因；抛出后客户端收到 isError 结果，不会缓存
+            raise ValueError(result)
         tool_end = time.time()
         
         result_length = len(str(result))
@@ -185,7 +190,7 @@ def query_weather(city: str) -> List[Dict]:
         print(f"[天气工具] 工具执行失败，耗时: {tool_end - tool_start:.2f}秒", file=sys.stderr)
         print(f"[天气工具] 错误: {str(e)}", file=sys.stderr)
         sys.stderr.flush()
-        return f"天气查询失败: {str(e)}"
+        raise
 
 
 if __name__ == "__main__":
@@ -0,0 +1,149 @@
+"""
+近重复文本处理
+
+- 入库时: 64位 SimHash（字符3-gram），海明距离 <= max_distance 的块视为近重复；
+  1000字的块改动约1%时距离通常在2~8之间，无关文本一般在20以上
+- 查询时: MMR 多样化选择，以及同一来源相邻块的重叠合并
+"""
+import hashlib
+import re
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+DEFAULT_MAX_DISTANCE = 6
+
+
+def simhash(text: str, shingle: int = 3) -> int:
+    """字符级 n-gram 的 SimHash，对中文同样有效；空白先合并，避免排版差异影响指纹"""
+    text = _WHITESPACE.sub(" ", text).strip()
+    if len(text) < shingle:
+        grams = [text] if text else []
+    else:
+        grams = [text[i:i + shingle] for i in range(len(text) - shingle + 1)]
+    if not grams:
+        return 0
+    digests = b"".join(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest() for gram in grams)
+    values = np.frombuffer(digests, dtype=">u8").astype("<u8")
+    # 每行64位，第 i 列为第 i 位（从低位起）
+    bits = np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    weights = 2 * bits.sum(axis=0, dtype=np.int64) - len(grams)
+    return sum(1 << int(bit) for bit in np.flatnonzero(weights > 0))
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex:
+    """
+    近重复查找：把指纹切成 max_distance + 1 段，距离 <= max_distance 的两个指纹
+    至少有一段完全相同（鸽巢原理），只需比较分段命中的候选
+    """
+
+    def __init__(self, max_distance: int = DEFAULT_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._band_count = max_distance + 1
+        self._band_bits = 64 // self._band_count
+        self._fingerprints: Dict[Hashable, int] = {}
+        self._bands: List[Dict[int, set]] = [{} for _ in range(self._band_count)]
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    def _band_values(self, fingerprint: int):
+        mask = (1 << self._band_bits) - 1
+        return [(fingerprint >> (i * self._band_bits)) & mask for i in range(self._band_count)]
+
+    def add(self, key: Hashable, fingerprint: int):
+        self.remove(key)
+        self._fingerprints[key] = fingerprint
+        for band, value in zip(self._bands, self._band_values(fingerprint)):
+            band.setdefault(value, set()).add(key)
+
+    def remove(self, key: Hashable):
+        fingerprint = self._fingerprints.pop(key, None)
+        if fingerprint is None:
+            return
+        for band, value in zip(self._bands, self._band_values(fingerprint)):
+            keys = band.get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del band[value]
+
+    def find(self, fingerprint: int) -> Optional[Hashable]:
+        """返回一个近重复块的键，没有时返回None"""
+        for band, value in zip(self._bands, self._band_values(fingerprint)):
+            for key in band.get(value, ()):
+                if hamming(self._fingerprints[key], fingerprint) <= self.max_distance:
+                    return key
+        return None
+
+
+def mmr_select(query: Sequence[float], docs: List[Dict[str, Any]], k: int,
+               lambda_mult: float = 0.7) -> List[Dict[str, Any]]:
+    """
+    最大边际相关性: 每次选 λ·sim(q, d) - (1-λ)·max sim(d, 已选) 最大的文档
+    docs 需带 "vector"（已归一化）
+    """
+    if len(docs) <= 1 or k <= 0:
+        return docs[:k]
+    vectors = np.asarray([doc["vector"] for doc in docs], dtype=np.float32)
+    query = np.asarray(query, dtype=np.float32)
+    relevance = vectors @ (query / (np.linalg.norm(query) or 1.0))
+    pairwise = vectors @ vectors.T
+    selected = [int(np.argmax(relevance))]
+    while len(selected) < min(k, len(docs)):
+        redundancy = pairwise[:, selected].max(axis=1)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        selected.append(int(np.argmax(scores)))
+    return [docs[i] for i in selected]
+
+
+def _overlap(left: str, right: str, min_overlap: int, max_overlap: int) -> int:
+    """left 的后缀与 right 的前缀重合的最大长度，不足 min_overlap 时为0"""
+    for size in range(min(len(left), len(right), max_overlap), min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def merge_overlaps(docs: List[Dict[str, Any]], min_overlap: int = 50, max_overlap: int = 400) -> List[Dict[str, Any]]:
+    """
+    合并同一来源中首尾重叠的块（分块时的 chunk_overlap），合并后的块保留组内最高相似度，
+    结果按相似度降序排列
+    """
+    groups: Dict[Any, List[Dict[str, Any]]] = {}
+    for doc in docs:
+        source = (doc.get("metadata") or {}).get("source")
+        groups.setdefault(source if source is not None else id(doc), []).append(doc)
+
+    merged = []
+    for group in groups.values():
+        group.sort(key=lambda doc: (doc.get("metadata") or {}).get("chunk", 0))
+        current = dict(group[0])
+        for doc in group[1:]:
+            size = _overlap(current["content"], doc["content"], min_overlap, max_overlap)
+            if size:
+                current["content"] += doc["content"][size:]
+                current["similarity"] = max(current.get("similarity") or 0.0, doc.get("similarity") or 0.0)
+            else:
+                merged.append(current)
+                current = dict(doc)
+        merged.append(current)
+    return sorted(merged, key=lambda doc: doc.get("similarity") or 0.0, reverse=True)
+
+
+def drop_near_duplicates(docs: List[Dict[str, Any]], max_distance: int = DEFAULT_MAX_DISTANCE) -> List[Dict[str, Any]]:
+    """按顺序保留每组近重复中的第一条（没有向量可用于MMR时使用）"""
+    index = SimHashIndex(max_distance)
+    kept = []
+    for i, doc in enumerate(docs):
+        fingerprint = simhash(doc["content"])
+        if index.find(fingerprint) is None:
+            index.add(i, fingerprint)
+            kept.append(doc)
+    return kept
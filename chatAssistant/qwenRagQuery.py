@@ -6,6 +6,9 @@ from dotenv import load_dotenv
 from openai import OpenAI
 from supabase import create_client
 from QwenEmbeddings import QwenEmbeddings
+from vector_index import DocumentVectorIndex
+from near_duplicates import drop_near_duplicates, merge_overlaps, mmr_select
+from token_budget import pack_documents
 
 # 修复导入 - 使用绝对导入而不是相对导入
 try:
@@ -16,6 +19,7 @@ except ImportError:
         "model": "qwen-omni-turbo",
         "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1",
         "port": 8000,
+        "context_token_budget": {"default": 1500},
     }
 
 load_dotenv()
@@ -24,47 +28,96 @@ load_dotenv()
 supabase = create_client(os.getenv("SUPABASE_URL"),
                          os.getenv("SUPABASE_KEY"))
 
+MATCH_THRESHOLD = 0.3  # 可调整的相似度阈值
+CANDIDATE_FACTOR = 3  # 召回 top_k 的若干倍候选，去冗余后再取 top_k
+MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))  # 越小越偏向多样性
+
+# testdoc 的进程内向量索引，后台加载并增量同步；VECTOR_INDEX_ENABLED=0 时始终走 match_documents
+document_index = DocumentVectorIndex(
+    supabase,
+    sync_interval=float(os.getenv("VECTOR_INDEX_SYNC_INTERVAL", "60")),
+    hnsw_threshold=int(os.getenv("VECTOR_INDEX_HNSW_THRESHOLD", "50000")),
+    # 各进程只读映射同一个索引文件；设为空字符串时只保存在进程内存中
+    index_path=os.getenv("VECTOR_INDEX_PATH", "./.vector_index/testdoc.idx") or None
+)
+if os.getenv("VECTOR_INDEX_ENABLED", "1") != "0":
+    document_index.start()
+
+_embeddings = None
+
+
 # 初始化客户端和模型
 def get_qestion_embedding(question):
+    global _embeddings
     print("qestion=====", question,file=sys.stderr)
     sys.stderr.flush()
-    # 初始化嵌入模型
-    embeddings = QwenEmbeddings(os.getenv("TEXT-EMBEDDING-V1_KEY"), "https://dashscope.aliyuncs.com/compatible-mode/v1")
-    # 初始化向量存储
-    question_embedding = embeddings._get_embedding(question)
+    # 嵌入模型只初始化一次，重复的问题命中嵌入缓存
+    if _embeddings is None:
+        _embeddings = QwenEmbeddings(os.getenv("TEXT-EMBEDDING-V1_KEY"), "https://dashscope.aliyuncs.com/compatible-mode/v1")
+    question_embedding = _embeddings._get_embedding(question)
     return question_embedding
 
 
-def retrieve_documents(question: str, top_k: int = 5) -> list[str]:
+def retrieve_scored_documents(question: str, top_k: int = 5) -> list[dict]:
+    """
+    检索并去冗余，返回带 content、metadata、similarity 的文档，按相似度降序
+    先召回 top_k 的若干倍候选，用MMR去掉近重复的块，再合并同一来源中首尾重叠的相邻块
+    """
     # 获取问题嵌入
     input_embedding = get_qestion_embedding(question)
-    # 调用Supabase的match_documents函数
-    response = supabase.rpc(
-        "match_documents",
-        {
-            "query_embedding": input_embedding,
-            "match_threshold": 0.3,  # 可调整的相似度阈值
-            "match_count": top_k,
-            "table_name": "testdoc"
-        }
-    ).execute()
+    candidate_count = top_k * CANDIDATE_FACTOR
+    # 本地索引就绪时在进程内检索，否则调用Supabase的match_documents函数
+    if document_index.ready:
+        candidates = document_index.search(input_embedding, candidate_count, MATCH_THRESHOLD, include_vectors=True)
+        selected = mmr_select(input_embedding, candidates, top_k, MMR_LAMBDA)
+    else:
+        response = supabase.rpc(
+            "match_documents",
+            {
+                "query_embedding": input_embedding,
+                "match_threshold": MATCH_THRESHOLD,
+                "match_count": candidate_count,
+                "table_name": "testdoc"
+            }
+        ).execute()
+        # RPC 不返回向量，按文本指纹去掉近重复
+        selected = drop_near_duplicates(response.data or [])[:top_k]
+    documents = merge_overlaps(selected)
+    for doc in documents:
+        doc.pop("vector", None)
+    return documents
+
 
+def retrieve_documents(question: str, top_k: int = 5) -> list[str]:
     # 提取文本内容
-    return [doc['content'] for doc in response.data]
-
-
-def build_context(documents: list[str], his) -> list:
-    messages = []
-    textArr = []
-    messages = messages + his
-    for document in documents:
-        docs = {"type": "text", "text": document}
-        textArr.append(docs)
-    if len(textArr) > 0:
-        messages.append({"role": "user", "content": textArr})
-    return messages
+    return [doc['content'] for doc in retrieve_scored_documents(question, top_k)]
+
+
+def context_budget(intent: str) -> int:
+    budgets = config.get("context_token_budget", {})
+    return budgets.get(intent, budgets.get("default", 1500))
 
 
+def build_context(documents: list, his, intent: str = "knowledge_base", trace: dict = None) -> list:
+    """
+    在意图的token预算内装填检索文档，追加为一条用户消息
+    documents 可以是 retrieve_scored_documents 的结果（按 similarity 从高到低装填），
+    也可以是纯文本列表（按原顺序装填）；放不下的文档在句子边界处截断，截断后过短的跳过（见 pack_documents）。
+    传入 trace 时把预算使用情况写入 trace["context_budget"]
+    """
+    started = time.time()
+    texts, report = pack_documents(documents, context_budget(intent))
+    report = dict(intent=intent, **report, ms=round((time.time() - started) * 1000, 2))
+    if trace is not None:
+        trace["context_budget"] = report
+    print(f"[上下文] 预算 {report['budget']} tokens，已用 {report['used']}，"
+          f"文档 {report['included']}/{report['documents']}（截断 {report['truncated']}）", file=sys.stderr)
+
+    messages = list(his)
+    if texts:
+        messages.append({"role": "user", "content": [{"type": "text", "text": text} for text in texts]})
+    return messages
+
 
 if __name__ == "__main__":
     start_time = time.time()
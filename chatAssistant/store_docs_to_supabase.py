@@ -1,16 +1,26 @@
+import argparse
+import collections
+import hashlib
 import json
+import logging
 import os
+import queue
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
 
 from dotenv import load_dotenv
-from langchain.chains import RetrievalQA
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from openai import OpenAI
 from supabase import create_client
 from QwenEmbeddings import QwenEmbeddings
+from doc_splitter import split_source_file
+from near_duplicates import SimHashIndex, simhash
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 QWEN_API_KEY = os.getenv("QWEN-ONMI-TURBO_API_KEY")
 embbinding_key = os.getenv("TEXT-EMBEDDING-V1_KEY")
 
@@ -19,69 +29,475 @@ supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
 supabase = create_client(supabase_url, supabase_key)
 
+DEFAULT_MANIFEST_PATH = "./.ingest/manifest.json"
+DEFAULT_SPLIT_WORKERS = int(os.getenv("INGEST_SPLIT_WORKERS", str(os.cpu_count() or 1)))
+
+
+def iter_source_files(dir_path: str) -> Iterator[str]:
+    """按路径顺序列出目录下的 .txt 文件"""
+    for path in sorted(Path(dir_path).glob("**/*.txt")):
+        if path.is_file():
+            yield str(path)
+
 
-def custom_text_loader(file_path):
-    return TextLoader(file_path, encoding="utf-8")
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def split_file(file_path: str) -> List[Dict[str, Any]]:
+    """加载单个文件并分块，转换为适合Supabase存储的格式"""
+    return split_source_file(file_path)[1]
 
 
 # 文档加载与分块
 def load_and_split_docs(dir_path: str = "./documents"):
-    loader = DirectoryLoader(dir_path, glob="**/*.txt", loader_cls=custom_text_loader)
-    documents = loader.load()
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-    )
-    texts = text_splitter.split_documents(documents)
-    print("texts:", texts)
-    # 转换为适合Supabase存储的格式
     doc_items = []
-    for i, text in enumerate(texts):
-        doc_items.append({
-            "content": text.page_content,
-            "metadata": {
-                "source": text.metadata.get("source", f"doc_{i}"),
-                "page": text.metadata.get("page", 0)
+    for file_path in iter_source_files(dir_path):
+        doc_items.extend(split_file(file_path))
+    return doc_items
+
+
+class IngestionManifest:
+    """
+    入库清单: 每个来源文件的大小、mtime、内容哈希、已入库的 chunk_id 及其 SimHash 指纹
+    文件的所有新块写入完成后才更新清单，因此中断后重跑会从未完成的文件继续
+    """
+
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = 0.0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.files: Dict[str, Dict[str, Any]] = json.load(f)
+        except (OSError, ValueError):
+            self.files = {}
+
+    @staticmethod
+    def signature(file_path: str) -> List[int]:
+        stat = os.stat(file_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def get(self, file_path: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self.files.get(file_path)
+
+    def record(self, file_path: str, sha256: str, chunk_ids: List[str], signature: List[int] = None,
+               simhashes: Dict[str, str] = None, duplicate_of: List[str] = None,
+               positions: Dict[str, List[int]] = None):
+        with self._lock:
+            previous = self.files.get(file_path) or {}
+            self.files[file_path] = {
+                "signature": signature or self.signature(file_path),
+                "sha256": sha256,
+                "chunk_ids": chunk_ids,
+                "simhashes": simhashes if simhashes is not None else previous.get("simhashes", {}),
+                # 因近重复被丢弃的块所匹配的已入库块；这些块被删除后需要重新分块补回丢弃的块
+                "duplicate_of": duplicate_of if duplicate_of is not None else previous.get("duplicate_of", []),
+                # chunk_id -> [块序号, 起始偏移, 结束偏移]，复用的块位置变化时据此只更新元数据
+                "positions": positions if positions is not None else previous.get("positions", {}),
             }
-        })
+            self._dirty = True
+        self.save()
 
-    return doc_items
+    def remove(self, file_path: str):
+        with self._lock:
+            self.files.pop(file_path, None)
+            self._dirty = True
+        self.save()
+
+    def save(self, force: bool = False, interval: float = 2.0):
+        """写入磁盘；非强制时最多每 interval 秒写一次，避免大目录下反复重写整个清单"""
+        with self._lock:
+            if not self._dirty or (not force and time.time() - self._saved_at < interval):
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.files, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            self._saved_at = time.time()
+
+    def reset(self):
+        with self._lock:
+            self.files = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class _Stopped(Exception):
+    pass
+
+
+_END = object()
+
+
+class IngestionPipeline:
+    """
+    流式入库管道: 加载 -> 分块 -> 嵌入 -> 写入
+    各阶段在独立线程中并发运行，之间用有界队列连接，内存占用只取决于队列和批次大小，与语料规模无关；
+    分块阶段把文件分发到进程池并行切分。
+    增量入库: 大小/mtime或内容哈希未变的文件直接跳过；变化的文件只嵌入 chunk_id 不在清单中的块，
+    按 chunk_id upsert，并删除文件中已不存在的块；来源文件被删除时删除其全部块。
+    新块与语料中已有块（含本次已处理的块）SimHash 近重复时丢弃，重复的模板段落只保留一份。
+    需要 testdoc 表上有唯一的 chunk_id 列:
+        alter table testdoc add column if not exists chunk_id text unique;
+    """
+
+    def __init__(self, embeddings: QwenEmbeddings, client=supabase, table: str = "testdoc",
+                 embed_batch_size: int = 100, insert_batch_size: int = 100, queue_size: int = 4,
+                 manifest: Optional[IngestionManifest] = None, progress_interval: float = 5,
+                 dedupe_distance: Optional[int] = 6, split_workers: int = DEFAULT_SPLIT_WORKERS):
+        self.embeddings = embeddings
+        self.client = client
+        self.table = table
+        self.embed_batch_size = embed_batch_size
+        self.insert_batch_size = insert_batch_size
+        self.manifest = manifest or IngestionManifest()
+        self.progress_interval = progress_interval
+        # 分块在进程池中按文件并行，结果按文件顺序取回，去重结果与单进程一致
+        self.split_workers = max(1, split_workers)
+        # chunk_id -> SimHash 指纹，dedupe_distance 为 None 时不去重
+        self.dedupe_index = SimHashIndex(dedupe_distance) if dedupe_distance is not None else None
+        # 本轮无论是否变化都要重新分块的文件
+        self._force_files = set()
+        self.queue_size = queue_size
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+        # 文件 -> 待写入块数 / 完成后要写入清单和删除的内容
+        self._pending: Dict[str, int] = {}
+        self._file_state: Dict[str, Dict[str, Any]] = {}
+        self._pending_lock = threading.Lock()
+        self._seen_files = set()
+        self.stats = {"files": 0, "unchanged_files": 0, "removed_files": 0, "chunks": 0, "reused_chunks": 0,
+                      "duplicate_chunks": 0, "embedded": 0, "upserted": 0, "relocated_chunks": 0,
+                      "deleted_chunks": 0}
+        self._started = None
+        self._last_report = 0.0
+
+    # ---------- 队列工具 ----------
+
+    def _put(self, q: queue.Queue, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise _Stopped()
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        raise _Stopped()
+
+    def _run_stage(self, stage, *args):
+        try:
+            stage(*args)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop.set()
+
+    # ---------- 各阶段 ----------
+
+    def _load_stage(self, files: Iterator[str]):
+        for file_path in files:
+            self._seen_files.add(file_path)
+            entry = self.manifest.get(file_path)
+            if entry is not None and file_path not in self._force_files:
+                signature = self.manifest.signature(file_path)
+                if entry["signature"] == signature:
+                    self.stats["unchanged_files"] += 1
+                    continue
+                # mtime变了但内容没变（如touch、重新拷贝），只更新签名
+                sha256 = file_sha256(file_path)
+                if entry["sha256"] == sha256:
+                    self.manifest.record(file_path, sha256, entry["chunk_ids"], signature)
+                    self.stats["unchanged_files"] += 1
+                    continue
+            self._put(self.file_queue, file_path)
+        self._put(self.file_queue, _END)
+
+    def _split_pool(self) -> Executor:
+        if self.split_workers > 1:
+            try:
+                return ProcessPoolExecutor(max_workers=self.split_workers)
+            except (OSError, NotImplementedError) as e:
+                logger.warning(f"[入库] 进程池不可用，改为在线程中分块: {e}")
+        return ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-split")
+
+    def _split_stage(self):
+        pool = self._split_pool()
+        in_flight = collections.deque()
+        finished = False
+        try:
+            while in_flight or not finished:
+                # 保持每个进程约两个文件在途，队列有界，内存不随语料增长
+                while not finished and len(in_flight) < self.split_workers * 2:
+                    file_path = self._get(self.file_queue)
+                    if file_path is _END:
+                        finished = True
+                    else:
+                        signature = self.manifest.signature(file_path)
+                        in_flight.append((file_path, signature, pool.submit(split_source_file, file_path)))
+                if in_flight:
+                    file_path, signature, future = in_flight.popleft()
+                    sha256, chunks = future.result()
+                    self._accept_chunks(file_path, signature, sha256, chunks)
+        finally:
+            pool.shutdown(wait=not self._stop.is_set(), cancel_futures=True)
+        self._put(self.chunk_queue, _END)
+
+    def _accept_chunks(self, file_path: str, signature: List[int], sha256: str, chunks: List[Dict[str, Any]]):
+        entry = self.manifest.get(file_path)
+        known = set(entry["chunk_ids"]) if entry else set()
+        if entry and self.dedupe_index is not None:
+            for chunk_id in entry.get("simhashes", {}):
+                self.dedupe_index.remove(chunk_id)
+        chunks, new_chunks, fingerprints, duplicate_of = self._dedupe(chunks, known)
+        chunk_ids = [chunk["chunk_id"] for chunk in chunks]
+        positions = {chunk["chunk_id"]: [chunk["metadata"]["chunk"], chunk["metadata"]["start"], chunk["metadata"]["end"]]
+                     for chunk in chunks}
+        # 内容未变的块不重新嵌入，但前面的编辑会移动它的位置；位置变了的只更新元数据
+        # （清单中没有位置的旧条目视为全部变化）
+        previous_positions = entry.get("positions", {}) if entry else {}
+        relocated = [chunk for chunk in chunks if chunk["chunk_id"] in known
+                     and previous_positions.get(chunk["chunk_id"]) != positions[chunk["chunk_id"]]]
+        self.stats["files"] += 1
+        self.stats["chunks"] += len(chunks)
+        self.stats["reused_chunks"] += len(chunks) - len(new_chunks)
+        # 先登记再投递，写入阶段据此判断文件何时完整入库
+        with self._pending_lock:
+            self._pending[file_path] = len(new_chunks)
+            self._file_state[file_path] = {
+                "signature": signature,
+                "sha256": sha256,
+                "chunk_ids": chunk_ids,
+                "simhashes": fingerprints,
+                "duplicate_of": duplicate_of,
+                "positions": positions,
+                "relocated": relocated,
+                "stale": sorted(known - set(chunk_ids)),
+            }
+        if not new_chunks:
+            self._complete_file(file_path)
+        for chunk in new_chunks:
+            chunk["_file"] = file_path
+            self._put(self.chunk_queue, chunk)
+
+    def _dedupe(self, chunks: List[Dict[str, Any]], known: set):
+        """
+        丢弃与已入库块近重复的新块；已入库的块保留并重新登记指纹
+        返回 (保留的块, 其中需要嵌入的新块, chunk_id -> 指纹, 丢弃的块各自匹配到的 chunk_id)
+        """
+        kept, new_chunks, fingerprints, duplicate_of = [], [], {}, []
+        for chunk in chunks:
+            fingerprint = simhash(chunk["content"]) if self.dedupe_index is not None else None
+            if chunk["chunk_id"] not in known:
+                original = self.dedupe_index.find(fingerprint) if fingerprint is not None else None
+                if original is not None:
+                    duplicate_of.append(original)
+                    continue
+                new_chunks.append(chunk)
+            kept.append(chunk)
+            if fingerprint is not None:
+                self.dedupe_index.add(chunk["chunk_id"], fingerprint)
+                fingerprints[chunk["chunk_id"]] = format(fingerprint, "016x")
+        self.stats["duplicate_chunks"] += len(duplicate_of)
+        return kept, new_chunks, fingerprints, duplicate_of
+
+    def _load_dedupe_index(self, dir_path: str):
+        """用清单中仍存在的来源文件的指纹初始化去重索引；已删除来源的块不参与去重"""
+        if self.dedupe_index is None:
+            return
+        existing = set(iter_source_files(dir_path))
+        for file_path, entry in self.manifest.files.items():
+            if file_path in existing:
+                for chunk_id, fingerprint in entry.get("simhashes", {}).items():
+                    self.dedupe_index.add(chunk_id, int(fingerprint, 16))
+
+    def _embed_stage(self):
+        finished = False
+        while not finished:
+            batch = []
+            while len(batch) < self.embed_batch_size:
+                chunk = self._get(self.chunk_queue)
+                if chunk is _END:
+                    finished = True
+                    break
+                batch.append(chunk)
+            if batch:
+                vectors = self.embeddings.embed_documents([chunk["content"] for chunk in batch])
+                for chunk, vector in zip(batch, vectors):
+                    chunk["embedding"] = vector
+                self.stats["embedded"] += len(batch)
+                self._put(self.row_queue, batch)
+        self._put(self.row_queue, _END)
+
+    def _insert_stage(self):
+        buffer: List[Dict[str, Any]] = []
+        while True:
+            batch = self._get(self.row_queue)
+            if batch is not _END:
+                buffer.extend(batch)
+            while len(buffer) >= self.insert_batch_size or (batch is _END and buffer):
+                rows, buffer = buffer[:self.insert_batch_size], buffer[self.insert_batch_size:]
+                self._insert(rows)
+            self._report()
+            if batch is _END:
+                return
+
+    def _insert(self, rows: List[Dict[str, Any]]):
+        payload = [{"chunk_id": r["chunk_id"], "content": r["content"], "metadata": r["metadata"],
+                    "embedding": r["embedding"]} for r in rows]
+        # 按 chunk_id upsert，中断后重跑不会产生重复行
+        self.client.table(self.table).upsert(payload, on_conflict="chunk_id").execute()
+        self.stats["upserted"] += len(rows)
+        completed = []
+        with self._pending_lock:
+            for row in rows:
+                file_path = row["_file"]
+                self._pending[file_path] -= 1
+                if self._pending[file_path] == 0:
+                    completed.append(file_path)
+        for file_path in completed:
+            self._complete_file(file_path)
+
+    def _update_metadata(self, chunks: List[Dict[str, Any]]):
+        """只更新复用块的内容和元数据，不带 embedding，已有的向量保持不变"""
+        for start in range(0, len(chunks), self.insert_batch_size):
+            payload = [{"chunk_id": c["chunk_id"], "content": c["content"], "metadata": c["metadata"]}
+                       for c in chunks[start:start + self.insert_batch_size]]
+            self.client.table(self.table).upsert(payload, on_conflict="chunk_id").execute()
+        self.stats["relocated_chunks"] += len(chunks)
+
+    def _delete_chunks(self, chunk_ids: List[str], batch_size: int = 200):
+        for start in range(0, len(chunk_ids), batch_size):
+            self.client.table(self.table).delete().in_("chunk_id", chunk_ids[start:start + batch_size]).execute()
+        self.stats["deleted_chunks"] += len(chunk_ids)
+
+    def _complete_file(self, file_path: str):
+        """文件的新块全部写入后，删除已不存在的块并更新清单"""
+        with self._pending_lock:
+            self._pending.pop(file_path, None)
+            state = self._file_state.pop(file_path)
+        if state["relocated"]:
+            self._update_metadata(state["relocated"])
+        if state["stale"]:
+            self._delete_chunks(state["stale"])
+        self.manifest.record(file_path, state["sha256"], state["chunk_ids"], state["signature"],
+                             state["simhashes"], state["duplicate_of"], state["positions"])
+
+    def _remove_missing_sources(self):
+        """删除来源文件已不存在的块"""
+        for file_path in [path for path in list(self.manifest.files) if path not in self._seen_files]:
+            entry = self.manifest.get(file_path)
+            self._delete_chunks(entry["chunk_ids"])
+            self.manifest.remove(file_path)
+            self.stats["removed_files"] += 1
+
+    def _report(self, force: bool = False):
+        now = time.time()
+        if not force and now - self._last_report < self.progress_interval:
+            return
+        self._last_report = now
+        elapsed = now - self._started
+        rate = self.stats["upserted"] / elapsed if elapsed > 0 else 0.0
+        logger.info(f"[入库] 变化文件 {self.stats['files']}（未变 {self.stats['unchanged_files']}），"
+                    f"分块 {self.stats['chunks']}（复用 {self.stats['reused_chunks']}，近重复 {self.stats['duplicate_chunks']}），已嵌入 {self.stats['embedded']}，"
+                    f"已写入 {self.stats['upserted']}，更新位置 {self.stats['relocated_chunks']}，已删除 {self.stats['deleted_chunks']}，"
+                    f"{rate:.1f} 块/秒，耗时 {elapsed:.1f}秒")
+
+    def _orphaned_duplicates(self) -> List[str]:
+        """丢弃的近重复块所匹配的块已不在库中（来源被删除或改动）的文件"""
+        live = set()
+        for entry in self.manifest.files.values():
+            live.update(entry["chunk_ids"])
+        return [path for path, entry in self.manifest.files.items()
+                if any(chunk_id not in live for chunk_id in entry.get("duplicate_of", []))]
+
+    def _run_pass(self, files: Iterator[str]):
+        # 队列元素: 文件路径 / 块 / 嵌入后的块批次，全部有界
+        self.file_queue = queue.Queue(maxsize=self.queue_size)
+        self.chunk_queue = queue.Queue(maxsize=self.embed_batch_size * self.queue_size)
+        self.row_queue = queue.Queue(maxsize=self.queue_size)
+        stages = [
+            threading.Thread(target=self._run_stage, args=(self._load_stage, files), name="ingest-load"),
+            threading.Thread(target=self._run_stage, args=(self._split_stage,), name="ingest-split"),
+            threading.Thread(target=self._run_stage, args=(self._embed_stage,), name="ingest-embed"),
+            threading.Thread(target=self._run_stage, args=(self._insert_stage,), name="ingest-insert"),
+        ]
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.join()
+
+    def run(self, dir_path: str) -> Dict[str, Any]:
+        """运行管道直到所有文件入库；任一阶段出错时停止其余阶段并抛出该错误"""
+        self._started = time.time()
+        self._load_dedupe_index(dir_path)
+        self._run_pass(iter_source_files(dir_path))
+        if not self._errors:
+            self._remove_missing_sources()
+            # 近重复块的原件被删除后重新分块这些文件：原件仍有近似块时照旧丢弃，否则补回
+            orphaned = self._orphaned_duplicates()
+            if orphaned:
+                logger.info(f"[入库] {len(orphaned)} 个文件的近重复原件已删除，重新检查")
+                self._force_files = set(orphaned)
+                self._run_pass(iter(orphaned))
+        self.manifest.save(force=True)
+        self._report(force=True)
+        if self._errors:
+            raise self._errors[0]
+        elapsed = time.time() - self._started
+        return dict(self.stats, seconds=round(elapsed, 2),
+                    chunks_per_second=round(self.stats["upserted"] / elapsed, 2) if elapsed > 0 else None)
 
 
 # 生成嵌入并存储到Supabase
-def store_embeddings_to_supabase(docs):
+def store_embeddings_to_supabase(dir_path: str, insert_batch_size: int = 100, embed_batch_size: int = 100,
+                                 manifest_path: str = DEFAULT_MANIFEST_PATH, reset: bool = False,
+                                 dedupe_distance: Optional[int] = 6, split_workers: int = DEFAULT_SPLIT_WORKERS):
     # 初始化嵌入模型
     embeddings = QwenEmbeddings(embbinding_key, "https://dashscope.aliyuncs.com/compatible-mode/v1")
-
-    # 提取文本内容
-    texts = [doc["content"] for doc in docs]
-
-    # 生成嵌入向量
-    print(f"正在生成{len(texts)}个文本块的嵌入向量...")
-    embedding_json = embeddings.embed_documents(texts)
-    # 将embedding_vectors字符串转为json对象
-    embedding_data = json.loads(embedding_json)
-    # 准备数据批量插入
-    data_to_insert = []
-    for i, doc in enumerate(docs):
-        data_to_insert.append({
-            "content": doc["content"],
-            "metadata": doc["metadata"],
-            "embedding": embedding_data["data"][i]["embedding"]
-        })
-
-    # 批量插入到Supabase
-    print(f"正在将{len(data_to_insert)}条记录存入Supabase...")
-    print("data_to_insert:\n", data_to_insert)
-    response = supabase.table("testdoc").insert(data_to_insert).execute()
-
-    if len(response.data) > 0:
-        print(f"成功存入{len(response.data)}条记录")
-    else:
-        print("存入失败:", response.error)
+    manifest = IngestionManifest(manifest_path)
+    if reset:
+        manifest.reset()
+    pipeline = IngestionPipeline(
+        embeddings,
+        embed_batch_size=embed_batch_size,
+        insert_batch_size=insert_batch_size,
+        manifest=manifest,
+        dedupe_distance=dedupe_distance,
+        split_workers=split_workers
+    )
+    stats = pipeline.run(dir_path)
+    logger.info(f"成功写入{stats['upserted']}条记录，删除{stats['deleted_chunks']}条，{stats['chunks_per_second']} 块/秒")
+    return stats
 
 
 if __name__ == '__main__':
-    docs = load_and_split_docs(".")
-    print("items:", docs)
-    store_embeddings_to_supabase(docs)
+    parser = argparse.ArgumentParser(description="把目录下的文本文件分块、嵌入并存入Supabase")
+    parser.add_argument("dir", nargs="?", default=".", help="文档目录")
+    parser.add_argument("--insert-batch-size", type=int, default=100)
+    parser.add_argument("--embed-batch-size", type=int, default=100)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH)
+    parser.add_argument("--reset", action="store_true", help="忽略清单，全部重新嵌入并写入")
+    parser.add_argument("--dedupe-distance", type=int, default=6, help="SimHash 汉明距离不超过该值的块视为近重复")
+    parser.add_argument("--no-dedupe", action="store_true", help="不做近重复去除")
+    parser.add_argument("--split-workers", type=int, default=DEFAULT_SPLIT_WORKERS, help="分块进程数，1为不用进程池")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store_embeddings_to_supabase(args.dir, args.insert_batch_size, args.embed_batch_size, args.manifest, args.reset,
+                                 None if args.no_dedupe else args.dedupe_distance, args.split_workers)
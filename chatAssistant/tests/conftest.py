@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 模块按 chatAssistant 目录为根导入（from mcpserver.x import ...）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
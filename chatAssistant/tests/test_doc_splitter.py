@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from doc_splitter import split_source_file, split_spans, split_text
+
+
+def _sample_text(paragraphs: int = 30, seed: int = 7) -> str:
+    rng = random.Random(seed)
+    words = ["收入", "成本", "利润", "现金流", "资产", "负债", "季度", "同比", "增长", "下降"]
+    out = []
+    for _ in range(paragraphs):
+        sentences = []
+        for _ in range(rng.randint(2, 8)):
+            body = "，".join("".join(rng.choice(words) for _ in range(rng.randint(2, 12)))
+                            for _ in range(rng.randint(1, 4)))
+            sentences.append(body + rng.choice("。！？；"))
+        out.append("".join(sentences))
+    return "\n\n".join(out)
+
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(1000, 200), (300, 50), (120, 0), (80, 40)])
+def test_spans_respect_chunk_size_and_overlap(chunk_size, chunk_overlap):
+    text = _sample_text()
+    spans = split_spans(text, chunk_size, chunk_overlap)
+    assert spans
+    for start, end in spans:
+        assert 0 < end - start <= chunk_size
+        assert not text[start].isspace() and not text[end - 1].isspace()
+    for (start, end), (next_start, next_end) in zip(spans, spans[1:]):
+        # 窗口向前推进，重叠不超过 chunk_overlap
+        assert next_start > start and next_end > end
+        assert max(0, end - next_start) <= chunk_overlap
+
+
+def test_spans_cover_all_text():
+    text = _sample_text()
+    covered = set()
+    for start, end in split_spans(text, 200, 40):
+        covered.update(range(start, end))
+    assert all(i in covered for i, ch in enumerate(text) if not ch.isspace())
+
+
+def test_cuts_prefer_sentence_ends():
+    text = "第一句话写完了。" * 20
+    for chunk in split_text(text, 50, 0):
+        assert chunk.endswith("。")
+
+
+def test_long_run_without_separators_is_hard_cut():
+    text = "a" * 250
+    assert split_spans(text, 100, 0) == [(0, 100), (100, 200), (200, 250)]
+
+
+def test_empty_and_whitespace_text():
+    assert split_spans("", 100, 10) == []
+    assert split_spans(" \n\n \t", 100, 10) == []
+
+
+def test_chunk_ids_survive_insertion_before(tmp_path):
+    path = tmp_path / "doc.txt"
+    body = _sample_text(paragraphs=20)
+    path.write_text(body, encoding="utf-8")
+    _, before = split_source_file(str(path), 300, 0)
+    path.write_text("新增的开头段落。\n\n" + body, encoding="utf-8")
+    _, after = split_source_file(str(path), 300, 0)
+    before_ids = {chunk["chunk_id"] for chunk in before}
+    after_ids = {chunk["chunk_id"] for chunk in after}
+    # 只有开头受影响的块 id 改变
+    assert len(before_ids & after_ids) >= len(before_ids) - 2
@@ -0,0 +1,83 @@
+import numpy as np
+
+from near_duplicates import (SimHashIndex, drop_near_duplicates, hamming, merge_overlaps,
+                             mmr_select, simhash)
+
+TEXT = ("本季度营业收入同比增长百分之十二，主要来自华东地区的新客户。营业成本随原材料价格上涨，"
+        "毛利率较上季度下降一个百分点。管理费用保持稳定，研发投入继续增加，净利润率与去年同期持平。") * 4
+
+
+def test_simhash_ignores_whitespace_layout():
+    assert simhash(TEXT.replace("。", "。 ")) == simhash("  " + TEXT.replace("。", "。\n\n\t") + "\n")
+
+
+def test_simhash_empty_text():
+    assert simhash("") == 0
+    assert simhash("  ") == 0
+
+
+def test_find_returns_near_duplicate():
+    index = SimHashIndex(max_distance=6)
+    index.add("a", simhash(TEXT))
+    edited = TEXT.replace("华东", "华南", 1)
+    assert hamming(simhash(TEXT), simhash(edited)) <= 6
+    assert index.find(simhash(edited)) == "a"
+
+
+def test_find_ignores_unrelated_text():
+    index = SimHashIndex(max_distance=6)
+    index.add("a", simhash(TEXT))
+    assert index.find(simhash("完全无关的一段天气预报：明天多云转晴，最高气温二十五度，东南风三级。" * 3)) is None
+
+
+def test_find_matches_within_max_distance_only():
+    index = SimHashIndex(max_distance=3)
+    base = 0x0123456789ABCDEF
+    index.add("a", base)
+    assert index.find(base ^ 0b111) == "a"
+    assert index.find(base ^ 0b1111) is None
+
+
+def test_remove_and_readd():
+    index = SimHashIndex()
+    fingerprint = simhash(TEXT)
+    index.add("a", fingerprint)
+    index.add("a", fingerprint)
+    assert len(index) == 1
+    index.remove("a")
+    index.remove("missing")
+    assert len(index) == 0
+    assert index.find(fingerprint) is None
+    assert all(not band for band in index._bands)
+
+
+def test_drop_near_duplicates_keeps_first():
+    docs = [{"content": TEXT}, {"content": TEXT.replace("华东", "华南", 1)}, {"content": "另一段内容。" * 30}]
+    assert drop_near_duplicates(docs) == [docs[0], docs[2]]
+
+
+def test_mmr_select_prefers_diverse_documents():
+    docs = [
+        {"id": 1, "vector": [1.0, 0.0]},
+        {"id": 2, "vector": [0.999, 0.0447]},
+        {"id": 3, "vector": [0.6, 0.8]},
+    ]
+    for doc in docs:
+        doc["vector"] = list(np.asarray(doc["vector"]) / np.linalg.norm(doc["vector"]))
+    selected = mmr_select([1.0, 0.0], docs, k=2, lambda_mult=0.3)
+    assert [doc["id"] for doc in selected] == [1, 3]
+    assert mmr_select([1.0, 0.0], docs, k=0) == []
+
+
+def test_merge_overlaps_joins_adjacent_chunks():
+    first = "甲" * 100 + "重叠部分" * 15
+    second = "重叠部分" * 15 + "乙" * 100
+    docs = [
+        {"content": second, "similarity": 0.9, "metadata": {"source": "a.txt", "chunk": 1}},
+        {"content": first, "similarity": 0.5, "metadata": {"source": "a.txt", "chunk": 0}},
+        {"content": "无关", "similarity": 0.7, "metadata": {"source": "b.txt", "chunk": 0}},
+    ]
+    merged = merge_overlaps(docs)
+    assert merged[0]["content"] == "甲" * 100 + "重叠部分" * 15 + "乙" * 100
+    assert merged[0]["similarity"] == 0.9
+    assert [doc["content"] for doc in merged[1:]] == ["无关"]
@@ -0,0 +1,83 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from mcpserver.period_rollup import PeriodRollup, build_rollup_tables
+from mcpserver.periods import MONTH, QUARTER, YEAR, compare_values, parse_period
+from mcpserver.sales_mirror import LocalSalesMirror
+from test_sales_mirror import _Supabase
+
+
+@pytest.mark.parametrize("label,expected", [
+    ("2024", (YEAR, "2024", date(2024, 1, 1), date(2024, 12, 31))),
+    ("2024年", (YEAR, "2024", date(2024, 1, 1), date(2024, 12, 31))),
+    ("2024-03", (MONTH, "2024-03", date(2024, 3, 1), date(2024, 3, 31))),
+    ("2024/2", (MONTH, "2024-02", date(2024, 2, 1), date(2024, 2, 29))),
+    ("2023年2月", (MONTH, "2023-02", date(2023, 2, 1), date(2023, 2, 28))),
+    ("Q1 2024", (QUARTER, "2024Q1", date(2024, 1, 1), date(2024, 3, 31))),
+    ("2024Q4", (QUARTER, "2024Q4", date(2024, 10, 1), date(2024, 12, 31))),
+    ("2024-q2", (QUARTER, "2024Q2", date(2024, 4, 1), date(2024, 6, 30))),
+    ("2024年第3季度", (QUARTER, "2024Q3", date(2024, 7, 1), date(2024, 9, 30))),
+    (" 2024年1季 ", (QUARTER, "2024Q1", date(2024, 1, 1), date(2024, 3, 31))),
+])
+def test_parse_period(label, expected):
+    assert parse_period(label) == expected
+
+
+@pytest.mark.parametrize("label", ["2024-13", "2024-00", "Q5 2024", "last year", "", "24"])
+def test_parse_period_rejects_invalid(label):
+    assert parse_period(label) is None
+
+
+def test_compare_values():
+    result = compare_values(["2024Q1", "2024Q2", "2024Q3"], [100.0, 120.0, None])
+    assert result["comparisons"][0] == {"from": "2024Q1", "to": "2024Q2", "change": 20.0, "change_pct": 20.0}
+    assert result["comparisons"][1]["note"] == "missing data"
+    trend = compare_values(["a", "b", "c"], [3.0, 2.0, 1.0], "trend")["trend"]
+    assert trend == {"slope_per_period": -1.0, "direction": "down"}
+
+
+def test_rollup_sums_months_into_quarters_and_years():
+    sales = [{"month": f"2024-{m:02d}", "sales_amount": 10.0 * m, "order_count": m} for m in range(1, 13)]
+    income = pd.DataFrame({"日期": ["2024年1月", "2024年2月", "2024年4月"],
+                           "营业收入": [100, 200, 400], "净利润": [10, 20, 0]})
+    rollup = PeriodRollup()
+    rollup.rebuild("v1", sales, income)
+    assert rollup.is_current("v1") and not rollup.is_current("v2")
+
+    periods = [parse_period(label)[:2] for label in ("2024-02", "2024Q1", "2024", "2025Q1")]
+    assert rollup.values_for("sales_amount", periods) == [20.0, 60.0, 780.0, None]
+    assert rollup.values_for("revenue", periods[:3]) == [200.0, 300.0, 700.0]
+    # 比率在汇总之后计算，不是各月比率之和
+    assert rollup.values_for("net_margin", [(QUARTER, "2024Q1")]) == [pytest.approx(0.1)]
+    assert rollup.values_for("average_order_value", [(YEAR, "2024")]) == [10.0]
+    assert list(rollup.series("sales_amount", QUARTER, end_key="2024Q3", count=2)) == ["2024Q2", "2024Q3"]
+
+
+def test_rollup_resolve_metric_falls_back_to_sales():
+    rollup = PeriodRollup()
+    rollup.replace("v", build_rollup_tables([{"month": "2024-01", "sales_amount": 1.0, "order_count": 1}]))
+    assert rollup.resolve_metric("Compare revenue for Q1") == "sales_amount"
+    assert rollup.resolve_metric("客单价") == "average_order_value"
+    assert rollup.resolve_metric("净利润") is None
+
+
+def test_rollup_goes_stale_when_another_mirror_instance_syncs(tmp_path):
+    # 服务进程池中各进程各有一个镜像实例，共用同一个镜像文件
+    supabase = _Supabase()
+    supabase.add_order(1, "2024-01-05", 100.0)
+    db_path = str(tmp_path / "sales_mirror.db")
+    syncing = LocalSalesMirror(supabase, db_path=db_path)
+    serving = LocalSalesMirror(supabase, db_path=db_path)
+    syncing.ensure_fresh()
+
+    rollup = PeriodRollup()
+    rollup.rebuild(serving.data_version(), serving.monthly_totals())
+    assert rollup.is_current(serving.data_version())
+
+    supabase.add_order(2, "2024-01-20", 50.0)
+    syncing.ensure_fresh(force=True)
+    assert not rollup.is_current(serving.data_version())
+    rollup.rebuild(serving.data_version(), serving.monthly_totals())
+    assert rollup.values_for("sales_amount", [(MONTH, "2024-01")]) == [150.0]
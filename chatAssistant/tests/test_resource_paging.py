@@ -0,0 +1,120 @@
+import json
+
+import pandas as pd
+import pytest
+
+from mcpserver.resource_paging import (PageRequest, decode_cursor, encode_cursor, encode_page, encode_rows,
+                                       fetch_table_page, paginate_frame, parse_resource_uri)
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, rows):
+        self.rows = rows
+        self.selected = None
+        self._limit = None
+
+    def select(self, columns):
+        self.selected = columns
+        return self
+
+    def order(self, column):
+        self.rows = sorted(self.rows, key=lambda row: row[column])
+        return self
+
+    def gt(self, column, value):
+        self.rows = [row for row in self.rows if row[column] > value]
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def execute(self):
+        return _Response([dict(row) for row in self.rows[:self._limit]])
+
+
+class _Client:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def table(self, name):
+        query = _Query(self.rows)
+        self.queries.append(query)
+        return query
+
+
+def test_cursor_round_trip():
+    state = {"offset": 1500, "version": "123-4567", "after": "中文"}
+    cursor = encode_cursor(state)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == state
+
+
+@pytest.mark.parametrize("cursor", ["!!!", "bm90IGpzb24", "你好"])
+def test_decode_cursor_rejects_garbage(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_parse_resource_uri():
+    base, page = parse_resource_uri("financial://reports/balance-sheet?limit=20&columns=a,%20b&cursor=xyz")
+    assert base == "financial://reports/balance-sheet"
+    assert (page.limit, page.columns, page.cursor, page.paged) == (20, ["a", "b"], "xyz", True)
+
+    base, page = parse_resource_uri("financial://reports/balance-sheet")
+    assert base == "financial://reports/balance-sheet"
+    assert not page.paged and page.cursor is None and page.columns is None
+
+
+def test_page_request_clamps_limit():
+    assert PageRequest(limit=10 ** 9).limit == 5000
+    assert PageRequest(limit=0).paged is False
+
+
+def test_paginate_frame_walks_all_rows():
+    df = pd.DataFrame({"科目": [f"item{i}" for i in range(25)], "金额": range(25), "备注": ["x"] * 25})
+    seen, cursor = [], None
+    while True:
+        rows, cursor = paginate_frame(df, PageRequest(cursor=cursor, limit=10, columns=["科目", "金额"]), "v1")
+        assert list(rows.columns) == ["科目", "金额"]
+        seen.extend(rows["金额"])
+        if cursor is None:
+            break
+    assert seen == list(range(25))
+
+
+def test_paginate_frame_rejects_stale_cursor_and_unknown_columns():
+    df = pd.DataFrame({"a": range(5)})
+    _, cursor = paginate_frame(df, PageRequest(limit=2), "v1")
+    with pytest.raises(ValueError):
+        paginate_frame(df, PageRequest(cursor=cursor, limit=2), "v2")
+    with pytest.raises(ValueError):
+        paginate_frame(df, PageRequest(columns=["missing"]), "v1")
+
+
+def test_fetch_table_page_keyset_round_trip():
+    client = _Client([{"id": i, "content": f"doc{i}"} for i in range(1, 8)])
+    seen, cursor = [], None
+    while True:
+        rows, cursor = fetch_table_page(client, "testdoc", PageRequest(cursor=cursor, limit=3, columns=["content"]))
+        seen.extend(row["id"] for row in rows)
+        if cursor is None:
+            break
+    assert seen == list(range(1, 8))
+    assert client.queries[0].selected == "id,content"
+    with pytest.raises(ValueError):
+        fetch_table_page(client, "testdoc", PageRequest(columns=["content; drop table"]))
+
+
+def test_encode_rows_and_page():
+    df = pd.DataFrame({"a": range(7), "b": ["中文"] * 7})
+    assert json.loads(encode_rows(df, chunk_rows=3)) == df.to_dict(orient="records")
+    assert json.loads(encode_rows([], chunk_rows=3)) == []
+    page = json.loads(encode_page("rows", [{"id": 1}, {"id": 2}], {"next_cursor": None, "limit": 2}, chunk_rows=1))
+    assert page == {"next_cursor": None, "limit": 2, "rows": [{"id": 1}, {"id": 2}]}
@@ -0,0 +1,98 @@
+import threading
+import time
+
+from mcpserver.sales_mirror import LocalSalesMirror
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.orders = []
+        self._limit = None
+
+    def select(self, columns):
+        return self
+
+    def gte(self, column, value):
+        self.rows = [row for row in self.rows if str(row[column]) >= str(value)]
+        return self
+
+    def gt(self, column, value):
+        self.rows = [row for row in self.rows if row[column] > value]
+        return self
+
+    def order(self, column):
+        self.orders.append(column)
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def execute(self):
+        rows = sorted(self.rows, key=lambda row: tuple(str(row[c]) for c in self.orders))
+        return _Response([dict(row) for row in rows[:self._limit]])
+
+
+class _Supabase:
+    def __init__(self):
+        self.tables = {"sales_orders": [], "financial_data": []}
+        self.requests = 0
+
+    def table(self, name):
+        self.requests += 1
+        return _Query(self.tables[name])
+
+    def add_order(self, order_id, order_date, amount):
+        self.tables["sales_orders"].append({"id": order_id, "order_date": order_date,
+                                            "customer_name": f"c{order_id}", "total_amount": amount})
+
+
+def _mirror(supabase, tmp_path):
+    return LocalSalesMirror(supabase, db_path=str(tmp_path / "sales_mirror.db"), max_staleness=300)
+
+
+def test_other_instance_sees_new_version(tmp_path):
+    supabase = _Supabase()
+    supabase.add_order(1, "2024-01-05", 100.0)
+    writer, reader = _mirror(supabase, tmp_path), _mirror(supabase, tmp_path)
+    assert reader.data_version() is None
+    writer.ensure_fresh()
+    version = reader.data_version()
+    assert version is not None and reader.is_ready()
+
+    supabase.add_order(2, "2024-02-01", 50.0)
+    writer.ensure_fresh(force=True)
+    assert reader.data_version() != version
+    assert [row["month"] for row in reader.monthly_totals()] == ["2024-01", "2024-02"]
+
+
+def test_fresh_sync_from_other_instance_is_not_repeated(tmp_path):
+    supabase = _Supabase()
+    supabase.add_order(1, "2024-01-05", 100.0)
+    _mirror(supabase, tmp_path).ensure_fresh()
+    requests = supabase.requests
+    assert _mirror(supabase, tmp_path).ensure_fresh() == 0
+    assert supabase.requests == requests
+
+
+def test_syncs_are_serialized_across_instances(tmp_path):
+    supabase = _Supabase()
+    supabase.add_order(1, "2024-01-05", 100.0)
+    first, second = _mirror(supabase, tmp_path), _mirror(supabase, tmp_path)
+    result = {}
+    with first._process_lock():
+        waiter = threading.Thread(target=lambda: result.update(written=second.ensure_fresh(force=True)))
+        waiter.start()
+        time.sleep(0.2)
+        assert waiter.is_alive()
+        # 持锁方在此期间完成同步，等待者拿到锁后不再重复拉取
+        first.sync_table("sales_orders")
+        first.sync_table("financial_data")
+    waiter.join(5)
+    assert result == {"written": 0}
@@ -0,0 +1,72 @@
+import pytest
+
+from token_budget import estimate_tokens, pack_documents, truncate_to_tokens
+
+FIRST = "第一季度营业收入同比增长百分之十二。"
+SECOND = "营业成本随原材料价格上涨。"
+THIRD = "净利润率与去年同期持平！"
+TEXT = FIRST + SECOND + THIRD
+
+
+def test_text_within_budget_is_unchanged():
+    assert truncate_to_tokens(TEXT, estimate_tokens(TEXT)) == TEXT
+
+
+def test_truncates_at_sentence_boundary():
+    budget = estimate_tokens(FIRST + SECOND)
+    assert truncate_to_tokens(TEXT, budget) == FIRST + SECOND
+    assert truncate_to_tokens(TEXT, budget - 1) == FIRST
+
+
+def test_returns_empty_when_first_sentence_exceeds_budget():
+    assert truncate_to_tokens(TEXT, estimate_tokens(FIRST) - 1) == ""
+    assert truncate_to_tokens("没有句末标点的一整段文字" * 20, 5) == ""
+
+
+def test_pack_orders_by_similarity_and_stays_within_budget():
+    documents = [
+        {"content": "低相关。" * 20, "similarity": 0.4},
+        {"content": "高相关。" * 20, "similarity": 0.9},
+        {"content": "中相关。" * 20, "similarity": 0.6},
+    ]
+    budget = estimate_tokens("高相关。" * 20) + estimate_tokens("中相关。" * 10)
+    texts, report = pack_documents(documents, budget, min_truncated_tokens=1)
+    assert texts[0] == "高相关。" * 20
+    assert texts[1].startswith("中相关。") and len(texts) == 2
+    assert report["used"] == sum(estimate_tokens(text) for text in texts) <= budget
+    assert report == {"budget": budget, "used": report["used"], "documents": 3, "included": 2,
+                      "truncated": 1, "dropped": 1}
+
+
+def test_pack_skips_long_document_but_keeps_later_short_ones():
+    long_text = "没有句末标点的一整段很长的文字" * 30
+    short_text = "短文档。"
+    budget = estimate_tokens(short_text) * 3
+    texts, report = pack_documents([long_text, short_text], budget, min_truncated_tokens=1)
+    assert texts == [short_text]
+    assert (report["included"], report["dropped"], report["truncated"]) == (1, 1, 0)
+
+
+def test_pack_plain_texts_keep_order():
+    texts, report = pack_documents(["乙。", "甲。"], 1000)
+    assert texts == ["乙。", "甲。"]
+    assert report["dropped"] == 0 and report["used"] == estimate_tokens("乙。") + estimate_tokens("甲。")
+    assert pack_documents([], 100) == ([], {"budget": 100, "used": 0, "documents": 0, "included": 0,
+                                             "truncated": 0, "dropped": 0})
+
+
+def test_build_context_fills_trace(monkeypatch):
+    try:
+        import qwenRagQuery
+    except Exception as e:  # 模块导入时创建 Supabase/OpenAI 客户端，缺少依赖或配置时跳过
+        pytest.skip(f"qwenRagQuery 不可用: {e}")
+    monkeypatch.setitem(qwenRagQuery.config, "context_token_budget", {"default": estimate_tokens(FIRST)})
+    trace = {}
+    history = [{"role": "user", "content": "之前的问题"}]
+    messages = qwenRagQuery.build_context([{"content": FIRST, "similarity": 0.9},
+                                           {"content": SECOND, "similarity": 0.5}], history, "other", trace)
+    assert messages[:1] == history
+    assert messages[1] == {"role": "user", "content": [{"type": "text", "text": FIRST}]}
+    report = trace["context_budget"]
+    assert (report["intent"], report["included"], report["dropped"]) == ("other", 1, 1)
+    assert report["used"] <= report["budget"] and report["ms"] >= 0
@@ -0,0 +1,168 @@
+import json
+
+import pytest
+
+from vector_index import DocumentVectorIndex
+
+
+class _Response:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _Query:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self._count = False
+        self._limit = None
+
+    def select(self, columns, count=None):
+        self._count = count == "exact"
+        return self
+
+    def order(self, column):
+        self.rows.sort(key=lambda row: row[column])
+        return self
+
+    def gt(self, column, value):
+        self.rows = [row for row in self.rows if row[column] > value]
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def execute(self):
+        rows = self.rows[:self._limit] if self._limit else self.rows
+        return _Response([dict(row) for row in rows], len(self.rows) if self._count else None)
+
+
+class _Supabase:
+    def __init__(self):
+        self.rows = []
+
+    def table(self, name):
+        return _Query(self.rows)
+
+    def insert(self, doc_id, embedding=None):
+        self.rows.append({"id": doc_id, "content": f"doc{doc_id}", "metadata": {"chunk": doc_id},
+                          "embedding": json.dumps(embedding or [1.0, float(doc_id)])})
+
+    def delete(self, doc_id):
+        self.rows[:] = [row for row in self.rows if row["id"] != doc_id]
+
+
+def _ids(index):
+    return sorted(index._store.record(i)[0] for i in range(len(index)))
+
+
+@pytest.fixture(params=["memory", "file"])
+def index(request, tmp_path, monkeypatch):
+    supabase = _Supabase()
+    for doc_id in (1, 2, 3, 4):
+        supabase.insert(doc_id)
+    index_path = str(tmp_path / "testdoc.idx") if request.param == "file" else None
+    index = DocumentVectorIndex(supabase, index_path=index_path)
+    monkeypatch.setattr(DocumentVectorIndex, "PAGE_SIZE", 2)
+    index.load()
+    yield index
+    index.stop()
+
+
+def test_load_pages_all_rows(index):
+    assert index.ready
+    assert _ids(index) == [1, 2, 3, 4]
+
+
+def test_sync_appends_new_rows(index):
+    index.supabase.insert(5)
+    index.supabase.insert(6)
+    assert index.sync() == 2
+    assert _ids(index) == [1, 2, 3, 4, 5, 6]
+    assert index.sync() == 0
+
+
+def test_sync_reloads_after_delete_plus_insert(index):
+    # 删除与插入数量相同，只按行数判断会漏掉删除
+    index.supabase.delete(2)
+    index.supabase.insert(5)
+    index.sync()
+    assert _ids(index) == [1, 3, 4, 5]
+
+    index.supabase.delete(1)
+    index.supabase.delete(4)
+    index.supabase.insert(8)
+    index.sync()
+    assert _ids(index) == [3, 5, 8]
+
+
+def test_rows_without_embedding_are_skipped_but_counted(index):
+    index.supabase.rows.append({"id": 5, "content": "no vector", "metadata": {}, "embedding": None})
+    index.sync()
+    assert _ids(index) == [1, 2, 3, 4]
+    index.supabase.insert(6)
+    assert index.sync() == 1
+    assert _ids(index) == [1, 2, 3, 4, 6]
+
+
+def test_search_orders_by_cosine_similarity(index):
+    index.supabase.insert(9, [0.0, 1.0])
+    index.sync()
+    results = index.search([0.0, 1.0], top_k=2, threshold=0.0)
+    assert [doc["id"] for doc in results] == [9, 4]
+    assert results[0]["similarity"] == pytest.approx(1.0)
+    assert results[0]["metadata"] == {"chunk": 9}
+
+
+def _file_index(supabase, tmp_path, **kwargs):
+    return DocumentVectorIndex(supabase, index_path=str(tmp_path / "testdoc.idx"), **kwargs)
+
+
+def test_incremental_sync_appends_to_the_same_lineage(tmp_path):
+    supabase = _Supabase()
+    for doc_id in (1, 2, 3):
+        supabase.insert(doc_id)
+    writer = _file_index(supabase, tmp_path)
+    writer.load()
+    lineage, version = writer._store.lineage, writer._store.version
+
+    supabase.insert(4)
+    assert writer.sync() == 1
+    assert writer._store.lineage == lineage and writer._store.version != version
+    assert [writer._store.record(i) for i in range(4)][-1] == (4, "doc4", {"chunk": 4})
+    assert _ids(writer) == [1, 2, 3, 4]
+
+    supabase.delete(1)
+    supabase.insert(5)
+    writer.sync()
+    assert writer._store.lineage != lineage
+    assert _ids(writer) == [2, 3, 4, 5]
+
+
+def test_reader_extends_hnsw_graph_on_appended_versions(tmp_path):
+    pytest.importorskip("hnswlib")
+    supabase = _Supabase()
+    for doc_id in (1, 2, 3):
+        supabase.insert(doc_id)
+    writer = _file_index(supabase, tmp_path, hnsw_threshold=2)
+    writer.load()
+    reader = _file_index(None, tmp_path, hnsw_threshold=2)
+    reader._open_file()
+    graph = reader._hnsw
+    assert graph is not None and graph.get_current_count() == 3
+
+    supabase.insert(4, [0.0, 1.0])
+    writer.sync()
+    assert reader._store.is_stale()
+    reader._open_file()
+    # 同一谱系只追加新向量，图对象不变
+    assert reader._hnsw is graph and graph.get_current_count() == 4
+    assert reader.search([0.0, 1.0], top_k=1, threshold=0.0)[0]["id"] == 4
+
+    supabase.delete(4)
+    supabase.insert(5)
+    writer.sync()
+    reader._open_file()
+    assert reader._hnsw is not graph and reader._hnsw.get_current_count() == 4
+    assert _ids(reader) == [1, 2, 3, 5]
@@ -0,0 +1,91 @@
+"""
+token 估算与按预算截断
+
+装有 tiktoken 时用 cl100k_base 编码计数（与通义千问的BPE词表接近），否则按字符类别估算：
+中日韩字符每字计1个token，其余字符每4个计1个，通常略高于实际值，按预算装填不会超出。
+同一文档块会在多次查询中反复出现，估算结果按文本缓存。
+pack_documents 在预算内装填检索文档，供 qwenRagQuery.build_context 组装上下文。
+"""
+import math
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # 未安装或无法加载编码文件时使用估算
+    _encoding = None
+
+_CJK = re.compile(r"[　-〿㐀-鿿豈-﫿＀-￯]")
+# 句末标点及其后的右引号/右括号，截断只在这些位置之后进行
+_SENTENCE_END = re.compile(r"[。！？；!?;\n]+[”’」』）)\"']*")
+MIN_TRUNCATED_TOKENS = 32  # 截断后不足该长度的文档不再放入
+
+
+def _count(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+@lru_cache(maxsize=8192)
+def estimate_tokens(text: str) -> int:
+    return _count(text)
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """保留不超过 budget 个token的完整句子前缀；第一句就超出时返回空字符串"""
+    if estimate_tokens(text) <= budget:
+        return text
+    # 逐句累加，不对每个前缀重新计数
+    end = used = 0
+    for match in _SENTENCE_END.finditer(text):
+        used += _count(text[end:match.end()])
+        if used > budget:
+            break
+        end = match.end()
+    return text[:end].rstrip()
+
+
+def pack_documents(documents: list, budget: int,
+                   min_truncated_tokens: int = MIN_TRUNCATED_TOKENS) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    在 budget 个token内装填文档，返回 (放入的文本, 预算使用情况)
+    documents 可以是带 similarity 的文档字典（按相似度从高到低装填），也可以是纯文本列表（按原顺序装填）；
+    放不下的文档在句子边界处截断，截断后过短的跳过，后面更短的文档仍可放入
+    """
+    if documents and isinstance(documents[0], dict):
+        documents = sorted(documents, key=lambda doc: doc.get("similarity") or 0.0, reverse=True)
+        texts = [doc["content"] for doc in documents]
+    else:
+        texts = list(documents)
+
+    packed = []
+    used = 0
+    truncated = 0
+    for text in texts:
+        remaining = budget - used
+        tokens = estimate_tokens(text)
+        if tokens > remaining:
+            text = truncate_to_tokens(text, remaining)
+            tokens = estimate_tokens(text)
+            if tokens < min_truncated_tokens:
+                continue
+            truncated += 1
+        packed.append(text)
+        used += tokens
+        if used >= budget:
+            break
+
+    return packed, {
+        "budget": budget,
+        "used": used,
+        "documents": len(texts),
+        "included": len(packed),
+        "truncated": truncated,
+        "dropped": len(texts) - len(packed),
+    }
@@ -0,0 +1,292 @@
+"""
+testdoc 表的进程内向量索引
+
+启动时从 Supabase 全量加载（id、content、metadata、embedding），之后后台线程按 id 增量同步：
+拉取 id 大于上次最大 id 的新行，远端总行数不等于 上次行数 + 新行数 时（有删除，或删除与插入同时发生）
+整体重载；Supabase 仍是唯一数据源，索引只是只读副本。
+- 小语料：归一化的 float32 矩阵上做 NumPy 暴力检索（一次矩阵向量乘）
+- 大语料（>= hnsw_threshold 且安装了 hnswlib）：HNSW 近似检索
+相似度为余弦相似度，与 match_documents 的 1 - (embedding <=> query) 一致。
+设置 index_path 后数据保存在内存映射的索引文件中（见 vector_index_file），
+同一主机上的进程共享一份物理内存，启动时直接映射已有文件即可检索；
+只有持有 <index_path>.lock 文件锁的进程访问 Supabase 并发布新版本，其他进程只在文件更新后重新映射。
+增量同步在旧文件之后追加新行（谱系不变），各进程只把新增的行加入已有的 HNSW 图；
+只有全量重载（有行被删除）才会重建图。
+"""
+import json
+import os
+import sys
+import time
+from threading import Event, Lock, Thread
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from vector_index_file import MappedVectorIndex, append_index_file, write_index_file
+
+try:
+    import hnswlib
+except ImportError:  # 可选依赖，缺失时只使用暴力检索
+    hnswlib = None
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有文件锁，各进程各自同步
+    fcntl = None
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _parse_embedding(value) -> Optional[List[float]]:
+    # PostgREST 把 pgvector 列序列化为 "[0.1,0.2,...]" 字符串
+    if isinstance(value, str):
+        value = json.loads(value)
+    return value or None
+
+
+class _MemoryStore:
+    """未配置索引文件时的内存存储，接口与 MappedVectorIndex 一致"""
+
+    def __init__(self, ids: List[Any], contents: List[str], metadata: List[Dict[str, Any]], matrix: np.ndarray):
+        self.ids = ids
+        self.contents = contents
+        self.metadata = metadata
+        self.matrix = matrix
+
+    def __len__(self):
+        return len(self.ids)
+
+    def record(self, i: int) -> Tuple[Any, str, Dict[str, Any]]:
+        return self.ids[i], self.contents[i], self.metadata[i]
+
+    def is_stale(self) -> bool:
+        return False
+
+
+class DocumentVectorIndex:
+    """testdoc 的只读向量副本，检索在本进程内完成"""
+
+    PAGE_SIZE = 500
+
+    def __init__(self, supabase, table: str = "testdoc", sync_interval: float = 60,
+                 hnsw_threshold: int = 50000, index_path: str = None):
+        self.supabase = supabase
+        self.table = table
+        self.sync_interval = sync_interval
+        self.hnsw_threshold = hnsw_threshold
+        self.index_path = index_path
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self._store = _MemoryStore([], [], [], np.zeros((0, 0), dtype=np.float32))
+        self._hnsw = None
+        # 上次同步时远端的总行数（含没有嵌入的行）和最大 id，用于发现删除
+        self._remote_count: Optional[int] = None
+        self._max_id = None
+        self._lock_file = None
+        self.ready = False
+        self.last_sync = None
+
+    def __len__(self):
+        return len(self._store)
+
+    # ---------- 加载与同步 ----------
+
+    def start(self):
+        """先映射已有的索引文件（可立即检索），再在后台同步；两者都没有时 ready 为 False"""
+        if self.index_path and os.path.exists(self.index_path):
+            try:
+                self._open_file()
+            except Exception as e:
+                print(f"[向量索引] 索引文件不可用，改为从Supabase加载: {e}", file=sys.stderr)
+        if self._thread is None and self.supabase is not None:
+            self._thread = Thread(target=self._sync_loop, daemon=True, name="vector-index-sync")
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def is_writer(self) -> bool:
+        """是否由本进程访问 Supabase 并发布索引；未配置索引文件时每个进程各自同步"""
+        if not self.index_path or fcntl is None:
+            return True
+        if self._lock_file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+            lock_file = open(f"{self.index_path}.lock", "a+")
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            # 锁随进程退出释放，其他进程下一轮接管
+            self._lock_file = lock_file
+        return True
+
+    def _sync_loop(self):
+        while not self._stop.is_set():
+            try:
+                # 其他进程已发布新版本时先切换过去
+                if self._store.is_stale() or (not self.ready and self.index_path and os.path.exists(self.index_path)):
+                    self._open_file()
+                if self.is_writer():
+                    # 映射的文件不带远端行数，接管后先全量加载一次
+                    if self._remote_count is None:
+                        self.load()
+                    else:
+                        self.sync()
+            except Exception as e:
+                print(f"[向量索引] 同步失败: {e}", file=sys.stderr)
+            self._stop.wait(self.sync_interval)
+
+    def _fetch(self, after_id=None) -> List[Dict[str, Any]]:
+        rows = []
+        while True:
+            query = self.supabase.table(self.table).select("id, content, metadata, embedding").order("id")
+            if after_id is not None:
+                query = query.gt("id", after_id)
+            page = query.limit(self.PAGE_SIZE).execute().data
+            rows.extend(page)
+            if len(page) < self.PAGE_SIZE:
+                return rows
+            after_id = page[-1]["id"]
+
+    def load(self):
+        """全量加载"""
+        load_start = time.time()
+        rows = self._fetch()
+        ids, contents, metadata, vectors = self._unpack(rows)
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32)) if vectors else np.zeros((0, 0), dtype=np.float32)
+        self._publish(ids, contents, metadata, matrix)
+        self._remote_count = len(rows)
+        self._max_id = rows[-1]["id"] if rows else None
+        print(f"[向量索引] 已加载 {len(ids)} 个文档块，耗时 {time.time() - load_start:.2f}秒，"
+              f"检索方式: {'hnsw' if self._hnsw is not None else 'numpy'}", file=sys.stderr)
+
+    def sync(self) -> int:
+        """
+        追加 id 大于上次最大 id 的新行；远端行数与 上次行数 + 新行数 不一致时说明有行被删除，整体重载
+        先拉新行再计数：两次请求之间又有写入时同样不一致，只会多一次重载，不会漏掉删除
+        """
+        if self._remote_count is None:
+            self.load()
+            return 0
+        rows = self._fetch(after_id=self._max_id)
+        response = self.supabase.table(self.table).select("id", count="exact").limit(1).execute()
+        if response.count is None or response.count != self._remote_count + len(rows):
+            self.load()
+            return 0
+        self.last_sync = time.time()
+        if not rows:
+            return 0
+        self._remote_count += len(rows)
+        self._max_id = rows[-1]["id"]
+        ids, contents, metadata, vectors = self._unpack(rows)
+        if not ids:
+            return 0
+        store = self._store
+        added = _normalize(np.asarray(vectors, dtype=np.float32))
+        if isinstance(store, MappedVectorIndex) and len(store) and store.dim == added.shape[1]:
+            # 在当前映射的文件之后追加，旧行按段整块复制
+            append_index_file(self.index_path, store, time.time_ns(), ids, contents, metadata, added)
+            self._open_file()
+        else:
+            records = [store.record(i) for i in range(len(store))]
+            matrix = np.vstack([store.matrix, added]) if len(store) else added
+            self._publish([r[0] for r in records] + ids, [r[1] for r in records] + contents,
+                          [r[2] for r in records] + metadata, matrix, appended=added)
+        print(f"[向量索引] 增量同步 {len(ids)} 个文档块，共 {len(self)} 个", file=sys.stderr)
+        return len(ids)
+
+    @staticmethod
+    def _unpack(rows: List[Dict[str, Any]]):
+        ids, contents, metadata, vectors = [], [], [], []
+        for row in rows:
+            vector = _parse_embedding(row.get("embedding"))
+            if vector is None:
+                continue
+            ids.append(row["id"])
+            contents.append(row.get("content") or "")
+            metadata.append(row.get("metadata") or {})
+            vectors.append(vector)
+        return ids, contents, metadata, vectors
+
+    def _publish(self, ids, contents, metadata, matrix: np.ndarray, appended: np.ndarray = None):
+        """配置了索引文件时写入新版本并映射，否则直接放在内存中"""
+        if self.index_path:
+            write_index_file(self.index_path, time.time_ns(), ids, contents, metadata, matrix)
+            self._open_file(appended)
+        else:
+            self._swap(_MemoryStore(ids, contents, metadata, matrix), appended)
+
+    def _open_file(self, appended: np.ndarray = None):
+        store = MappedVectorIndex(self.index_path)
+        previous = self._store
+        if (appended is None and isinstance(previous, MappedVectorIndex) and previous.lineage == store.lineage
+                and len(previous) and len(previous) <= len(store)):
+            # 同一谱系的新版本只是在旧版本之后追加了行
+            appended = store.matrix[len(previous):]
+        self._swap(store, appended)
+        print(f"[向量索引] 已映射索引文件 {self.index_path}，版本 {store.version}，{len(store)} 个文档块",
+              file=sys.stderr)
+
+    def _swap(self, store, appended: np.ndarray = None):
+        """换入新存储；HNSW图在超过阈值时构建，增量同步时只追加新向量"""
+        count = len(store)
+        hnsw = self._hnsw
+        if hnswlib is not None and count >= self.hnsw_threshold:
+            if hnsw is None or appended is None or hnsw.get_current_count() != count - len(appended):
+                hnsw = hnswlib.Index(space="cosine", dim=store.matrix.shape[1])
+                hnsw.init_index(max_elements=count * 2, ef_construction=200, M=16)
+                hnsw.add_items(store.matrix, np.arange(count))
+                hnsw.set_ef(64)
+            elif len(appended):
+                if hnsw.get_max_elements() < count:
+                    hnsw.resize_index(count * 2)
+                hnsw.add_items(appended, np.arange(count - len(appended), count))
+        else:
+            hnsw = None
+        # 旧存储不主动关闭：进行中的检索可能仍持有其矩阵视图，映射在最后一个引用释放后由垃圾回收关闭
+        with self._lock:
+            self._store = store
+            self._hnsw = hnsw
+            self.ready = True
+            self.last_sync = time.time()
+
+    # ---------- 检索 ----------
+
+    def search(self, query_embedding: List[float], top_k: int = 5, threshold: float = 0.3,
+               include_vectors: bool = False) -> List[Dict[str, Any]]:
+        """
+        返回相似度大于 threshold 的前 top_k 个文档，按相似度降序
+        include_vectors 为 True 时附带归一化后的文档向量（"vector"），供MMR去冗余使用
+        """
+        with self._lock:
+            store, hnsw = self._store, self._hnsw
+        if not len(store):
+            return []
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        k = min(top_k, len(store))
+        if hnsw is not None:
+            labels, distances = hnsw.knn_query(query, k=k)
+            positions, similarities = labels[0], 1.0 - distances[0]
+        else:
+            scores = store.matrix @ query
+            positions = np.argpartition(-scores, k - 1)[:k]
+            positions = positions[np.argsort(-scores[positions])]
+            similarities = scores[positions]
+        results = []
+        for position, similarity in zip(positions, similarities):
+            if similarity > threshold:
+                doc_id, content, metadata = store.record(int(position))
+                result = {"id": doc_id, "content": content, "metadata": metadata, "similarity": float(similarity)}
+                if include_vectors:
+                    result["vector"] = np.array(store.matrix[int(position)])
+                results.append(result)
+        return results
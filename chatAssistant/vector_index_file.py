@@ -0,0 +1,162 @@
+"""
+向量索引文件：同一主机上的多个进程只读内存映射同一份数据
+
+文件布局（小端，各段按64字节对齐）:
+    头部   magic "VIDX", 格式版本, 索引版本, 行数, 维度, 各段偏移和长度, 谱系
+    向量段  float32[count][dim]，已归一化
+    内容偏移表 uint64[count + 1]，内容段中第 i 行的字节范围为 [offsets[i], offsets[i+1])
+    元数据偏移表 uint64[count + 1]
+    内容段  UTF-8 文本
+    元数据段 每行一个 JSON: {"id": ..., "metadata": {...}}
+新版本先写入同目录临时文件再原子 rename，已映射旧文件的进程不受影响，下次检查时切换到新版本。
+谱系（lineage）是最近一次全量写入的版本号；增量同步用 append_index_file 在旧文件的各段之后追加新行，
+谱系不变，已映射旧版本的进程据此只把新增的行加入 HNSW 图，不必重建。
+"""
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+MAGIC = b"VIDX"
+FORMAT_VERSION = 2
+_HEADER = struct.Struct("<4sIQQIIQQQQQQQ")
+_ALIGN = 64
+
+
+def _pad(size: int) -> int:
+    return (-size) % _ALIGN
+
+
+def _blobs(ids: List[Any], contents: List[str], metadata: List[Dict[str, Any]]):
+    content_blobs = [c.encode("utf-8") for c in contents]
+    meta_blobs = [json.dumps({"id": i, "metadata": m}, ensure_ascii=False, default=str).encode("utf-8")
+                  for i, m in zip(ids, metadata)]
+    return content_blobs, meta_blobs
+
+
+def _offsets(start: int, blobs: List[bytes]) -> np.ndarray:
+    offsets = np.full(len(blobs), start, dtype="<u8")
+    if blobs:
+        offsets += np.cumsum([len(b) for b in blobs], dtype="<u8")
+    return offsets
+
+
+def _write(path: str, version: int, lineage: int, count: int, dim: int, matrices: Sequence,
+           content_offsets: np.ndarray, meta_offsets: np.ndarray, content_parts: Sequence, meta_parts: Sequence):
+    """按文件布局写入临时文件后原子替换 path；各段可由多个片段（bytes 或 memoryview）组成"""
+    matrix_offset = _HEADER.size + _pad(_HEADER.size)
+    matrix_bytes = count * dim * 4
+    content_table = matrix_offset + matrix_bytes + _pad(matrix_bytes)
+    meta_table = content_table + (count + 1) * 8
+    content_offset = meta_table + (count + 1) * 8
+    meta_offset = content_offset + int(content_offsets[-1])
+    meta_size = int(meta_offsets[-1])
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, version, count, dim, 0,
+                             matrix_offset, content_table, meta_table, content_offset, meta_offset, meta_size, lineage))
+        f.write(b"\0" * _pad(_HEADER.size))
+        for matrix in matrices:
+            f.write(np.ascontiguousarray(matrix, dtype="<f4").tobytes())
+        f.write(b"\0" * _pad(matrix_bytes))
+        f.write(content_offsets.tobytes())
+        f.write(meta_offsets.tobytes())
+        for part in content_parts:
+            f.write(part)
+        for part in meta_parts:
+            f.write(part)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_index_file(path: str, version: int, ids: List[Any], contents: List[str],
+                     metadata: List[Dict[str, Any]], matrix: np.ndarray):
+    """全量写入新版本并原子替换 path，谱系为本次版本号"""
+    count = len(ids)
+    dim = int(matrix.shape[1]) if count else 0
+    content_blobs, meta_blobs = _blobs(ids, contents, metadata)
+    content_offsets = np.concatenate([np.zeros(1, dtype="<u8"), _offsets(0, content_blobs)])
+    meta_offsets = np.concatenate([np.zeros(1, dtype="<u8"), _offsets(0, meta_blobs)])
+    _write(path, version, version, count, dim, [matrix] if count else [],
+           content_offsets, meta_offsets, content_blobs, meta_blobs)
+
+
+def append_index_file(path: str, base: "MappedVectorIndex", version: int, ids: List[Any], contents: List[str],
+                      metadata: List[Dict[str, Any]], matrix: np.ndarray):
+    """
+    在已映射的 base 之后追加新行，写入新版本并原子替换 path，谱系沿用 base
+    旧行的向量、内容和元数据按段整块复制，不逐行解码再编码
+    """
+    content_blobs, meta_blobs = _blobs(ids, contents, metadata)
+    content_offsets = np.concatenate([base._content_offsets, _offsets(int(base._content_offsets[-1]), content_blobs)])
+    meta_offsets = np.concatenate([base._meta_offsets, _offsets(int(base._meta_offsets[-1]), meta_blobs)])
+    with memoryview(base._mmap) as view:
+        old_content = view[base._content_offset:base._content_offset + int(base._content_offsets[-1])]
+        old_meta = view[base._meta_offset:base._meta_offset + int(base._meta_offsets[-1])]
+        try:
+            _write(path, version, base.lineage, base.count + len(ids), base.dim, [base.matrix, matrix],
+                   content_offsets, meta_offsets, [old_content] + content_blobs, [old_meta] + meta_blobs)
+        finally:
+            old_content.release()
+            old_meta.release()
+
+
+def file_identity(path: str) -> Tuple[int, int]:
+    """(inode, mtime_ns)，原子替换后会变化"""
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns
+
+
+class MappedVectorIndex:
+    """只读映射的索引文件；向量矩阵是映射内存上的零拷贝视图"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.identity = file_identity(path)
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, format_version, self.version, self.count, self.dim, _, matrix_offset,
+         content_table, meta_table, self._content_offset, self._meta_offset, _,
+         self.lineage) = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"不支持的索引文件: {path}")
+        self.matrix = np.frombuffer(self._mmap, dtype="<f4", count=self.count * self.dim,
+                                    offset=matrix_offset).reshape(self.count, self.dim)
+        self._content_offsets = np.frombuffer(self._mmap, dtype="<u8", count=self.count + 1, offset=content_table)
+        self._meta_offsets = np.frombuffer(self._mmap, dtype="<u8", count=self.count + 1, offset=meta_table)
+
+    def __len__(self):
+        return self.count
+
+    def content(self, i: int) -> str:
+        start = self._content_offset + int(self._content_offsets[i])
+        end = self._content_offset + int(self._content_offsets[i + 1])
+        return self._mmap[start:end].decode("utf-8")
+
+    def meta(self, i: int) -> Dict[str, Any]:
+        start = self._meta_offset + int(self._meta_offsets[i])
+        end = self._meta_offset + int(self._meta_offsets[i + 1])
+        return json.loads(self._mmap[start:end])
+
+    def record(self, i: int) -> Tuple[Any, str, Dict[str, Any]]:
+        meta = self.meta(i)
+        return meta["id"], self.content(i), meta["metadata"]
+
+    def is_stale(self) -> bool:
+        """磁盘上的文件已被新版本替换"""
+        try:
+            return file_identity(self.path) != self.identity
+        except OSError:
+            return False
+
+    def close(self):
+        """释放本对象持有的视图后关闭映射；调用方不能再持有 matrix 等视图"""
+        self.matrix = self._content_offsets = self._meta_offsets = None
+        self._mmap.close()